@@ -0,0 +1,99 @@
+import itertools
+import logging
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator
+
+logger = logging.getLogger("image_service")
+
+# Lists the files that could not be fetched, at the end of the archive.
+ERRORS_FILE_NAME = "errors.txt"
+
+
+class _ZipStream:
+    """Write-only file object holding what ZipFile wrote since the last take.
+
+    Having no seek or tell, it makes ZipFile write data descriptors instead of
+    going back to patch local headers, so the archive can be sent as it grows.
+    """
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _fetch(fetch: Callable[[], bytes], attempts: int, retry_delay: float) -> bytes:
+    """Calls ``fetch`` up to ``attempts`` times, waiting ``retry_delay`` seconds
+    and twice as long after each failed attempt."""
+    for attempt in range(1, attempts):
+        try:
+            return fetch()
+        except Exception as error:
+            logger.warning(f"Archive fetch attempt {attempt} failed: {error!r}")
+            time.sleep(retry_delay * 2 ** (attempt - 1))
+    return fetch()
+
+
+def iter_zip(
+    entries: Iterable[tuple[str, Callable[[], bytes]]],
+    concurrency: int = 8,
+    attempts: int = 3,
+    retry_delay: float = 0.5,
+) -> Iterator[bytes]:
+    """Yields a ZIP archive of ``entries`` (archive name, fetch function).
+
+    Up to ``concurrency`` files are fetched ahead on worker threads, and each
+    is stored in the archive as soon as it arrives, so at most that many
+    files are held in memory whatever the size of the archive. Images are
+    already compressed, so they are stored without deflating them again.
+
+    The response has started by the time a fetch fails, so a file that still
+    cannot be fetched after ``attempts`` tries is left out and listed with its
+    error in an ``errors.txt`` entry, rather than truncating the archive.
+    """
+    stream = _ZipStream()
+    entries = iter(entries)
+    date_time = time.localtime()[:6]
+    executor = ThreadPoolExecutor(concurrency, thread_name_prefix="zip_prefetch")
+    pending: dict[Future, str] = {}
+    errors: list[str] = []
+
+    def prefetch(count: int) -> None:
+        for name, fetch in itertools.islice(entries, count):
+            pending[executor.submit(_fetch, fetch, attempts, retry_delay)] = name
+
+    try:
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as archive:
+            prefetch(concurrency)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        content = future.result()
+                    except Exception as error:
+                        logger.error(f"Could not add {name} to the archive: {error!r}")
+                        errors.append(f"{name}: {error!r}\n")
+                    else:
+                        archive.writestr(zipfile.ZipInfo(name, date_time), content)
+                    prefetch(1)
+                    yield stream.take()
+            if errors:
+                archive.writestr(
+                    zipfile.ZipInfo(ERRORS_FILE_NAME, date_time), "".join(errors)
+                )
+        yield stream.take()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
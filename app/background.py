@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+Job = Callable[[], Awaitable[None]]
+FailureCallback = Callable[[Exception], Awaitable[None]]
+
+
+class BackgroundQueueFullError(Exception):
+    pass
+
+
+class BackgroundQueue:
+    """Runs jobs on ``workers`` tasks of the event loop.
+
+    A slot is reserved before the work a job needs is persisted and the job is
+    submitted afterwards, so at most ``queue_size`` jobs are ever reserved,
+    queued or running; further reservations raise BackgroundQueueFullError. A
+    job that raises is attempted up to ``max_attempts`` times, waiting
+    ``retry_delay`` seconds and twice as long after each attempt; when the
+    last attempt fails its ``on_failure`` callback gets the error.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        queue_size: int = 256,
+        max_attempts: int = 3,
+        retry_delay: float = 1.0,
+    ):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.pending = 0
+        self.queue: asyncio.Queue[tuple[Job, FailureCallback]] | None = None
+        self.tasks: list[asyncio.Task] = []
+        self.logger = logging.getLogger("image_service")
+
+    def start(self) -> None:
+        """Starts the workers; must be called on the running event loop."""
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def reserve(self) -> None:
+        if self.pending >= self.queue_size:
+            raise BackgroundQueueFullError(
+                f"{self.pending} background jobs are already queued"
+            )
+        self.pending += 1
+
+    def release(self) -> None:
+        self.pending -= 1
+
+    def submit(self, job: Job, on_failure: FailureCallback) -> None:
+        """Queues a job in a slot taken with reserve."""
+        self.queue.put_nowait((job, on_failure))
+
+    async def _work(self) -> None:
+        while True:
+            job, on_failure = await self.queue.get()
+            try:
+                await self._run(job, on_failure)
+            finally:
+                self.release()
+                self.queue.task_done()
+
+    async def _run(self, job: Job, on_failure: FailureCallback) -> None:
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await job()
+                return
+            except Exception as error:
+                if attempt == self.max_attempts:
+                    try:
+                        await on_failure(error)
+                    except Exception as callback_error:
+                        self.logger.error(
+                            f"Background job failure callback failed: "
+                            f"{callback_error!r}"
+                        )
+                    return
+                self.logger.warning(
+                    f"Background job attempt {attempt} failed, retrying: {error!r}"
+                )
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from app.background import BackgroundQueue
+from app.cache import TTLCache
+from app.file_system import (
+    AzureFileSystem,
+    DiskCachedFileSystem,
+    FileSystem,
+    LocalFileSystem,
+)
+from app.handlers import (
+    BackgroundUploadHandler,
+    BatchUploadHandler,
+    BulkDeleteHandler,
+    ExportHandler,
+    DownloadHandler,
+    UploadHandler,
+    DeleteHandler,
+    MetadataHandler,
+    StatusHandler,
+)
+from app import metrics
+from app.http_client import (
+    HttpClient,
+    AuthenticationHttpClient,
+    CachedAuthenticationHttpClient,
+)
+from app.repositories import AsyncImageRepository
+from app.settings import Settings
+from app.transforms import ImageTransformer, supported_formats
+from app.usecases import (
+    ImageBackgroundUploadUseCase,
+    ImageBatchUploadUseCase,
+    ImageBulkDeleteUseCase,
+    ImageExportUseCase,
+    ImageUploadUseCase,
+    ImageDeleteUseCase,
+    ImageDownloadUseCase,
+    ImageMetadataUseCase,
+    ImageStatusUseCase,
+)
+
+
+def create_mongo_client(settings: Settings) -> MongoClient:
+    mongo_client = MongoClient(
+        settings.mongo_uri,
+        maxPoolSize=settings.mongo_max_pool_size,
+        minPoolSize=settings.mongo_min_pool_size,
+        maxIdleTimeMS=settings.mongo_max_idle_time_ms,
+        connectTimeoutMS=settings.mongo_connect_timeout_ms,
+        serverSelectionTimeoutMS=settings.mongo_server_selection_timeout_ms,
+        socketTimeoutMS=settings.mongo_socket_timeout_ms,
+        waitQueueTimeoutMS=settings.mongo_wait_queue_timeout_ms,
+    )
+    try:
+        # Runs server discovery and opens the first pooled connection so the
+        # first request does not pay for it.
+        mongo_client.admin.command("ping")
+    except PyMongoError as error:
+        logging.getLogger(settings.logger_name).warning(
+            f"MongoDB warm-up failed, connecting lazily: {error}"
+        )
+    return mongo_client
+
+
+def create_image_transformer(settings: Settings) -> ImageTransformer:
+    return ImageTransformer(
+        settings.image_transform_mode,
+        settings.image_transform_workers,
+        settings.image_transform_queue_size,
+    )
+
+
+def create_file_system(settings: Settings) -> FileSystem:
+    if settings.storage_backend == "local":
+        return LocalFileSystem(settings.local_storage_dir)
+    if settings.storage_backend != "azure":
+        raise ValueError(f"Unknown storage backend {settings.storage_backend}")
+    file_system = AzureFileSystem(
+        settings.azure_account_name,
+        settings.azure_account_key,
+        settings.azure_share_name,
+        settings.azure_download_chunk_size,
+    )
+    if settings.file_cache_dir:
+        return DiskCachedFileSystem(
+            file_system, settings.file_cache_dir, settings.file_cache_max_bytes
+        )
+    return file_system
+
+
+def create_http_client(settings: Settings) -> HttpClient:
+    return CachedAuthenticationHttpClient(
+        AuthenticationHttpClient(
+            settings.authentication_url,
+            settings.authentication_pool_size,
+            settings.authentication_timeout,
+        ),
+        TTLCache(settings.authentication_cache_size, settings.authentication_cache_ttl),
+        settings.authentication_negative_cache_ttl,
+    )
+
+
+class Container:
+    """Owns the long-lived clients and the handlers built on top of them.
+
+    One container is created per process on application startup; request
+    dependencies only look handlers up on it.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.logger = logging.getLogger(settings.logger_name)
+        self.mongo_client = create_mongo_client(settings)
+        self.file_system = create_file_system(settings)
+        self.image_transformer = create_image_transformer(settings)
+        self.http_client = create_http_client(settings)
+        self.upload_queue = BackgroundQueue(
+            settings.background_upload_workers,
+            settings.background_upload_queue_size,
+            settings.background_upload_max_attempts,
+            settings.background_upload_retry_delay,
+        )
+        self.recovery_task: asyncio.Task | None = None
+        self.repository = AsyncImageRepository(
+            self.mongo_client,
+            settings.mongo_db_name,
+            settings.mongo_collection,
+            settings.mongo_blob_collection,
+        )
+
+        self.upload_use_case = ImageUploadUseCase(
+            self.repository,
+            self.file_system,
+            self.image_transformer,
+            settings.image_rendition_sizes,
+            settings.image_keep_original,
+            settings.image_max_pixels,
+            settings.image_deduplication,
+        )
+        self.batch_upload_use_case = ImageBatchUploadUseCase(
+            self.repository,
+            self.file_system,
+            self.image_transformer,
+            settings.image_rendition_sizes,
+            settings.image_keep_original,
+            settings.image_max_pixels,
+            settings.image_deduplication,
+        )
+        self.background_upload_use_case = ImageBackgroundUploadUseCase(
+            self.repository,
+            self.file_system,
+            self.image_transformer,
+            self.upload_queue,
+            settings.image_rendition_sizes,
+            settings.image_keep_original,
+            settings.image_max_pixels,
+            settings.image_deduplication,
+        )
+        self.status_use_case = ImageStatusUseCase(self.repository, self.file_system)
+        self.delete_use_case = ImageDeleteUseCase(self.repository, self.file_system)
+        self.bulk_delete_use_case = ImageBulkDeleteUseCase(
+            self.repository, self.file_system, settings.delete_concurrency
+        )
+        self.download_use_case = ImageDownloadUseCase(
+            self.repository,
+            self.file_system,
+            self.image_transformer,
+            supported_formats(settings.image_variant_formats),
+            settings.image_variant_quality,
+        )
+        self.export_use_case = ImageExportUseCase(
+            self.repository, self.file_system, settings.export_concurrency
+        )
+        self.metadata_use_case = ImageMetadataUseCase(self.repository, self.file_system)
+
+        self.upload_handler = UploadHandler(self.upload_use_case, self.http_client)
+        self.batch_upload_handler = BatchUploadHandler(
+            self.batch_upload_use_case,
+            self.http_client,
+            settings.upload_batch_max_files,
+        )
+        self.background_upload_handler = BackgroundUploadHandler(
+            self.background_upload_use_case, self.http_client
+        )
+        self.status_handler = StatusHandler(self.status_use_case)
+        self.delete_handler = DeleteHandler(self.delete_use_case)
+        self.bulk_delete_handler = BulkDeleteHandler(self.bulk_delete_use_case)
+        self.download_handler = DownloadHandler(
+            self.download_use_case, settings.download_cache_control
+        )
+        self.export_handler = ExportHandler(self.export_use_case)
+        self.metadata_handler = MetadataHandler(self.metadata_use_case)
+        self._track_metrics()
+
+    def _track_metrics(self) -> None:
+        """Exposes the queues and caches of this container as metrics."""
+        metrics.IN_PROGRESS.labels("image_transform").set_function(
+            lambda: self.image_transformer.pending
+        )
+        metrics.IN_PROGRESS.labels("background_upload").set_function(
+            lambda: self.upload_queue.pending
+        )
+        if isinstance(self.http_client, CachedAuthenticationHttpClient):
+            metrics.track_cache("authentication", self.http_client.cache)
+        file_system = self.file_system
+        if isinstance(file_system, DiskCachedFileSystem):
+            metrics.track_cache("file", file_system)
+            file_system = file_system.file_system
+        if isinstance(file_system, AzureFileSystem):
+            metrics.track_cache("azure_directory", file_system.known_directories)
+
+    def ensure_indexes(self) -> None:
+        try:
+            self.repository.repository.ensure_indexes()
+        except PyMongoError as error:
+            self.logger.warning(f"Could not create MongoDB indexes: {error}")
+
+    def start(self) -> None:
+        """Starts the background workers; called on the running event loop."""
+        self.upload_queue.start()
+        self.recovery_task = asyncio.create_task(
+            self.background_upload_use_case.recover(
+                self.settings.background_upload_recover_after
+            )
+        )
+
+    async def close(self) -> None:
+        if self.recovery_task is not None:
+            self.recovery_task.cancel()
+            await asyncio.gather(self.recovery_task, return_exceptions=True)
+        await self.upload_queue.stop()
+        self.http_client.close()
+        self.image_transformer.shutdown()
+        self.mongo_client.close()
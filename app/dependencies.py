@@ -1,97 +1,72 @@
-from fastapi import Depends
-from pymongo import MongoClient
-
-from app.file_system import AzureFileSystem
-from app.handlers import DownloadHandler, UploadHandler, DeleteHandler, MetadataHandler
-from app.http_client import HttpClient, AuthenticationHttpClient
-from app.repositories import ImageRepository
-from app.settings import get_settings
-from app.usecases import (
-    ImageUploadUseCase,
-    ImageDeleteUseCase,
-    ImageDownloadUseCase,
-    ImageMetadataUseCase,
+from fastapi import Depends, Query, Request
+
+from app.container import Container
+from app.handlers import (
+    BatchUploadHandler,
+    BulkDeleteHandler,
+    ExportHandler,
+    DownloadHandler,
+    UploadHandler,
+    DeleteHandler,
+    MetadataHandler,
+    StatusHandler,
 )
 
 
-async def get_mongo_client() -> MongoClient:
-    mongo_client = MongoClient(get_settings().mongo_uri)
-    try:
-        yield mongo_client
-    finally:
-        mongo_client.close()
+# Coroutines, so FastAPI resolves them on the event loop instead of
+# dispatching each one to the thread pool.
+async def get_container(request: Request) -> Container:
+    return request.app.state.container
 
 
-def get_azure_file_system() -> AzureFileSystem:
-    return AzureFileSystem(
-        get_settings().azure_account_name,
-        get_settings().azure_account_key,
-        get_settings().azure_share_name,
-    )
-
-
-async def get_repository(
-    mongo_client: MongoClient = Depends(get_mongo_client),
-) -> ImageRepository:
-    return ImageRepository(
-        mongo_client,
-        get_settings().mongo_db_name,
-        get_settings().mongo_collection,
-    )
-
-
-async def get_http_client() -> HttpClient:
-    return AuthenticationHttpClient(get_settings().authentication_url)
-
-
-async def get_upload_use_case(
-    repository: ImageRepository = Depends(get_repository),
-    file_system: AzureFileSystem = Depends(get_azure_file_system),
-) -> ImageUploadUseCase:
-    return ImageUploadUseCase(repository, file_system)
+async def get_upload_handler(
+    container: Container = Depends(get_container),
+    asynchronous: bool = Query(default=False, alias="async"),
+) -> UploadHandler:
+    # With ?async=true the upload is answered once it is stored and is
+    # processed in the background.
+    if asynchronous:
+        return container.background_upload_handler
+    return container.upload_handler
 
 
-async def get_delete_use_case(
-    repository: ImageRepository = Depends(get_repository),
-    file_system: AzureFileSystem = Depends(get_azure_file_system),
-) -> ImageDeleteUseCase:
-    return ImageDeleteUseCase(repository, file_system)
+async def get_status_handler(
+    container: Container = Depends(get_container),
+) -> StatusHandler:
+    return container.status_handler
 
 
-async def get_download_use_case(
-    repository: ImageRepository = Depends(get_repository),
-    file_system: AzureFileSystem = Depends(get_azure_file_system),
-) -> ImageDownloadUseCase:
-    return ImageDownloadUseCase(repository, file_system)
+async def get_batch_upload_handler(
+    container: Container = Depends(get_container),
+) -> BatchUploadHandler:
+    return container.batch_upload_handler
 
 
-async def get_client_metadata_use_case(
-    repository: ImageRepository = Depends(get_repository),
-    file_system: AzureFileSystem = Depends(get_azure_file_system),
-) -> ImageMetadataUseCase:
-    return ImageMetadataUseCase(repository, file_system)
+async def get_delete_handler(
+    container: Container = Depends(get_container),
+) -> DeleteHandler:
+    return container.delete_handler
 
 
-async def get_upload_handler(
-    use_case: ImageUploadUseCase = Depends(get_upload_use_case),
-    http_client: HttpClient = Depends(get_http_client),
-) -> UploadHandler:
-    return UploadHandler(use_case, http_client)
+async def get_bulk_delete_handler(
+    container: Container = Depends(get_container),
+) -> BulkDeleteHandler:
+    return container.bulk_delete_handler
 
 
-async def get_delete_handler(
-    use_case: ImageDeleteUseCase = Depends(get_delete_use_case),
-) -> DeleteHandler:
-    return DeleteHandler(use_case)
+async def get_export_handler(
+    container: Container = Depends(get_container),
+) -> ExportHandler:
+    return container.export_handler
 
 
 async def get_metadata_handler(
-    use_case: ImageMetadataUseCase = Depends(get_client_metadata_use_case),
+    container: Container = Depends(get_container),
 ) -> MetadataHandler:
-    return MetadataHandler(use_case)
+    return container.metadata_handler
 
 
 async def get_download_handler(
-    use_case: ImageDownloadUseCase = Depends(get_download_use_case),
+    container: Container = Depends(get_container),
 ) -> DownloadHandler:
-    return DownloadHandler(use_case)
+    return container.download_handler
@@ -1,49 +1,450 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import BinaryIO, Callable, Iterator, Protocol
 from uuid import UUID
 
 from azure.storage.file import ContentSettings
 from azure.storage.file import FileService
 
+from app.cache import TTLCache
+from app.metrics import STORAGE_BYTES, stage
 
-class AzureFileSystem:
-    def __init__(self, account_name: str, account_key: str, share_name: str):
+CREATE_DIRECTORIES_SECONDS = stage("azure_create_directories")
+CREATE_FILE_SECONDS = stage("azure_create_file")
+GET_FILE_SECONDS = stage("azure_get_file")
+GET_FILE_RANGE_SECONDS = stage("azure_get_file_range")
+GET_FILE_PROPERTIES_SECONDS = stage("azure_get_file_properties")
+DELETE_FILES_SECONDS = stage("azure_delete_files")
+BYTES_WRITTEN = STORAGE_BYTES.labels("written")
+BYTES_READ = STORAGE_BYTES.labels("read")
+
+
+@dataclass
+class StoredFile:
+    file_name: str
+    content_type: str
+    content_length: int
+    etag: str | None
+    last_modified: datetime | None
+    # Yields the bytes from start to end, both inclusive.
+    iter_range: Callable[[int, int], Iterator[bytes]]
+    # Set when the file is on local disk and can be sent as a FileResponse.
+    path: str | None = None
+    # Set when the content behind this etag never changes, so it may be cached
+    # for good.
+    immutable: bool = False
+
+
+def iter_local_file(
+    path: str, start: int, end: int, chunk_size: int = 64 * 1024
+) -> Iterator[bytes]:
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def write_atomically(path: str, chunks: Iterator[bytes]) -> None:
+    """Writes to a temporary file next to ``path`` and renames it into place,
+    so readers never see a partial file."""
+    descriptor, temporary_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def iter_content(
+    file_content: bytes | BinaryIO, chunk_size: int = 1024 * 1024
+) -> Iterator[bytes]:
+    if isinstance(file_content, bytes):
+        yield file_content
+        return
+    while chunk := file_content.read(chunk_size):
+        yield chunk
+
+
+class FileSystem(Protocol):
+    def upload_file(
+        self, file_name: str, file_content: bytes | BinaryIO, uuid: UUID, client_id: str
+    ) -> None:
+        ...
+
+    def upload_files(
+        self, files: dict[str, bytes | BinaryIO], uuid: UUID, client_id: str
+    ) -> None:
+        ...
+
+    def download_file(self, file_name: str, file_path: str) -> tuple[bytes, str]:
+        ...
+
+    def open_file(self, file_name: str, file_path: str) -> StoredFile:
+        ...
+
+    def delete_file(self, file_name: str, file_path: str) -> None:
+        ...
+
+    def delete_files(self, file_names: list[str], file_path: str) -> None:
+        ...
+
+
+class AzureFileSystem(FileSystem):
+    def __init__(
+        self,
+        account_name: str,
+        account_key: str,
+        share_name: str,
+        chunk_size: int = 1024 * 1024,
+    ):
         self.share_name = share_name
+        self.chunk_size = chunk_size
         self.file_service = FileService(
             account_name=account_name, account_key=account_key
         )
+        self.known_directories = TTLCache(max_size=100_000, ttl=3600)
 
     def _create_directories(self, client_id: str, uuid: str) -> None:
-        directories = self.file_service.list_directories_and_files(self.share_name)
-        if client_id not in [path.name for path in directories]:
-            self.file_service.create_directory(self.share_name, client_id)
-        self.file_service.create_directory(self.share_name, client_id + "/" + uuid)
+        # create_directory reports an existing directory instead of failing, so
+        # the client directory only needs one round trip the first time.
+        with CREATE_DIRECTORIES_SECONDS.time():
+            if not self.known_directories.get(client_id):
+                self.file_service.create_directory(
+                    self.share_name, client_id, fail_on_exist=False
+                )
+                self.known_directories.set(client_id, True)
+            self.file_service.create_directory(self.share_name, client_id + "/" + uuid)
+
+    def _create_file(
+        self, file_path: str, file_name: str, file_content: bytes | BinaryIO
+    ) -> None:
+        content_settings = ContentSettings(
+            content_type=f"image/{file_name.split('.')[-1]}"
+        )
+        if isinstance(file_content, bytes):
+            with CREATE_FILE_SECONDS.time():
+                self.file_service.create_file_from_bytes(
+                    share_name=self.share_name,
+                    directory_name=file_path,
+                    file_name=file_name,
+                    file=file_content,  # type: ignore
+                    content_settings=content_settings,
+                )
+            BYTES_WRITTEN.inc(len(file_content))
+            return
+        # Streams are uploaded chunk by chunk from their current position.
+        start = file_content.tell()
+        count = file_content.seek(0, os.SEEK_END) - start
+        file_content.seek(start)
+        with CREATE_FILE_SECONDS.time():
+            self.file_service.create_file_from_stream(
+                share_name=self.share_name,
+                directory_name=file_path,
+                file_name=file_name,
+                stream=file_content,
+                count=count,
+                content_settings=content_settings,
+            )
+        BYTES_WRITTEN.inc(count)
 
     def upload_file(
         self,
         file_name: str,
-        file_content: bytes,
+        file_content: bytes | BinaryIO,
         uuid: UUID,
         client_id: str,
+    ) -> None:
+        self.upload_files({file_name: file_content}, uuid, client_id)
+
+    def upload_files(
+        self, files: dict[str, bytes | BinaryIO], uuid: UUID, client_id: str
     ) -> None:
         self._create_directories(client_id, str(uuid))
         file_path = client_id + "/" + str(uuid)
-        self.file_service.create_file_from_bytes(
-            share_name=self.share_name,
-            directory_name=file_path,
+        for file_name, file_content in files.items():
+            self._create_file(file_path, file_name, file_content)
+
+    def download_file(self, file_name: str, file_path: str) -> tuple[bytes, str]:
+        with GET_FILE_SECONDS.time():
+            content = self.file_service.get_file_to_bytes(
+                self.share_name, file_path, file_name
+            ).content
+        BYTES_READ.inc(len(content))
+        return content, file_name.split(".")[-1]
+
+    def open_file(self, file_name: str, file_path: str) -> StoredFile:
+        with GET_FILE_PROPERTIES_SECONDS.time():
+            properties = self.file_service.get_file_properties(
+                self.share_name, file_path, file_name
+            ).properties
+        return StoredFile(
             file_name=file_name,
-            file=file_content,  # type: ignore
-            content_settings=ContentSettings(
-                content_type=f"image/{file_name.split('.')[-1]}"
+            content_type=properties.content_settings.content_type
+            or f"image/{file_name.split('.')[-1]}",
+            content_length=properties.content_length,
+            etag=properties.etag,
+            last_modified=properties.last_modified,
+            iter_range=lambda start, end: self.iter_file(
+                file_name, file_path, start, end
             ),
         )
 
+    def iter_file(
+        self, file_name: str, file_path: str, start: int, end: int
+    ) -> Iterator[bytes]:
+        for chunk_start in range(start, end + 1, self.chunk_size):
+            with GET_FILE_RANGE_SECONDS.time():
+                chunk = self.file_service.get_file_to_bytes(
+                    self.share_name,
+                    file_path,
+                    file_name,
+                    start_range=chunk_start,
+                    end_range=min(chunk_start + self.chunk_size, end + 1) - 1,
+                    max_connections=1,
+                ).content
+            BYTES_READ.inc(len(chunk))
+            yield chunk
+
+    def delete_file(self, file_name: str, file_path: str) -> None:
+        self.delete_files([file_name], file_path)
+
+    def delete_files(self, file_names: list[str], file_path: str) -> None:
+        with DELETE_FILES_SECONDS.time():
+            for file_name in file_names:
+                self.file_service.delete_file(self.share_name, file_path, file_name)
+            self.file_service.delete_directory(self.share_name, file_path)
+
+
+class DiskCachedFileSystem(FileSystem):
+    """Read-through LRU cache on local disk in front of a remote FileSystem.
+
+    Files are written to a temporary file and renamed into place, so readers
+    never see a partial entry. Each entry has a ``.json`` sidecar with the
+    remote properties, which lets the index be rebuilt after a restart.
+    """
+
+    def __init__(self, file_system: FileSystem, cache_dir: str, max_bytes: int):
+        self.file_system = file_system
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, StoredFile] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_entries()
+
+    @staticmethod
+    def _cache_key(file_name: str, file_path: str) -> str:
+        return hashlib.sha256(f"{file_path}/{file_name}".encode()).hexdigest()
+
+    def _data_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _local_file(self, key: str, metadata: dict) -> StoredFile:
+        path = self._data_path(key)
+        return StoredFile(
+            file_name=metadata["file_name"],
+            content_type=metadata["content_type"],
+            content_length=metadata["content_length"],
+            etag=metadata["etag"],
+            last_modified=datetime.fromisoformat(metadata["last_modified"])
+            if metadata["last_modified"]
+            else None,
+            iter_range=lambda start, end: iter_local_file(path, start, end),
+            path=path,
+        )
+
+    def _load_entries(self) -> None:
+        loaded = []
+        for name in os.listdir(self.cache_dir):
+            path = self._data_path(name)
+            if name.endswith(".json"):
+                if not os.path.exists(path[: -len(".json")]):
+                    os.remove(path)
+                continue
+            if name.endswith(".tmp") or not os.path.exists(path + ".json"):
+                os.remove(path)
+                continue
+            with open(path + ".json") as metadata_file:
+                metadata = json.load(metadata_file)
+            loaded.append((os.stat(path).st_atime, name, metadata))
+        for _, key, metadata in sorted(loaded):
+            self.entries[key] = self._local_file(key, metadata)
+            self.size += metadata["content_length"]
+        self._evict()
+
+    def _evict(self) -> None:
+        while self.size > self.max_bytes and self.entries:
+            key, stored_file = self.entries.popitem(last=False)
+            self.size -= stored_file.content_length
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        for path in (self._data_path(key), self._data_path(key) + ".json"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _store(self, key: str, remote_file: StoredFile) -> StoredFile:
+        metadata = {
+            "file_name": remote_file.file_name,
+            "content_type": remote_file.content_type,
+            "content_length": remote_file.content_length,
+            "etag": remote_file.etag,
+            "last_modified": remote_file.last_modified.isoformat()
+            if remote_file.last_modified
+            else None,
+        }
+        path = self._data_path(key)
+        write_atomically(
+            path, remote_file.iter_range(0, remote_file.content_length - 1)
+        )
+        write_atomically(path + ".json", iter([json.dumps(metadata).encode()]))
+        return self._local_file(key, metadata)
+
+    def _cached_file(self, key: str) -> StoredFile | None:
+        """The entry for ``key``, or None if there is none or its file is gone,
+        e.g. evicted by another process or removed by hand."""
+        with self.lock:
+            stored_file = self.entries.get(key)
+            if stored_file is not None and not os.path.exists(stored_file.path):
+                del self.entries[key]
+                self.size -= stored_file.content_length
+                self._remove(key)
+                stored_file = None
+            if stored_file is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return stored_file
+
+    def open_file(self, file_name: str, file_path: str) -> StoredFile:
+        key = self._cache_key(file_name, file_path)
+        stored_file = self._cached_file(key)
+        if stored_file is not None:
+            return stored_file
+        remote_file = self.file_system.open_file(file_name, file_path)
+        if remote_file.content_length > self.max_bytes:
+            return remote_file
+        stored_file = self._store(key, remote_file)
+        with self.lock:
+            if key not in self.entries:
+                self.size += stored_file.content_length
+            self.entries[key] = stored_file
+            self._evict()
+        return stored_file
+
+    def invalidate(self, file_name: str, file_path: str) -> None:
+        key = self._cache_key(file_name, file_path)
+        with self.lock:
+            stored_file = self.entries.pop(key, None)
+            if stored_file is not None:
+                self.size -= stored_file.content_length
+            self._remove(key)
+
+    def upload_file(
+        self, file_name: str, file_content: bytes | BinaryIO, uuid: UUID, client_id: str
+    ) -> None:
+        self.file_system.upload_file(file_name, file_content, uuid, client_id)
+
+    def upload_files(
+        self, files: dict[str, bytes | BinaryIO], uuid: UUID, client_id: str
+    ) -> None:
+        self.file_system.upload_files(files, uuid, client_id)
+
     def download_file(self, file_name: str, file_path: str) -> tuple[bytes, str]:
-        return (
-            self.file_service.get_file_to_bytes(
-                self.share_name, file_path, file_name
-            ).content,
-            file_name.split(".")[-1],
+        return self.file_system.download_file(file_name, file_path)
+
+    def delete_file(self, file_name: str, file_path: str) -> None:
+        self.invalidate(file_name, file_path)
+        self.file_system.delete_file(file_name, file_path)
+
+    def delete_files(self, file_names: list[str], file_path: str) -> None:
+        for file_name in file_names:
+            self.invalidate(file_name, file_path)
+        self.file_system.delete_files(file_names, file_path)
+
+
+class LocalFileSystem(FileSystem):
+    """Stores files under ``root_dir``, e.g. on a local disk or an NFS mount.
+
+    Files are written atomically and opened files carry their path, so
+    downloads are sent as a FileResponse straight from the page cache.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = os.path.realpath(root_dir)
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _path(self, file_path: str, file_name: str = "") -> str:
+        path = os.path.realpath(os.path.join(self.root_dir, file_path, file_name))
+        if os.path.commonpath([self.root_dir, path]) != self.root_dir:
+            raise ValueError(f"{file_path}/{file_name} is outside of the storage")
+        return path
+
+    def upload_file(
+        self, file_name: str, file_content: bytes | BinaryIO, uuid: UUID, client_id: str
+    ) -> None:
+        self.upload_files({file_name: file_content}, uuid, client_id)
+
+    def upload_files(
+        self, files: dict[str, bytes | BinaryIO], uuid: UUID, client_id: str
+    ) -> None:
+        directory = self._path(client_id + "/" + str(uuid))
+        os.makedirs(directory, exist_ok=True)
+        for file_name, file_content in files.items():
+            path = self._path(client_id + "/" + str(uuid), file_name)
+            if os.path.dirname(path) != directory:
+                raise ValueError(f"{file_name} is not a file name")
+            write_atomically(path, iter_content(file_content))
+
+    def download_file(self, file_name: str, file_path: str) -> tuple[bytes, str]:
+        with open(self._path(file_path, file_name), "rb") as file:
+            return file.read(), file_name.split(".")[-1]
+
+    def open_file(self, file_name: str, file_path: str) -> StoredFile:
+        path = self._path(file_path, file_name)
+        stat = os.stat(path)
+        return StoredFile(
+            file_name=file_name,
+            content_type=f"image/{file_name.split('.')[-1]}",
+            content_length=stat.st_size,
+            etag=f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            last_modified=datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            iter_range=lambda start, end: iter_local_file(path, start, end),
+            path=path,
         )
 
     def delete_file(self, file_name: str, file_path: str) -> None:
-        self.file_service.delete_file(self.share_name, file_path, file_name)
-        self.file_service.delete_directory(self.share_name, file_path)
+        self.delete_files([file_name], file_path)
+
+    def delete_files(self, file_names: list[str], file_path: str) -> None:
+        for file_name in file_names:
+            try:
+                os.remove(self._path(file_path, file_name))
+            except FileNotFoundError:
+                pass
+        try:
+            os.rmdir(self._path(file_path))
+        except FileNotFoundError:
+            pass
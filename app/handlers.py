@@ -1,54 +1,174 @@
+import logging
 from abc import ABC, abstractmethod
+from typing import Iterable, Iterator
 from uuid import UUID
 
 from fastapi import UploadFile
-from starlette.responses import Response, JSONResponse
+from PIL import UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import (
+    FileResponse,
+    JSONResponse,
+    Response,
+    StreamingResponse,
+)
 
+from app.background import BackgroundQueueFullError
+from app.file_system import StoredFile
 from app.http_client import HttpClient
-from app.schemas import ImageDocument
+from app.negotiation import accepted_image_formats
+from app.pagination import (
+    InvalidCursorError,
+    batched,
+    decode_cursor,
+    encode_cursor,
+)
+from app.ranges import (
+    RangeNotSatisfiableError,
+    http_date,
+    if_none_match_matches,
+    if_range_matches,
+    parse_range,
+)
+from app.serialization import json_lines, json_objects
+from app.transforms import ImageTooLargeError, TransformQueueFullError
 from app.usecases import (
     ImageUseCase,
+    NotModified,
 )
 
+logger = logging.getLogger("image_service")
+
 
 class Handler(ABC):
     def __init__(self, use_case: ImageUseCase):
         self.use_case = use_case
 
     @abstractmethod
-    def handle(self, *args, **kwargs) -> Response:
+    async def handle(self, *args, **kwargs) -> Response:
         ...
 
 
 class UploadHandler(Handler):
+    content_types = ["image/jpeg", "image/png", "image/jpg"]
+    status_code = 200
+
     def __init__(self, use_case: ImageUseCase, http_client: HttpClient):
         super().__init__(use_case)
         self.http_client = http_client
 
-    def handle(
+    async def handle(
         self,
         file: UploadFile,
         user_token: str,
         processed: bool,
         origin_uuid: str | UUID | None,
     ) -> JSONResponse:
-        if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
+        if file.content_type not in UploadHandler.content_types:
             return JSONResponse(
                 content={"error": "Only jpeg and png images are allowed"},
                 status_code=400,
             )
-        resp = self.http_client.get(user_token)
+        resp = await self.http_client.get(user_token)
         if resp.status_code != 200:
             return JSONResponse(
                 content={"error": "Invalid user token"}, status_code=400
             )
-        content = self.use_case.execute(file, resp.json(), processed, origin_uuid)
-        return JSONResponse(content=content, media_type="application/json")
+        try:
+            content = await self.use_case.execute(
+                file, resp.json(), processed, origin_uuid
+            )
+        except (TransformQueueFullError, BackgroundQueueFullError):
+            return JSONResponse(
+                content={"error": "Too many uploads in progress, retry later"},
+                status_code=503,
+                headers={"Retry-After": "1"},
+            )
+        except ImageTooLargeError as error:
+            return JSONResponse(content={"error": str(error)}, status_code=413)
+        return JSONResponse(
+            content=content,
+            status_code=self.status_code,
+            media_type="application/json",
+        )
+
+
+class BackgroundUploadHandler(UploadHandler):
+    """Answers 202 Accepted, as the image is only processed afterwards."""
+
+    status_code = 202
+
+
+class BatchUploadHandler(UploadHandler):
+    def __init__(
+        self, use_case: ImageUseCase, http_client: HttpClient, max_files: int = 50
+    ):
+        super().__init__(use_case, http_client)
+        self.max_files = max_files
+
+    @staticmethod
+    def _error_message(error: Exception) -> str:
+        if isinstance(error, TransformQueueFullError):
+            return "Too many uploads in progress, retry later"
+        if isinstance(error, ImageTooLargeError):
+            return str(error)
+        if isinstance(error, UnidentifiedImageError):
+            return "Not a valid image"
+        logger.error(f"Upload failed: {error!r}")
+        return "Upload failed"
+
+    async def handle(
+        self,
+        files: list[UploadFile],
+        user_token: str,
+        processed: bool,
+        origin_uuid: str | UUID | None,
+    ) -> JSONResponse:
+        if len(files) > self.max_files:
+            return JSONResponse(
+                content={"error": f"At most {self.max_files} files are allowed"},
+                status_code=400,
+            )
+        resp = await self.http_client.get(user_token)
+        if resp.status_code != 200:
+            return JSONResponse(
+                content={"error": "Invalid user token"}, status_code=400
+            )
+        images = [file for file in files if file.content_type in self.content_types]
+        outcomes = iter(
+            await self.use_case.execute(images, resp.json(), processed, origin_uuid)
+            if images
+            else []
+        )
+        results = []
+        for file in files:
+            if file.content_type not in self.content_types:
+                result = {"error": "Only jpeg and png images are allowed"}
+            else:
+                outcome = next(outcomes)
+                result = (
+                    {"error": self._error_message(outcome)}
+                    if isinstance(outcome, Exception)
+                    else {"uuid": str(outcome)}
+                )
+            results.append({"file_name": file.filename, **result})
+        return JSONResponse(content=results, media_type="application/json")
+
+
+class StatusHandler(Handler):
+    async def handle(self, uuid: UUID) -> JSONResponse:
+        status = await self.use_case.execute(uuid)
+        if status is None:
+            return JSONResponse(content={"error": "Image not found"}, status_code=404)
+        return JSONResponse(
+            content={"uuid": str(uuid), "status": status},
+            media_type="application/json",
+        )
 
 
 class DeleteHandler(Handler):
-    def handle(self, uuid: UUID) -> JSONResponse:
-        content = self.use_case.execute(uuid)
+    async def handle(self, uuid: UUID) -> JSONResponse:
+        content = await self.use_case.execute(uuid)
         if content:
             return JSONResponse(
                 content={"message": f"{uuid} was deleted"},
@@ -57,15 +177,174 @@ class DeleteHandler(Handler):
         return JSONResponse(content={"error": "Image not found"}, status_code=404)
 
 
+class BulkDeleteHandler(Handler):
+    async def handle(
+        self, uuids: list[UUID] | None, client_id: str | None
+    ) -> JSONResponse:
+        results = await self.use_case.execute(uuids, client_id)
+        content = []
+        for uuid, result in results.items():
+            if result is True:
+                content.append({"uuid": uuid, "message": f"{uuid} was deleted"})
+            elif result is False:
+                content.append({"uuid": uuid, "error": "Image not found"})
+            else:
+                logger.error(f"Deleting {uuid} failed: {result!r}")
+                content.append({"uuid": uuid, "error": "Delete failed"})
+        return JSONResponse(content=content, media_type="application/json")
+
+
+class ExportHandler(Handler):
+    async def handle(self, uuids: list[UUID] | None, client_id: str | None) -> Response:
+        if (uuids is None) == (client_id is None):
+            return JSONResponse(
+                content={"error": "Exactly one of uuid and client_id is required"},
+                status_code=400,
+            )
+        archive = await self.use_case.execute(uuids, client_id)
+        if archive is None:
+            return JSONResponse(content={"error": "Image not found"}, status_code=404)
+        file_name = f"{client_id}.zip" if client_id else "images.zip"
+        return StreamingResponse(
+            archive,
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+        )
+
+
 class MetadataHandler(Handler):
-    def handle(self, client_id: str) -> list[ImageDocument]:
-        content = self.use_case.execute(client_id)
-        return [ImageDocument(**image) for image in content]
+    batch_size = 100
+
+    @staticmethod
+    def _json_array(images: Iterable[dict]) -> Iterator[bytes]:
+        yield b"["
+        separator = b""
+        for batch in batched(images, MetadataHandler.batch_size):
+            yield separator + json_objects(batch)
+            separator = b","
+        yield b"]"
+
+    @staticmethod
+    def _json_lines(images: Iterable[dict]) -> Iterator[bytes]:
+        for batch in batched(images, MetadataHandler.batch_size):
+            yield json_lines(batch)
+
+    async def handle(
+        self,
+        client_id: str,
+        limit: int | None = None,
+        cursor: str | None = None,
+        response_format: str = "json",
+    ) -> Response:
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except InvalidCursorError:
+            return JSONResponse(content={"error": "Invalid cursor"}, status_code=400)
+        encode, media_type = (
+            (self._json_lines, "application/x-ndjson")
+            if response_format == "ndjson"
+            else (self._json_array, "application/json")
+        )
+        if limit is None:
+            images = await self.use_case.execute(client_id, None, after)
+            return StreamingResponse(encode(images), media_type=media_type)
+        # One extra image tells whether there is a next page.
+        images = await run_in_threadpool(
+            list, await self.use_case.execute(client_id, limit + 1, after)
+        )
+        headers = {}
+        if len(images) > limit:
+            images = images[:limit]
+            headers["X-Next-Cursor"] = encode_cursor(images[-1])
+        return Response(
+            content=b"".join(encode(images)), media_type=media_type, headers=headers
+        )
 
 
 class DownloadHandler(Handler):
-    def handle(self, uuid: UUID) -> Response:
-        content, file_extension = self.use_case.execute(uuid)
-        if content is None:
-            return Response(content={"error": "Image not found"}, status_code=404)
-        return Response(content=content, media_type=f"image/{file_extension}")
+    def __init__(
+        self,
+        use_case: ImageUseCase,
+        cache_control: str = "public, max-age=31536000, immutable",
+    ):
+        super().__init__(use_case)
+        # Sent with files whose ETag is derived from their content.
+        self.cache_control = cache_control
+
+    def _headers(self, stored_file: StoredFile) -> dict[str, str]:
+        headers = {"Accept-Ranges": "bytes", "Vary": "Accept"}
+        if stored_file.etag:
+            headers["ETag"] = stored_file.etag
+        if stored_file.last_modified:
+            headers["Last-Modified"] = http_date(stored_file.last_modified)
+        if stored_file.immutable:
+            headers["Cache-Control"] = self.cache_control
+        return headers
+
+    @staticmethod
+    def _byte_range(
+        stored_file: StoredFile, range_header: str | None, if_range: str | None
+    ) -> tuple[int, int] | None:
+        """The requested range, or None for the whole file; raises
+        RangeNotSatisfiableError."""
+        if not if_range_matches(if_range, stored_file.etag, stored_file.last_modified):
+            return None
+        return parse_range(range_header, stored_file.content_length)
+
+    @staticmethod
+    def _file_response(
+        stored_file: StoredFile,
+        byte_range: tuple[int, int] | None,
+        headers: dict[str, str],
+    ) -> Response:
+        size = stored_file.content_length
+        status_code = 200
+        start, end = 0, size - 1
+        if byte_range is not None:
+            status_code = 206
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        if stored_file.path is not None and byte_range is None:
+            return FileResponse(
+                stored_file.path, media_type=stored_file.content_type, headers=headers
+            )
+        return StreamingResponse(
+            stored_file.iter_range(start, end) if end >= start else iter(()),
+            status_code=status_code,
+            media_type=stored_file.content_type,
+            headers=headers,
+        )
+
+    async def handle(
+        self,
+        uuid: UUID,
+        range_header: str | None = None,
+        if_range: str | None = None,
+        size: str | None = None,
+        accept: str | None = None,
+        if_none_match: str | None = None,
+    ) -> Response:
+        stored_file = await self.use_case.execute(
+            uuid, size, accepted_image_formats(accept), if_none_match
+        )
+        if stored_file is None:
+            return JSONResponse(content={"error": "Image not found"}, status_code=404)
+        if isinstance(stored_file, NotModified):
+            return Response(
+                status_code=304,
+                headers={
+                    "ETag": stored_file.etag,
+                    "Cache-Control": self.cache_control,
+                    "Vary": "Accept",
+                },
+            )
+        headers = self._headers(stored_file)
+        if if_none_match_matches(if_none_match, stored_file.etag):
+            return Response(status_code=304, headers=headers)
+        try:
+            byte_range = self._byte_range(stored_file, range_header, if_range)
+        except RangeNotSatisfiableError:
+            headers["Content-Range"] = f"bytes */{stored_file.content_length}"
+            return Response(status_code=416, headers=headers)
+        return self._file_response(stored_file, byte_range, headers)
@@ -1,17 +1,111 @@
+import asyncio
+import hashlib
 from typing import Protocol, Any
 
 import requests
 from requests import Response
+from requests.adapters import HTTPAdapter
+from starlette.concurrency import run_in_threadpool
+
+from app.cache import TTLCache
+from app.metrics import stage
+
+AUTHENTICATION_SECONDS = stage("authentication")
 
 
 class HttpClient(Protocol):
-    def get(self, params: Any) -> Response:
+    async def get(self, params: Any) -> Response:
+        ...
+
+    def close(self) -> None:
         ...
 
 
 class AuthenticationHttpClient(HttpClient):
-    def __init__(self, url):
+    def __init__(self, url, pool_size: int = 10, timeout: float = 5.0):
         self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    async def get(self, auth_token: str) -> Response:
+        with AUTHENTICATION_SECONDS.time():
+            return await run_in_threadpool(
+                self.session.get,
+                self.url,
+                headers={"Authorization": auth_token},
+                timeout=self.timeout,
+            )
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class CachedAuthenticationHttpClient(HttpClient):
+    """Remembers the authentication service's answer per token.
+
+    Accepted tokens are kept for the cache's ttl, rejected ones for
+    ``negative_ttl``. Server errors are never cached. Concurrent lookups of
+    the same token share a single request to the authentication service.
+    """
+
+    rejected_status_codes = (400, 401, 403)
+
+    def __init__(self, http_client: HttpClient, cache: TTLCache, negative_ttl: float):
+        self.http_client = http_client
+        self.cache = cache
+        self.negative_ttl = negative_ttl
+        self.in_flight: dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _cache_key(auth_token: str) -> str:
+        return hashlib.sha256((auth_token or "").encode()).hexdigest()
+
+    async def get(self, auth_token: str) -> Response:
+        key = self._cache_key(auth_token)
+        response = self.cache.get(key)
+        if response is not None:
+            return response
+        if key in self.in_flight:
+            return await self._join(self.in_flight[key], auth_token)
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            response = await self.http_client.get(auth_token)
+        except Exception as error:
+            future.set_exception(error)
+            # Marks the exception as retrieved when nobody else was waiting.
+            future.exception()
+            raise
+        except BaseException:
+            # Cancelled: the waiting lookups must not wait forever.
+            future.cancel()
+            raise
+        finally:
+            del self.in_flight[key]
+        self._remember(key, response)
+        future.set_result(response)
+        return response
+
+    async def _join(self, shared: asyncio.Future, auth_token: str) -> Response:
+        """Waits for a lookup another request started."""
+        try:
+            return await asyncio.shield(shared)
+        except asyncio.CancelledError:
+            if not shared.cancelled():
+                raise
+            # The request that started the lookup was cancelled, not this one,
+            # so it looks the token up again.
+            return await self.get(auth_token)
+
+    def _remember(self, key: str, response: Response) -> None:
+        if response.status_code == 200:
+            self.cache.set(key, response)
+        elif response.status_code in self.rejected_status_codes:
+            self.cache.set(key, response, ttl=self.negative_ttl)
 
-    def get(self, auth_token: str) -> Response:
-        return requests.get(self.url, headers={"Authorization": auth_token})
+    def close(self) -> None:
+        self.cache.clear()
+        self.http_client.close()
@@ -1,15 +1,18 @@
 import logging
 from logging.config import dictConfig
-from typing import Callable
-from fastapi import Request
 
 import uvicorn
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse, Response
 
-from app.routes import router as api_router
+from app.container import Container
+from app.middleware import (
+    ApiKeyMiddleware,
+    MetricsMiddleware,
+    UploadSizeLimitMiddleware,
+)
+from app.routes import metrics_router, router as api_router
 from app.settings import LogConfig
 from app.settings import get_settings
 
@@ -33,19 +36,30 @@ app = FastAPI(
 )
 
 
-@app.middleware("http")
-async def check_api_key(request: Request, call_next: Callable) -> Response:
-    if "/health" in request.url.path:
-        return await call_next(request)
-    if (
-        request.headers.get("Authorization") != get_settings().api_key
-        and request.method != "OPTIONS"
-        and request.method != "POST"
-    ):
-        return JSONResponse(status_code=401, content={"message": "Unauthorized"})
-    return await call_next(request)
+@app.on_event("startup")
+def create_container() -> None:
+    app.state.container = Container(get_settings())
+    app.state.container.ensure_indexes()
+    app.state.container.start()
+
 
+@app.on_event("shutdown")
+async def close_container() -> None:
+    await app.state.container.close()
 
+
+# Added before CORS so CORS wraps them: preflights are answered by CORS, and
+# 401 and 413 responses carry the CORS headers browsers need to read them.
+app.add_middleware(
+    ApiKeyMiddleware,
+    api_key=get_settings().api_key,
+    exempt_paths=(f"{get_settings().base_url}/images/health", "/metrics"),
+)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=get_settings().max_upload_bytes,
+    path_max_bytes={"/images/upload_batch": get_settings().max_batch_upload_bytes},
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -53,8 +67,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Added last so it is outermost and also measures rejected requests.
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(api_router, prefix=get_settings().base_url)
+app.include_router(metrics_router)
 use_route_names_as_operation_ids(app)
 
 if __name__ == "__main__":
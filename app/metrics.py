@@ -0,0 +1,273 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Iterator, Sequence
+
+# Seconds, from a cache hit to a slow share round trip.
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+Sample = tuple[str, dict[str, str], float]
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: "_HistogramChild"):
+        self.histogram = histogram
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function: Callable[[], float] | None = None
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value += amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Reads the value from ``function`` when the metrics are collected,
+        for totals another object already keeps."""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def set(self, value: float) -> None:
+        with self.lock:
+            self.value = value
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class Metric:
+    type_name = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        registry: "MetricsRegistry | None" = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.children: dict[tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _child(self) -> object:
+        raise NotImplementedError
+
+    def labels(self, *values: str) -> object:
+        """Returns the series of these label values, creating it on first use;
+        afterwards this is a single dict lookup."""
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}")
+            with self.lock:
+                child = self.children.setdefault(values, self._child())
+        return child
+
+    def _labels(self, values: tuple[str, ...]) -> dict[str, str]:
+        return dict(zip(self.label_names, values))
+
+    def samples(self) -> Iterator[Sample]:
+        for values, child in list(self.children.items()):
+            yield self.name, self._labels(values), child.get()
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(
+            f"{name}{_format_labels(labels)} {_format_value(value)}"
+            for name, labels, value in self.samples()
+        )
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def _child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def labels(self, *values: str) -> _CounterChild:
+        return super().labels(*values)
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def _child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def labels(self, *values: str) -> _GaugeChild:
+        return super().labels(*values)
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: "MetricsRegistry | None" = None,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, label_names, registry)
+
+    def _child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def labels(self, *values: str) -> _HistogramChild:
+        return super().labels(*values)
+
+    def samples(self) -> Iterator[Sample]:
+        for values, child in list(self.children.items()):
+            labels = self._labels(values)
+            with child.lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                bucket_labels = labels | {"le": _format_value(bound)}
+                yield f"{self.name}_bucket", bucket_labels, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> None:
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        return "".join(metric.render() for metric in self.metrics)
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = Histogram(
+    "image_service_request_duration_seconds",
+    "Time to answer an HTTP request, by route and status code.",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "image_service_requests_in_flight", "HTTP requests being answered.", ["method"]
+)
+HTTP_BYTES = Counter(
+    "image_service_http_bytes_total",
+    "HTTP body bytes received and sent, by route.",
+    ["route", "direction"],
+)
+STAGE_SECONDS = Histogram(
+    "image_service_stage_duration_seconds",
+    "Time spent in one stage of handling an image.",
+    ["stage"],
+)
+STORAGE_BYTES = Counter(
+    "image_service_storage_bytes_total",
+    "File bytes written to and read from the storage backend.",
+    ["direction"],
+)
+IN_PROGRESS = Gauge(
+    "image_service_in_progress",
+    "Work queued or running, by kind.",
+    ["kind"],
+)
+CACHE_LOOKUPS = Counter(
+    "image_service_cache_lookups_total",
+    "Cache lookups, by cache and result.",
+    ["cache", "result"],
+)
+CACHE_HIT_RATIO = Gauge(
+    "image_service_cache_hit_ratio",
+    "Share of cache lookups that were hits since the process started.",
+    ["cache"],
+)
+
+
+def stage(name: str) -> _HistogramChild:
+    return STAGE_SECONDS.labels(name)
+
+
+def track_cache(name: str, cache: object) -> None:
+    """Exposes the ``hits`` and ``misses`` totals a cache keeps itself."""
+    CACHE_LOOKUPS.labels(name, "hit").set_function(lambda: cache.hits)
+    CACHE_LOOKUPS.labels(name, "miss").set_function(lambda: cache.misses)
+    CACHE_HIT_RATIO.labels(name).set_function(
+        lambda: cache.hits / (cache.hits + cache.misses)
+        if cache.hits + cache.misses
+        else 0.0
+    )
@@ -0,0 +1,196 @@
+import time
+
+from starlette.datastructures import Headers
+from starlette.requests import ClientDisconnect
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.metrics import HTTP_BYTES, REQUEST_SECONDS, REQUESTS_IN_FLIGHT
+
+
+class ApiKeyMiddleware:
+    """Answers 401 unless the Authorization header carries ``api_key``.
+
+    Requests for exactly one of ``exempt_paths`` and requests with one of
+    ``exempt_methods`` pass without a key. Admitted requests reach the app
+    with the original receive and send, so streaming bodies are untouched.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        api_key: str | None,
+        exempt_paths: tuple[str, ...] = ("/api/images/health", "/metrics"),
+        exempt_methods: tuple[str, ...] = ("OPTIONS", "POST"),
+    ):
+        self.app = app
+        self.api_key = api_key.encode("latin-1") if api_key is not None else None
+        self.exempt_paths = frozenset(exempt_paths)
+        self.exempt_methods = frozenset(exempt_methods)
+
+    def _authorized(self, scope: Scope) -> bool:
+        if scope["method"] in self.exempt_methods:
+            return True
+        if scope["path"] in self.exempt_paths:
+            return True
+        # Without a configured key only requests without the header pass.
+        authorization = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value
+                break
+        return authorization == self.api_key
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self._authorized(scope):
+            await self.app(scope, receive, send)
+            return
+        response = JSONResponse(status_code=401, content={"message": "Unauthorized"})
+        await response(scope, receive, send)
+
+
+class MetricsMiddleware:
+    """Records the duration, status code and body sizes of HTTP requests.
+
+    Requests are labelled with the name of the endpoint that answered them,
+    which keeps uuids in paths out of the labels; requests answered before
+    routing, e.g. a rejected upload, are labelled "unmatched".
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        in_flight = REQUESTS_IN_FLIGHT.labels(method)
+        status = 500
+        received = 0
+        sent = 0
+
+        async def counting_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message: Message) -> None:
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            duration = time.perf_counter() - start
+            in_flight.dec()
+            # The router adds the endpoint to the scope it was given.
+            route = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            REQUEST_SECONDS.labels(method, route, str(status)).observe(duration)
+            HTTP_BYTES.labels(route, "received").inc(received)
+            HTTP_BYTES.labels(route, "sent").inc(sent)
+
+
+class _LimitedBody:
+    """The receive and send of one request whose body is limited to
+    ``max_bytes``; the first chunk past the limit answers the request."""
+
+    def __init__(
+        self, max_bytes: int, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.scope = scope
+        self._receive = receive
+        self._send = send
+        self.received = 0
+        self.exceeded = False
+        self.rejected = False
+        self.response_started = False
+
+    async def receive(self) -> Message:
+        if self.exceeded:
+            return {"type": "http.disconnect"}
+        message = await self._receive()
+        if message["type"] != "http.request":
+            return message
+        self.received += len(message.get("body", b""))
+        if self.received <= self.max_bytes:
+            return message
+        self.exceeded = True
+        if not self.response_started:
+            await UploadSizeLimitMiddleware.reject(
+                self.max_bytes, self.scope, self._receive, self._send
+            )
+            self.rejected = True
+        # The app sees a disconnected client and stops reading; once
+        # rejected, whatever it responds with is dropped.
+        return {"type": "http.disconnect"}
+
+    async def send(self, message: Message) -> None:
+        if self.rejected:
+            return
+        if message["type"] == "http.response.start":
+            self.response_started = True
+        await self._send(message)
+
+
+class UploadSizeLimitMiddleware:
+    """Rejects request bodies larger than ``max_bytes`` with a 413.
+
+    ``path_max_bytes`` overrides the limit for paths ending with one of its keys.
+
+    A declared Content-Length is checked before the app runs. Otherwise the
+    body is counted while the app reads it, and the first chunk past the limit
+    answers the request and ends the body, so an oversize upload is never
+    spooled completely.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_bytes: int,
+        path_max_bytes: dict[str, int] | None = None,
+    ):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_max_bytes = path_max_bytes or {}
+
+    def _max_bytes(self, path: str) -> int:
+        for suffix, max_bytes in self.path_max_bytes.items():
+            if path.endswith(suffix):
+                return max_bytes
+        return self.max_bytes
+
+    @staticmethod
+    async def reject(
+        max_bytes: int, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        response = JSONResponse(
+            content={"error": f"Request body exceeds {max_bytes} bytes"},
+            status_code=413,
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        max_bytes = self._max_bytes(scope["path"])
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > max_bytes:
+            await self.reject(max_bytes, scope, receive, send)
+            return
+        body = _LimitedBody(max_bytes, scope, receive, send)
+        try:
+            await self.app(scope, body.receive, body.send)
+        except ClientDisconnect:
+            if not body.rejected:
+                raise
@@ -0,0 +1,25 @@
+def accepted_image_formats(accept: str | None) -> list[str]:
+    """Image subtypes named in an ``Accept`` header, most preferred first.
+
+    Wildcards such as ``image/*`` are skipped: they never justify switching
+    away from the stored format.
+    """
+    if not accept:
+        return []
+    weighted = []
+    for media_range in accept.split(","):
+        media_type, *parameters = (part.strip() for part in media_range.split(";"))
+        main_type, _, subtype = media_type.lower().partition("/")
+        if main_type != "image" or subtype in ("", "*"):
+            continue
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            weighted.append((-quality, len(weighted), subtype))
+    return [subtype for _, _, subtype in sorted(weighted)]
@@ -0,0 +1,35 @@
+import base64
+import binascii
+import json
+from itertools import islice
+from typing import Iterable, Iterator
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+
+class InvalidCursorError(Exception):
+    pass
+
+
+def encode_cursor(document: dict) -> str:
+    position = [document["tags"]["timestamp"], str(document["_id"])]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, ObjectId]:
+    try:
+        timestamp, object_id = json.loads(base64.urlsafe_b64decode(cursor))
+        # The timestamp goes into the query; anything else, e.g. an operator
+        # expression, is rejected.
+        if not isinstance(timestamp, str):
+            raise TypeError(timestamp)
+        return timestamp, ObjectId(object_id)
+    except (binascii.Error, ValueError, TypeError, InvalidId) as error:
+        raise InvalidCursorError(cursor) from error
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
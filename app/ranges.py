@@ -0,0 +1,65 @@
+from datetime import datetime
+from email.utils import format_datetime
+
+
+class RangeNotSatisfiableError(Exception):
+    pass
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value, usegmt=True)
+
+
+def parse_range(
+    range_header: str | None, content_length: int
+) -> tuple[int, int] | None:
+    """Returns the inclusive byte range requested by a ``Range`` header.
+
+    None means the whole file should be sent: there is no header, it is not
+    a single bytes range, or it cannot be parsed (RFC 9110 lets servers ignore
+    such headers). A well-formed range that lies outside the file raises
+    RangeNotSatisfiableError.
+    """
+    if not range_header:
+        return None
+    unit, _, byte_range = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in byte_range:
+        return None
+    first, _, last = byte_range.strip().partition("-")
+    try:
+        if not first:
+            suffix_length = int(last)
+            if suffix_length <= 0 or content_length == 0:
+                raise RangeNotSatisfiableError(range_header)
+            return max(content_length - suffix_length, 0), content_length - 1
+        start = int(first)
+        end = int(last) if last else content_length - 1
+    except ValueError:
+        return None
+    if start >= content_length:
+        raise RangeNotSatisfiableError(range_header)
+    if end < start:
+        return None
+    return start, min(end, content_length - 1)
+
+
+def if_range_matches(
+    if_range: str | None, etag: str | None, last_modified: datetime | None
+) -> bool:
+    if if_range is None:
+        return True
+    if if_range.startswith('"'):
+        return etag is not None and if_range == etag
+    return last_modified is not None and if_range == http_date(last_modified)
+
+
+def if_none_match_matches(if_none_match: str | None, etag: str | None) -> bool:
+    """Weak comparison of ``etag`` against an ``If-None-Match`` header."""
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque_tag for tag in if_none_match.split(",")
+    )
@@ -1,8 +1,31 @@
 import logging
+import functools
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
 from uuid import UUID
 
 from bson import ObjectId
-from pymongo import MongoClient
+from pymongo import ASCENDING, IndexModel, MongoClient, ReturnDocument
+from pymongo.cursor import Cursor
+from starlette.concurrency import run_in_threadpool
+
+from app.metrics import stage
+
+
+# How long a bulk delete may hold the documents it claimed before deleting them.
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def timed(method: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    """Records the duration of a repository call as the mongo_<name> stage."""
+    series = stage(f"mongo_{method.__name__}")
+
+    @functools.wraps(method)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with series.time():
+            return await method(*args, **kwargs)
+
+    return wrapper
 
 
 class ImageRepository:
@@ -11,23 +34,280 @@ class ImageRepository:
         mongo_client: MongoClient,
         database_name: str,
         collection_name: str,
+        blob_collection_name: str = "blobs",
     ):
-        self.collection = mongo_client.get_database(database_name).get_collection(
-            collection_name
-        )
+        database = mongo_client.get_database(database_name)
+        self.collection = database.get_collection(collection_name)
+        # Reference-counted files shared by images with the same content,
+        # keyed by content hash.
+        self.blobs = database.get_collection(blob_collection_name)
         self.logger = logging.getLogger("image_service")
 
+    def ensure_indexes(self) -> list[str]:
+        return self.collection.create_indexes(
+            [
+                IndexModel([("uuid", ASCENDING)], name="uuid_unique", unique=True),
+                # Matches the sort of find_images, so pages are read in
+                # index order instead of being sorted in memory.
+                IndexModel(
+                    [
+                        ("client_id", ASCENDING),
+                        ("tags.timestamp", ASCENDING),
+                        ("_id", ASCENDING),
+                    ],
+                    name="client_id_timestamp_id",
+                ),
+                # Only the few pending uploads are indexed, for requeueing.
+                IndexModel(
+                    [("status", ASCENDING)],
+                    name="status_pending",
+                    partialFilterExpression={"status": "pending"},
+                ),
+            ]
+        )
+
     def put_image(self, image: dict) -> ObjectId:
         result = self.collection.insert_one(image)
         return result.inserted_id
 
+    def put_images(self, images: list[dict]) -> list[ObjectId]:
+        result = self.collection.insert_many(images, ordered=False)
+        return result.inserted_ids
+
+    def add_variant(self, uuid: UUID, file_name: str) -> bool:
+        result = self.collection.update_one(
+            {"uuid": str(uuid)}, {"$addToSet": {"variants": file_name}}
+        )
+        return result.modified_count > 0
+
+    def update_image(self, uuid: UUID, fields: dict) -> bool:
+        result = self.collection.update_one({"uuid": str(uuid)}, {"$set": fields})
+        return result.modified_count > 0
+
+    def acquire_blob(self, content_hash: str) -> dict | None:
+        return self.blobs.find_one_and_update(
+            {"_id": content_hash},
+            {"$inc": {"refcount": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def register_blob(self, content_hash: str, blob: dict) -> dict:
+        """Takes a reference to the blob of ``content_hash``, creating it from
+        ``blob`` unless a concurrent upload registered it first."""
+        return self.blobs.find_one_and_update(
+            {"_id": content_hash},
+            {"$inc": {"refcount": 1}, "$setOnInsert": blob},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def release_blob(self, content_hash: str) -> dict | None:
+        return self.blobs.find_one_and_update(
+            {"_id": content_hash},
+            {"$inc": {"refcount": -1}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def delete_blob(self, content_hash: str) -> bool:
+        """Deletes the blob unless it was acquired again since its last release."""
+        result = self.blobs.delete_one({"_id": content_hash, "refcount": {"$lte": 0}})
+        return result.deleted_count > 0
+
+    def query_blob(self, content_hash: str) -> dict | None:
+        return self.blobs.find_one({"_id": content_hash})
+
+    def add_blob_variant(self, content_hash: str, file_name: str) -> bool:
+        result = self.blobs.update_one(
+            {"_id": content_hash}, {"$addToSet": {"variants": file_name}}
+        )
+        return result.modified_count > 0
+
     def delete_image(self, uuid: UUID) -> bool:
         result = self.collection.delete_one({"uuid": str(uuid)})
         self.logger.info(f"Deleted image with uuid {uuid} from database")
         return result.deleted_count > 0
 
-    def query_images(self, field_key: str, field_value: str) -> list:
-        return list(self.collection.find({field_key: field_value}))
+    def delete_images(self, uuids: list[str]) -> int:
+        result = self.collection.delete_many({"uuid": {"$in": uuids}})
+        self.logger.info(f"Deleted {result.deleted_count} images from database")
+        return result.deleted_count
+
+    def pop_images(self, uuids: list[str], projection: dict) -> list[dict]:
+        """Deletes the images of ``uuids`` and returns the deleted documents.
+
+        The documents are first claimed with an update_many, so of concurrent
+        calls for the same image exactly one returns it. Claims older than
+        CLAIM_TIMEOUT, left by a call that stopped before its delete_many,
+        may be taken over.
+        """
+        claim = ObjectId()
+        stale = ObjectId.from_datetime(datetime.now(timezone.utc) - CLAIM_TIMEOUT)
+        self.collection.update_many(
+            {
+                "uuid": {"$in": uuids},
+                "$or": [
+                    {"deleted_by": {"$exists": False}},
+                    {"deleted_by": {"$lt": stale}},
+                ],
+            },
+            {"$set": {"deleted_by": claim}},
+        )
+        documents = list(self.collection.find({"deleted_by": claim}, projection))
+        result = self.collection.delete_many({"deleted_by": claim})
+        self.logger.info(f"Deleted {result.deleted_count} images from database")
+        return documents
+
+    def query_images(
+        self,
+        field_key: str,
+        field_value: str | list[str],
+        projection: dict | None = None,
+    ) -> list:
+        """Matches any of the values when ``field_value`` is a list."""
+        if isinstance(field_value, list):
+            return list(
+                self.collection.find({field_key: {"$in": field_value}}, projection)
+            )
+        return list(self.collection.find({field_key: field_value}, projection))
+
+    def query_image(
+        self, field_key: str, field_value: str, projection: dict | None = None
+    ) -> dict:
+        return self.collection.find_one({field_key: field_value}, projection)
+
+    def find_images(
+        self,
+        field_key: str,
+        field_value: str,
+        projection: dict | None = None,
+        after: tuple[str, ObjectId] | None = None,
+        limit: int = 0,
+        batch_size: int = 500,
+    ) -> Cursor:
+        """Lazily iterates matching images ordered by upload time.
+
+        ``after`` is the (timestamp, _id) of the last image of the previous
+        page; paging on it instead of skipping keeps every page an index seek.
+        """
+        query: dict = {field_key: field_value}
+        if after is not None:
+            timestamp, object_id = after
+            query["$or"] = [
+                {"tags.timestamp": {"$gt": timestamp}},
+                {"tags.timestamp": timestamp, "_id": {"$gt": object_id}},
+            ]
+        return (
+            self.collection.find(query, projection)
+            .sort([("tags.timestamp", ASCENDING), ("_id", ASCENDING)])
+            .limit(limit)
+            .batch_size(batch_size)
+        )
+
+
+class AsyncImageRepository:
+    """Awaitable ImageRepository.
+
+    pymongo calls block, so each one runs on the worker thread pool and the
+    event loop stays free to serve other requests while Mongo answers.
+    """
+
+    def __init__(
+        self,
+        mongo_client: MongoClient,
+        database_name: str,
+        collection_name: str,
+        blob_collection_name: str = "blobs",
+    ):
+        self.repository = ImageRepository(
+            mongo_client, database_name, collection_name, blob_collection_name
+        )
+
+    @timed
+    async def put_image(self, image: dict) -> ObjectId:
+        return await run_in_threadpool(self.repository.put_image, image)
+
+    @timed
+    async def put_images(self, images: list[dict]) -> list[ObjectId]:
+        return await run_in_threadpool(self.repository.put_images, images)
+
+    @timed
+    async def add_variant(self, uuid: UUID, file_name: str) -> bool:
+        return await run_in_threadpool(self.repository.add_variant, uuid, file_name)
+
+    @timed
+    async def update_image(self, uuid: UUID, fields: dict) -> bool:
+        return await run_in_threadpool(self.repository.update_image, uuid, fields)
+
+    @timed
+    async def acquire_blob(self, content_hash: str) -> dict | None:
+        return await run_in_threadpool(self.repository.acquire_blob, content_hash)
 
-    def query_image(self, field_key: str, field_value: str) -> dict:
-        return self.collection.find_one({field_key: field_value})
+    @timed
+    async def register_blob(self, content_hash: str, blob: dict) -> dict:
+        return await run_in_threadpool(
+            self.repository.register_blob, content_hash, blob
+        )
+
+    @timed
+    async def release_blob(self, content_hash: str) -> dict | None:
+        return await run_in_threadpool(self.repository.release_blob, content_hash)
+
+    @timed
+    async def delete_blob(self, content_hash: str) -> bool:
+        return await run_in_threadpool(self.repository.delete_blob, content_hash)
+
+    @timed
+    async def query_blob(self, content_hash: str) -> dict | None:
+        return await run_in_threadpool(self.repository.query_blob, content_hash)
+
+    @timed
+    async def add_blob_variant(self, content_hash: str, file_name: str) -> bool:
+        return await run_in_threadpool(
+            self.repository.add_blob_variant, content_hash, file_name
+        )
+
+    @timed
+    async def delete_image(self, uuid: UUID) -> bool:
+        return await run_in_threadpool(self.repository.delete_image, uuid)
+
+    @timed
+    async def delete_images(self, uuids: list[str]) -> int:
+        return await run_in_threadpool(self.repository.delete_images, uuids)
+
+    @timed
+    async def pop_images(self, uuids: list[str], projection: dict) -> list[dict]:
+        return await run_in_threadpool(self.repository.pop_images, uuids, projection)
+
+    @timed
+    async def query_images(
+        self,
+        field_key: str,
+        field_value: str | list[str],
+        projection: dict | None = None,
+    ) -> list:
+        return await run_in_threadpool(
+            self.repository.query_images, field_key, field_value, projection
+        )
+
+    @timed
+    async def query_image(
+        self, field_key: str, field_value: str, projection: dict | None = None
+    ) -> dict:
+        return await run_in_threadpool(
+            self.repository.query_image, field_key, field_value, projection
+        )
+
+    @timed
+    async def find_images(
+        self,
+        field_key: str,
+        field_value: str,
+        projection: dict | None = None,
+        after: tuple[str, ObjectId] | None = None,
+        limit: int = 0,
+    ) -> Cursor:
+        # Building a cursor does no I/O; iterating it does and belongs on a
+        # worker thread, e.g. through a StreamingResponse.
+        return self.repository.find_images(
+            field_key, field_value, projection, after, limit
+        )
@@ -1,19 +1,40 @@
 from uuid import UUID
 
-from fastapi import APIRouter, UploadFile, File, Depends, Header
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import APIRouter, UploadFile, File, Depends, Header, Query
+from fastapi.responses import (
+    JSONResponse,
+    FileResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
 from starlette.responses import Response
 
 from app.dependencies import (
+    get_batch_upload_handler,
+    get_bulk_delete_handler,
+    get_export_handler,
     get_download_handler,
     get_upload_handler,
     get_delete_handler,
     get_metadata_handler,
+    get_status_handler,
+)
+from app.handlers import (
+    BatchUploadHandler,
+    BulkDeleteHandler,
+    ExportHandler,
+    DownloadHandler,
+    MetadataHandler,
+    DeleteHandler,
+    UploadHandler,
+    StatusHandler,
 )
-from app.handlers import DownloadHandler, MetadataHandler, DeleteHandler, UploadHandler
-from app.schemas import ImageDocument
+from app.metrics import REGISTRY
+from app.schemas import BulkDeleteRequest, ImageDocument
 
 router = APIRouter(prefix="/images")
+# Served at the root, where Prometheus scrapes by default.
+metrics_router = APIRouter()
 
 
 @router.post(
@@ -29,7 +50,23 @@ async def upload_image(
     file: UploadFile = File(),
     handler: UploadHandler = Depends(get_upload_handler),
 ) -> JSONResponse:
-    return handler.handle(file, user_token, processed, origin_uuid)
+    return await handler.handle(file, user_token, processed, origin_uuid)
+
+
+@router.post(
+    "/upload_batch",
+    response_class=JSONResponse,
+    response_model=list[dict],
+    tags=["upload"],
+)
+async def upload_images(
+    user_token: str | None = Header(default=None),
+    origin_uuid: str = None,
+    processed: bool = False,
+    files: list[UploadFile] = File(),
+    handler: BatchUploadHandler = Depends(get_batch_upload_handler),
+) -> JSONResponse:
+    return await handler.handle(files, user_token, processed, origin_uuid)
 
 
 @router.get(
@@ -42,16 +79,41 @@ async def health() -> Response:
     return JSONResponse(content={"status": "ok"}, media_type="application/json")
 
 
+@router.get(
+    "/status/{uuid}",
+    response_class=JSONResponse,
+    response_model=dict,
+    tags=["upload"],
+)
+async def get_image_status(
+    uuid: UUID, handler: StatusHandler = Depends(get_status_handler)
+) -> JSONResponse:
+    return await handler.handle(uuid)
+
+
 @router.delete(
     "/delete/{uuid}",
     response_class=JSONResponse,
     response_model=dict,
     tags=["delete"],
 )
-def delete_image(
+async def delete_image(
     uuid: UUID, handler: DeleteHandler = Depends(get_delete_handler)
 ) -> JSONResponse:
-    return handler.handle(uuid)
+    return await handler.handle(uuid)
+
+
+@router.delete(
+    "/delete_batch",
+    response_class=JSONResponse,
+    response_model=list[dict],
+    tags=["delete"],
+)
+async def delete_images(
+    request: BulkDeleteRequest,
+    handler: BulkDeleteHandler = Depends(get_bulk_delete_handler),
+) -> JSONResponse:
+    return await handler.handle(request.uuids, request.client_id)
 
 
 @router.get(
@@ -60,10 +122,14 @@ def delete_image(
     response_class=JSONResponse,
     tags=["metadata"],
 )
-def get_metadata_images_for_client_id(
-    client_id: str, handler: MetadataHandler = Depends(get_metadata_handler)
+async def get_metadata_images_for_client_id(
+    client_id: str,
+    limit: int | None = Query(default=None, ge=1, le=1000),
+    cursor: str | None = None,
+    response_format: str = Query(default="json", alias="format", regex="^(nd)?json$"),
+    handler: MetadataHandler = Depends(get_metadata_handler),
 ) -> list[ImageDocument]:
-    return handler.handle(client_id)
+    return await handler.handle(client_id, limit, cursor, response_format)
 
 
 @router.get(
@@ -71,7 +137,37 @@ def get_metadata_images_for_client_id(
     response_class=FileResponse,
     tags=["download"],
 )
-def download_image(
-    uuid: UUID, handler: DownloadHandler = Depends(get_download_handler)
+async def download_image(
+    uuid: UUID,
+    size: str | None = Query(default=None, regex=r"^(\d+|original)$"),
+    range_header: str | None = Header(default=None, alias="Range"),
+    if_range: str | None = Header(default=None),
+    accept: str | None = Header(default=None),
+    if_none_match: str | None = Header(default=None),
+    handler: DownloadHandler = Depends(get_download_handler),
+) -> Response:
+    return await handler.handle(
+        uuid, range_header, if_range, size, accept, if_none_match
+    )
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    tags=["download"],
+)
+async def export_images(
+    client_id: str | None = None,
+    uuids: list[UUID] | None = Query(default=None, alias="uuid", max_items=1000),
+    handler: ExportHandler = Depends(get_export_handler),
 ) -> Response:
-    return handler.handle(uuid)
+    return await handler.handle(uuids, client_id)
+
+
+@metrics_router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    tags=["health"],
+)
+async def metrics() -> Response:
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from uuid import UUID
+
+from pydantic import BaseModel, Field, root_validator
 from pydantic.typing import Optional
 
 
@@ -9,6 +11,32 @@ class ImageDocument(BaseModel):
     file_name: str
     content_type: str
     tags: Optional[dict] = None
+    # Rendition name (the longest edge in pixels, or "original") to the file
+    # stored next to file_name.
+    renditions: Optional[dict[str, str]] = None
+    # Re-encoded copies (e.g. WebP) made on first request, see
+    # ImageDownloadUseCase.
+    variants: Optional[list[str]] = None
+    # SHA-256 of the uploaded file; downloads derive their ETag from it.
+    content_hash: Optional[str] = None
+    # Set for deduplicated uploads: the main file in file_path, a directory
+    # shared by every image with this content_hash. file_name is then only
+    # the name the file was uploaded with.
+    stored_file_name: Optional[str] = None
+    # "pending" while an upload accepted in the background is processed, then
+    # "ready", or "failed" when it could not be; None for older images.
+    status: Optional[str] = None
+
+
+class BulkDeleteRequest(BaseModel):
+    uuids: Optional[list[UUID]] = Field(default=None, max_items=1000)
+    client_id: Optional[str] = None
+
+    @root_validator
+    def check_one_selector(cls, values: dict) -> dict:
+        if (values.get("uuids") is None) == (values.get("client_id") is None):
+            raise ValueError("Exactly one of uuids and client_id is required")
+        return values
 
 
 class Payload(BaseModel):
@@ -0,0 +1,40 @@
+import json
+from typing import Callable
+
+from app.schemas import ImageDocument
+
+try:
+    import orjson
+except ImportError:  # Installed from the Pipfile; the fallback is for development.
+    orjson = None
+
+DOCUMENT_FIELDS = tuple(ImageDocument.__fields__)
+
+
+def _dumps(value: object) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+dumps: Callable[[object], bytes] = orjson.dumps if orjson is not None else _dumps
+
+
+def image_documents(documents: list[dict]) -> list[dict]:
+    """Stored image documents with exactly the fields of ImageDocument.
+
+    The documents were validated when they were written, so they are not
+    validated again; fields they lack are null, as in ImageDocument.
+    """
+    return [
+        {field: document.get(field) for field in DOCUMENT_FIELDS}
+        for document in documents
+    ]
+
+
+def json_objects(documents: list[dict]) -> bytes:
+    """The documents as comma-separated JSON objects, without brackets."""
+    return dumps(image_documents(documents))[1:-1]
+
+
+def json_lines(documents: list[dict]) -> bytes:
+    """The documents as JSON objects, each followed by a newline."""
+    return b"".join(dumps(document) + b"\n" for document in image_documents(documents))
@@ -11,10 +11,53 @@ class Settings(BaseSettings):
     mongo_uri: str = os.getenv("MONGO_URI")
     mongo_db_name: str = os.getenv("MONGO_DB_NAME")
     mongo_collection: str = os.getenv("MONGO_COLLECTION")
+    mongo_blob_collection = "blobs"
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 10
+    mongo_max_idle_time_ms: int = 300_000
+    mongo_connect_timeout_ms: int = 5_000
+    mongo_server_selection_timeout_ms: int = 5_000
+    mongo_socket_timeout_ms: int = 10_000
+    mongo_wait_queue_timeout_ms: int = 5_000
     azure_account_name: str = os.getenv("AZURE_ACCOUNT_NAME")
     azure_account_key: str = os.getenv("AZURE_ACCOUNT_KEY")
     azure_share_name: str = os.getenv("AZURE_SHARE_NAME")
+    azure_download_chunk_size = 1024 * 1024
+    # "azure", or "local" to store files under local_storage_dir.
+    storage_backend = "azure"
+    local_storage_dir = "/data/files/images"
+    file_cache_dir: str | None = None
+    file_cache_max_bytes = 1024 * 1024 * 1024
     authentication_url: str = os.getenv("AUTHENTICATION_URL")
+    authentication_timeout = 5.0
+    authentication_pool_size = 10
+    authentication_cache_size = 10_000
+    authentication_cache_ttl = 300.0
+    authentication_negative_cache_ttl = 30.0
+    image_rendition_sizes: list[int] = [128, 384]
+    image_keep_original = True
+    image_max_pixels = 64_000_000
+    image_deduplication = True
+    max_upload_bytes = 32 * 1024 * 1024
+    max_batch_upload_bytes = 512 * 1024 * 1024
+    upload_batch_max_files = 50
+    # Uploads accepted with ?async=true are processed by this many workers;
+    # at most background_upload_queue_size may wait for one.
+    background_upload_workers = 4
+    background_upload_queue_size = 256
+    background_upload_max_attempts = 3
+    background_upload_retry_delay = 1.0
+    # Pending uploads accepted this many seconds ago and not queued in this
+    # process, e.g. after a restart, are queued again; checked as often.
+    background_upload_recover_after = 600.0
+    delete_concurrency = 16
+    export_concurrency = 8
+    image_variant_formats: list[str] = ["avif", "webp"]
+    image_variant_quality = 80
+    image_transform_mode = "thread"
+    image_transform_workers: int | None = None
+    image_transform_queue_size = 64
+    download_cache_control = "public, max-age=31536000, immutable"
 
 
 @lru_cache()
@@ -0,0 +1,157 @@
+import asyncio
+import io
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Sequence
+
+from PIL import Image, ImageOps, features
+
+from app.metrics import stage
+
+# Recorded by the process running the transform, so in the "process" mode
+# only the whole transform is measured, by ImageTransformer.
+DECODE_SECONDS = stage("decode")
+EXIF_TRANSPOSE_SECONDS = stage("exif_transpose")
+THUMBNAIL_SECONDS = stage("thumbnail")
+ENCODE_SECONDS = stage("encode")
+
+
+class TransformQueueFullError(Exception):
+    pass
+
+
+class ImageTooLargeError(Exception):
+    pass
+
+
+def transform_image(
+    content: bytes | BinaryIO,
+    sizes: Sequence[tuple[int, int]],
+    max_pixels: int | None = None,
+) -> list[bytes]:
+    """Encodes one thumbnail per size, in the order of ``sizes``.
+
+    The upload is decoded once; each smaller size is scaled down from the
+    next larger thumbnail rather than from the full image. JPEGs are decoded
+    at a reduced scale close to the largest size, and images with more than
+    ``max_pixels`` pixels are rejected from their header, before decoding.
+    A file object is read by Pillow directly, without copying it into memory.
+    """
+    try:
+        image = Image.open(
+            io.BytesIO(content) if isinstance(content, bytes) else content
+        )
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning) as error:
+        # Pillow refuses images far above its own limit while opening them,
+        # before max_pixels is checked; the warning is only raised when
+        # warnings are turned into errors.
+        raise ImageTooLargeError(str(error)) from error
+    image_format = image.format
+    width, height = image.size
+    if max_pixels is not None and width * height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image has {width * height} pixels, at most {max_pixels} are allowed"
+        )
+    # The EXIF orientation may swap width and height, so draft to a square.
+    # draft never scales below the requested size, which leaves the final
+    # antialiased resample to produce the thumbnail itself.
+    draft_side = max(max(size) for size in sizes)
+    with DECODE_SECONDS.time():
+        image.draft(None, (draft_side, draft_side))
+        image.load()
+    with EXIF_TRANSPOSE_SECONDS.time():
+        image = ImageOps.exif_transpose(image)
+    thumbnails = {}
+    for size in sorted(set(sizes), reverse=True):
+        with THUMBNAIL_SECONDS.time():
+            image = image.copy()
+            image.thumbnail(size, Image.ANTIALIAS)
+        with ENCODE_SECONDS.time():
+            cropped_image_bytes = io.BytesIO()
+            image.save(cropped_image_bytes, format=image_format)
+        thumbnails[size] = cropped_image_bytes.getvalue()
+    return [thumbnails[size] for size in sizes]
+
+
+def supported_formats(image_formats: Sequence[str]) -> list[str]:
+    Image.init()
+    return [
+        image_format
+        for image_format in image_formats
+        if image_format.upper() in Image.SAVE
+        and (image_format.lower() != "webp" or features.check("webp"))
+    ]
+
+
+def encode_image(content: bytes, image_format: str, quality: int = 80) -> bytes:
+    # Variants carry no EXIF, so the orientation is applied to the pixels.
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(content)))
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    encoded_image_bytes = io.BytesIO()
+    image.save(encoded_image_bytes, format=image_format.upper(), quality=quality)
+    return encoded_image_bytes.getvalue()
+
+
+class ImageTransformer:
+    """Runs transform_image and encode_image off the event loop.
+
+    ``mode`` is one of ``inline`` (on the calling coroutine), ``thread`` or
+    ``process``. At most ``queue_size`` transforms may be running or waiting
+    for a worker; further calls raise TransformQueueFullError.
+    """
+
+    modes = ("inline", "thread", "process")
+
+    def __init__(
+        self, mode: str = "thread", max_workers: int | None = None, queue_size: int = 64
+    ):
+        if mode not in ImageTransformer.modes:
+            raise ValueError(f"Unknown image transform mode {mode}")
+        self.mode = mode
+        self.queue_size = queue_size
+        self.pending = 0
+        self.executor = self._create_executor(mode, max_workers)
+
+    @staticmethod
+    def _create_executor(mode: str, max_workers: int | None) -> Executor | None:
+        if mode == "thread":
+            return ThreadPoolExecutor(max_workers, thread_name_prefix="image_transform")
+        if mode == "process":
+            return ProcessPoolExecutor(max_workers)
+        return None
+
+    async def transform(
+        self,
+        content: bytes | BinaryIO,
+        sizes: Sequence[tuple[int, int]],
+        max_pixels: int | None = None,
+    ) -> list[bytes]:
+        if self.mode == "process" and not isinstance(content, bytes):
+            # File objects cannot be sent to a worker process.
+            content = content.read()
+        return await self._run(transform_image, content, sizes, max_pixels)
+
+    async def encode(self, content: bytes, image_format: str, quality: int) -> bytes:
+        return await self._run(encode_image, content, image_format, quality)
+
+    async def _run(self, function: Callable, *args: Any) -> Any:
+        if self.pending >= self.queue_size:
+            raise TransformQueueFullError(
+                f"{self.pending} image transforms are already queued"
+            )
+        self.pending += 1
+        try:
+            # Includes the wait for a worker, unlike the stages inside.
+            with stage(function.__name__).time():
+                if self.executor is None:
+                    return function(*args)
+                return await asyncio.get_running_loop().run_in_executor(
+                    self.executor, function, *args
+                )
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
@@ -1,89 +1,898 @@
-from datetime import datetime
-import io
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, replace
+from io import BytesIO
+from typing import BinaryIO, Callable, Iterable, Iterator, Sequence
 from uuid import uuid4, UUID
 
-from PIL import Image, ImageOps
+from bson import ObjectId
 from fastapi import UploadFile
+from PIL import UnidentifiedImageError
+from pymongo.errors import BulkWriteError, WriteError
+from starlette.concurrency import run_in_threadpool
 
-from app.file_system import AzureFileSystem
+from app.archive import iter_zip
+from app.background import BackgroundQueue, BackgroundQueueFullError
+from app.file_system import FileSystem, StoredFile
+from app.ranges import if_none_match_matches
 from app.schemas import ImageDocument
-from app.repositories import ImageRepository
+from app.repositories import AsyncImageRepository
+from app.transforms import (
+    ImageTooLargeError,
+    ImageTransformer,
+    TransformQueueFullError,
+)
+
+
+@dataclass
+class NotModified:
+    etag: str
 
 
 class ImageUseCase(ABC):
-    def __init__(self, repository: ImageRepository, file_system: AzureFileSystem):
+    def __init__(self, repository: AsyncImageRepository, file_system: FileSystem):
         self.repository = repository
         self.file_system = file_system
 
+    async def _release_blob(self, content_hash: str) -> None:
+        """Drops a reference to a blob, deleting its files with the last one."""
+        blob = await self.repository.release_blob(content_hash)
+        if blob is None or blob["refcount"] > 0:
+            return
+        if not await self.repository.delete_blob(content_hash):
+            return
+        await run_in_threadpool(
+            self.file_system.delete_files,
+            file_names=[
+                blob["stored_file_name"],
+                *(blob.get("renditions") or {}).values(),
+                *(blob.get("variants") or []),
+            ],
+            file_path=blob["file_path"],
+        )
+
     @abstractmethod
-    def execute(
+    async def execute(
         self, *args, **kwargs
-    ) -> dict[str, str] | list[dict] | tuple[bytes, str] | bool:
+    ) -> dict[str, str] | Iterable[
+        dict
+    ] | list | StoredFile | NotModified | str | bool | None:
         raise NotImplementedError
 
 
+def rendition_file_name(file_name: str, rendition: str) -> str:
+    stem, extension = os.path.splitext(file_name)
+    return f"{stem}_{rendition}{extension}"
+
+
+def variant_file_name(file_name: str, image_format: str) -> str:
+    return f"{os.path.splitext(file_name)[0]}.{image_format}"
+
+
+def hash_file(file: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    while chunk := file.read(chunk_size):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_etag(content_hash: str, file_name: str) -> str:
+    """Strong ETag of a stored file of an image. Every file is derived from
+    the upload and never rewritten, so upload hash and name identify it."""
+    return f'"{hashlib.sha256(f"{content_hash}/{file_name}".encode()).hexdigest()}"'
+
+
+# Directory of the files shared by deduplicated uploads, one subdirectory
+# per blob named "{content_hash}.{uuid of the upload that stored it}".
+BLOB_DIRECTORY = "_blobs"
+# Directory of the uploaded files of images still processed in the background.
+PENDING_DIRECTORY = "_pending"
+
+
+def main_file_name(document: dict) -> str:
+    """Name of the main file of an image in its file_path."""
+    return document.get("stored_file_name") or document["file_name"]
+
+
+def is_ready(document: dict) -> bool:
+    """Whether the files of an image are stored, i.e. it is not processed in
+    the background or failed there."""
+    return document.get("status") in (None, "ready")
+
+
+def with_blob(document: dict, blob: dict) -> dict:
+    return document | {
+        "file_path": blob["file_path"],
+        "stored_file_name": blob["stored_file_name"],
+        "renditions": blob["renditions"],
+        "variants": blob.get("variants") or None,
+    }
+
+
 class ImageUploadUseCase(ImageUseCase):
     image_size = (768, 768)
 
-    def execute(
+    def __init__(
+        self,
+        repository: AsyncImageRepository,
+        file_system: FileSystem,
+        transformer: ImageTransformer,
+        rendition_sizes: Sequence[int] = (),
+        keep_original: bool = False,
+        max_pixels: int | None = None,
+        deduplicate: bool = False,
+    ):
+        super().__init__(repository, file_system)
+        self.transformer = transformer
+        self.rendition_sizes = rendition_sizes
+        self.keep_original = keep_original
+        self.max_pixels = max_pixels
+        self.deduplicate = deduplicate
+
+    async def _prepare(
+        self,
+        file: UploadFile,
+        client_id: str,
+        processed: bool,
+        origin_uuid: None | str,
+        uuid: UUID | None = None,
+    ) -> tuple[UUID, dict, dict[str, bytes | BinaryIO]]:
+        """Returns the uuid and document of the upload and the files to store.
+
+        When deduplicating, an upload whose content is already stored takes a
+        reference to the existing blob and has no files to store; otherwise
+        its files are named for a new blob directory.
+        """
+        uuid = uuid or uuid4()
+        file.file.seek(0)
+        content_hash = await run_in_threadpool(hash_file, file.file)
+        file_path = client_id + "/" + str(uuid)
+        stored_file_name = None
+        blob = None
+        if self.deduplicate:
+            blob = await self.repository.acquire_blob(content_hash)
+            file_path = f"{BLOB_DIRECTORY}/{content_hash}.{uuid}"
+            stored_file_name = "image" + os.path.splitext(file.filename)[1].lower()
+        files = {}
+        renditions = {}
+        if blob is None:
+            file_name = stored_file_name or file.filename
+            # Pillow reads the spooled upload itself; it is never loaded as a
+            # whole.
+            file.file.seek(0)
+            cropped_image_bytes, *thumbnails = await self.transformer.transform(
+                file.file,
+                [ImageUploadUseCase.image_size]
+                + [(size, size) for size in self.rendition_sizes],
+                self.max_pixels,
+            )
+            files[file_name] = cropped_image_bytes
+            for size, thumbnail in zip(self.rendition_sizes, thumbnails):
+                renditions[str(size)] = rendition_file_name(file_name, str(size))
+                files[renditions[str(size)]] = thumbnail
+            if self.keep_original:
+                renditions["original"] = rendition_file_name(file_name, "original")
+                file.file.seek(0)
+                files[renditions["original"]] = file.file
+        document = ImageDocument(
+            file_path=file_path,
+            uuid=str(uuid),
+            client_id=client_id,
+            file_name=file.filename,
+            content_type=file.content_type,
+            tags={
+                "origin_uuid": origin_uuid,
+                "processed": processed,
+                "timestamp": datetime.now().isoformat(),
+            },
+            renditions=renditions or None,
+            content_hash=content_hash,
+            stored_file_name=stored_file_name,
+            status="ready",
+        ).dict()
+        if blob is not None:
+            document = with_blob(document, blob)
+        return uuid, document, files
+
+    async def _store(
+        self, uuid: UUID, document: dict, files: dict[str, bytes | BinaryIO]
+    ) -> dict:
+        """Stores the files of a prepared upload and returns its document."""
+        if document["stored_file_name"] is None:
+            await run_in_threadpool(
+                self.file_system.upload_files,
+                files=files,
+                client_id=document["client_id"],
+                uuid=uuid,
+            )
+            return document
+        if not files:
+            return document
+        content_hash = document["content_hash"]
+        await run_in_threadpool(
+            self.file_system.upload_files,
+            files=files,
+            client_id=BLOB_DIRECTORY,
+            uuid=f"{content_hash}.{uuid}",
+        )
+        blob = await self.repository.register_blob(
+            content_hash,
+            {
+                "file_path": document["file_path"],
+                "stored_file_name": document["stored_file_name"],
+                "renditions": document["renditions"],
+                "variants": [],
+            },
+        )
+        if blob["file_path"] == document["file_path"]:
+            return document
+        # A concurrent upload of the same content registered its blob first.
+        await run_in_threadpool(
+            self.file_system.delete_files,
+            file_names=list(files),
+            file_path=document["file_path"],
+        )
+        return with_blob(document, blob)
+
+    async def _discard(self, document: dict, file_names: list[str]) -> None:
+        """Undoes _store for an image whose document was not written."""
+        if document["stored_file_name"]:
+            await self._release_blob(document["content_hash"])
+            return
+        await run_in_threadpool(
+            self.file_system.delete_files,
+            file_names=file_names,
+            file_path=document["file_path"],
+        )
+
+    async def execute(
         self, file: UploadFile, body: dict, processed: bool, origin_uuid: None | str
     ) -> dict[str, str]:
         client_id = body["client_id"]
+        uuid, document, files = await self._prepare(
+            file, client_id, processed, origin_uuid
+        )
+        document = await self._store(uuid, document, files)
+        try:
+            await self.repository.put_image(document)
+        except Exception:
+            await self._discard(document, list(files))
+            raise
+        return {"uuid": str(uuid)}
+
+
+class ImageBatchUploadUseCase(ImageUploadUseCase):
+    """Uploads several images for one client.
+
+    All images are transformed concurrently, then their files are uploaded
+    concurrently, and the documents of the images whose files were stored are
+    written with a single insert_many. Returns, in the order of ``files``,
+    either the uuid of each stored image or the exception that stopped it; the
+    files of an image whose document could not be written are removed again.
+    """
+
+    async def execute(
+        self,
+        files: list[UploadFile],
+        body: dict,
+        processed: bool,
+        origin_uuid: None | str,
+    ) -> list[UUID | Exception]:
+        client_id = body["client_id"]
+        results = await asyncio.gather(
+            *(self._prepare(file, client_id, processed, origin_uuid) for file in files),
+            return_exceptions=True,
+        )
+        prepared = {
+            index: result
+            for index, result in enumerate(results)
+            if not isinstance(result, Exception)
+        }
+        stored = await asyncio.gather(
+            *(
+                self._store(uuid, document, image_files)
+                for uuid, document, image_files in prepared.values()
+            ),
+            return_exceptions=True,
+        )
+        written = {}
+        for (index, (uuid, _, _)), document in zip(prepared.items(), stored):
+            results[index] = document if isinstance(document, Exception) else uuid
+            if not isinstance(document, Exception):
+                written[index] = document
+        if written:
+            indexes = list(written)
+            errors = await self._put_documents(list(written.values()))
+            for position, error in errors.items():
+                index = indexes[position]
+                results[index] = error
+                await self._discard(written[index], list(prepared[index][2]))
+        return results
+
+    async def _put_documents(self, documents: list[dict]) -> dict[int, Exception]:
+        """Writes the documents; returns the error of each one that was not
+        written, by position."""
+        try:
+            await self.repository.put_images(documents)
+        except BulkWriteError as error:
+            # insert_many is unordered, so every other document was written.
+            return {
+                write_error["index"]: WriteError(
+                    write_error["errmsg"], write_error["code"], write_error
+                )
+                for write_error in error.details["writeErrors"]
+            }
+        return {}
+
+
+class ImageBackgroundUploadUseCase(ImageUploadUseCase):
+    """Accepts an upload and processes it on a background queue.
+
+    The uploaded file is stored as is and the image is recorded as pending,
+    so the request only waits for those two writes. A queue worker then
+    transforms and stores the image like ImageUploadUseCase, marks it ready
+    and removes the uploaded file. Images that are not valid are marked
+    failed at once; other errors are retried by the queue before that.
+
+    Jobs only live in memory, so ``recover`` queues again the uploads that
+    are still pending long after they were accepted, e.g. because the process
+    that accepted them stopped.
+    """
+
+    projection = {
+        "_id": 0,
+        "client_id": 1,
+        "file_name": 1,
+        "file_path": 1,
+        "content_type": 1,
+        "tags": 1,
+        "status": 1,
+        "content_hash": 1,
+    }
+
+    def __init__(
+        self,
+        repository: AsyncImageRepository,
+        file_system: FileSystem,
+        transformer: ImageTransformer,
+        queue: BackgroundQueue,
+        rendition_sizes: Sequence[int] = (),
+        keep_original: bool = False,
+        max_pixels: int | None = None,
+        deduplicate: bool = False,
+    ):
+        super().__init__(
+            repository,
+            file_system,
+            transformer,
+            rendition_sizes,
+            keep_original,
+            max_pixels,
+            deduplicate,
+        )
+        self.queue = queue
+        # Uploads queued by this process and not finished yet.
+        self.queued: set[UUID] = set()
+        self.logger = logging.getLogger("image_service")
+
+    async def _accept(
+        self,
+        file: UploadFile,
+        client_id: str,
+        processed: bool,
+        origin_uuid: None | str,
+    ) -> UUID:
         uuid = uuid4()
-        bytes_io = io.BytesIO(file.file.read())
-        image = Image.open(bytes_io)
-        image_format = image.format
-        image = ImageOps.exif_transpose(image)
-        image.thumbnail(ImageUploadUseCase.image_size, Image.ANTIALIAS)
-        cropped_image_bytes = io.BytesIO()
-        image.save(cropped_image_bytes, format=image_format)
-        cropped_image_bytes.seek(0)
-        self.repository.put_image(
-            ImageDocument(
-                file_path=client_id + "/" + str(uuid),
-                uuid=str(uuid),
-                client_id=client_id,
-                file_name=file.filename,
-                content_type=file.content_type,
-                tags={
-                    "origin_uuid": origin_uuid,
-                    "processed": processed,
-                    "timestamp": datetime.now().isoformat(),
-                },
-            ).dict()
-        )
-        self.file_system.upload_file(
-            file_name=file.filename,
-            file_content=cropped_image_bytes.read(),
-            client_id=client_id,
+        file.file.seek(0)
+        await run_in_threadpool(
+            self.file_system.upload_files,
+            files={file.filename: file.file},
+            client_id=PENDING_DIRECTORY,
             uuid=uuid,
         )
-        return {"uuid": str(uuid)}
+        document = ImageDocument(
+            file_path=PENDING_DIRECTORY + "/" + str(uuid),
+            uuid=str(uuid),
+            client_id=client_id,
+            file_name=file.filename,
+            content_type=file.content_type,
+            tags={
+                "origin_uuid": origin_uuid,
+                "processed": processed,
+                "timestamp": datetime.now().isoformat(),
+            },
+            status="pending",
+        ).dict()
+        await self.repository.put_image(document)
+        return uuid
+
+    async def _store_pending(self, uuid: UUID, pending: dict) -> dict | None:
+        """Stores the files of a pending upload and records them on its
+        document, which stays pending; returns the recorded document, or None
+        when the upload failed or was deleted meanwhile."""
+        content, _ = await run_in_threadpool(
+            self.file_system.download_file, pending["file_name"], pending["file_path"]
+        )
+        tags = pending["tags"]
+        try:
+            _, document, files = await self._prepare(
+                UploadFile(
+                    pending["file_name"], BytesIO(content), pending["content_type"]
+                ),
+                pending["client_id"],
+                tags["processed"],
+                tags["origin_uuid"],
+                uuid,
+            )
+        except (ImageTooLargeError, UnidentifiedImageError) as error:
+            await self._fail(uuid, error)
+            return None
+        document = await self._store(uuid, document, files)
+        document |= {"tags": tags, "status": "pending"}
+        if await self.repository.update_image(uuid, document):
+            return document
+        # Deleted meanwhile, together with the uploaded file; what was stored
+        # for it is no longer referenced.
+        await self._discard(document, list(files))
+        return None
+
+    async def _process(self, uuid: UUID) -> None:
+        """Stores a pending upload and marks it ready.
+
+        Attempts are idempotent: once the stored files are recorded on the
+        document, which carries their content_hash from then on, a retry does
+        not store them or take a blob reference again.
+        """
+        pending = await self.repository.query_image(
+            field_key="uuid",
+            field_value=str(uuid),
+            projection=ImageBackgroundUploadUseCase.projection,
+        )
+        if not pending or pending.get("status") != "pending":
+            # Deleted while it was queued, or already processed.
+            return
+        if not pending.get("content_hash"):
+            pending = await self._store_pending(uuid, pending)
+            if pending is None:
+                return
+        await self.repository.update_image(uuid, {"status": "ready"})
+        try:
+            await run_in_threadpool(
+                self.file_system.delete_files,
+                file_names=[pending["file_name"]],
+                file_path=PENDING_DIRECTORY + "/" + str(uuid),
+            )
+        except Exception as error:
+            # The image is stored; a retry would find it ready and stop.
+            self.logger.warning(
+                f"Could not delete the uploaded file of {uuid}: {error!r}"
+            )
+
+    async def _fail(self, uuid: UUID, error: Exception) -> None:
+        # The uploaded file is kept, so deleting the image still removes it.
+        self.logger.error(f"Processing upload {uuid} failed: {error!r}")
+        await self.repository.update_image(uuid, {"status": "failed"})
+
+    def _submit(self, uuid: UUID) -> None:
+        """Queues the processing of an upload in a reserved slot."""
+        self.queued.add(uuid)
+
+        async def process() -> None:
+            await self._process(uuid)
+            self.queued.discard(uuid)
+
+        async def fail(error: Exception) -> None:
+            self.queued.discard(uuid)
+            await self._fail(uuid, error)
+
+        self.queue.submit(process, fail)
+
+    async def requeue(self, older_than: float) -> int:
+        """Queues the pending uploads accepted more than ``older_than`` seconds
+        ago that this process has not queued, as long as there are free slots;
+        returns how many were queued."""
+        cutoff = (datetime.now() - timedelta(seconds=older_than)).isoformat()
+        documents = await self.repository.query_images(
+            "status", "pending", {"_id": 0, "uuid": 1, "tags": 1}
+        )
+        uuids = [
+            UUID(document["uuid"])
+            for document in documents
+            if document["tags"]["timestamp"] < cutoff
+        ]
+        queued = 0
+        for uuid in uuids:
+            if uuid in self.queued:
+                continue
+            try:
+                self.queue.reserve()
+            except BackgroundQueueFullError:
+                # The rest are queued by a later call.
+                break
+            self._submit(uuid)
+            queued += 1
+        if queued:
+            self.logger.warning(f"Queued {queued} stale pending uploads again")
+        return queued
+
+    async def recover(self, older_than: float) -> None:
+        """Calls requeue every ``older_than`` seconds until cancelled."""
+        while True:
+            try:
+                await self.requeue(older_than)
+            except Exception as error:
+                self.logger.error(f"Could not requeue pending uploads: {error!r}")
+            await asyncio.sleep(older_than)
+
+    async def execute(
+        self, file: UploadFile, body: dict, processed: bool, origin_uuid: None | str
+    ) -> dict[str, str]:
+        self.queue.reserve()
+        try:
+            uuid = await self._accept(file, body["client_id"], processed, origin_uuid)
+        except BaseException:
+            self.queue.release()
+            raise
+        self._submit(uuid)
+        return {"uuid": str(uuid), "status": "pending"}
 
 
 class ImageDeleteUseCase(ImageUseCase):
-    def execute(self, uuid: UUID) -> bool:
-        document = self.repository.query_image(field_key="uuid", field_value=str(uuid))
+    projection = {
+        "_id": 0,
+        "file_name": 1,
+        "file_path": 1,
+        "renditions": 1,
+        "variants": 1,
+        "content_hash": 1,
+        "stored_file_name": 1,
+    }
+
+    async def _delete_blob_image(self, uuid: UUID | str, content_hash: str) -> bool:
+        # The files belong to the blob, which may be shared. Only the call
+        # that removed the document holds its reference, so a concurrent
+        # delete of the same image cannot release the blob twice.
+        if not await self.repository.delete_image(uuid):
+            return False
+        await self._release_blob(content_hash)
+        return True
+
+    async def execute(self, uuid: UUID) -> bool:
+        document = await self.repository.query_image(
+            field_key="uuid",
+            field_value=str(uuid),
+            projection=ImageDeleteUseCase.projection,
+        )
         if not document:
             return False
-        self.file_system.delete_file(
-            file_name=document["file_name"], file_path=document["file_path"]
+        if document.get("stored_file_name"):
+            return await self._delete_blob_image(uuid, document["content_hash"])
+        await run_in_threadpool(
+            self.file_system.delete_files,
+            file_names=[
+                document["file_name"],
+                *(document.get("renditions") or {}).values(),
+                *(document.get("variants") or []),
+            ],
+            file_path=document["file_path"],
         )
-        self.repository.delete_image(uuid)
-        return True
+        return await self.repository.delete_image(uuid)
+
+
+class ImageBulkDeleteUseCase(ImageDeleteUseCase):
+    """Deletes many images, selected by uuid or by client_id.
+
+    The documents are fetched with one query and removed with one
+    delete_many. At most ``max_concurrency`` image directories are deleted
+    from the share at a time. Returns, per requested uuid (or per image of
+    the client), True when deleted, False when not found, or the exception
+    that stopped it; an image whose files could not be deleted keeps its
+    document so it can be deleted again. The documents of deduplicated
+    images are removed with one pop_images, and each removed document then
+    releases its blob, at most ``max_concurrency`` at a time.
+    """
+
+    projection = ImageDeleteUseCase.projection | {"uuid": 1}
+
+    def __init__(
+        self,
+        repository: AsyncImageRepository,
+        file_system: FileSystem,
+        max_concurrency: int = 16,
+    ):
+        super().__init__(repository, file_system)
+        self.max_concurrency = max_concurrency
+
+    async def _delete_files(self, document: dict, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            await run_in_threadpool(
+                self.file_system.delete_files,
+                file_names=[
+                    document["file_name"],
+                    *(document.get("renditions") or {}).values(),
+                    *(document.get("variants") or []),
+                ],
+                file_path=document["file_path"],
+            )
+
+    async def _release(self, content_hash: str, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            await self._release_blob(content_hash)
+
+    async def _delete_blob_images(
+        self, documents: list[dict], semaphore: asyncio.Semaphore
+    ) -> dict[str, bool | Exception]:
+        # Only the documents this call removed hold a reference it may
+        # release, so a concurrent delete cannot release a blob twice.
+        removed = await self.repository.pop_images(
+            [document["uuid"] for document in documents],
+            {"_id": 0, "uuid": 1, "content_hash": 1},
+        )
+        releases = await asyncio.gather(
+            *(
+                self._release(document["content_hash"], semaphore)
+                for document in removed
+            ),
+            return_exceptions=True,
+        )
+        return {
+            document["uuid"]: True if error is None else error
+            for document, error in zip(removed, releases)
+        }
+
+    async def execute(
+        self, uuids: list[UUID] | None = None, client_id: str | None = None
+    ) -> dict[str, bool | Exception]:
+        if uuids is not None:
+            requested = list(dict.fromkeys(str(uuid) for uuid in uuids))
+            documents = await self.repository.query_images(
+                "uuid", requested, ImageBulkDeleteUseCase.projection
+            )
+        else:
+            documents = await self.repository.query_images(
+                "client_id", client_id, ImageBulkDeleteUseCase.projection
+            )
+            requested = [document["uuid"] for document in documents]
+        results: dict[str, bool | Exception] = dict.fromkeys(requested, False)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        blob_documents = [
+            document for document in documents if document.get("stored_file_name")
+        ]
+        documents = [
+            document for document in documents if not document.get("stored_file_name")
+        ]
+        deletes = await asyncio.gather(
+            *(self._delete_files(document, semaphore) for document in documents),
+            return_exceptions=True,
+        )
+        for document, error in zip(documents, deletes):
+            results[document["uuid"]] = True if error is None else error
+        deleted = [
+            document["uuid"]
+            for document in documents
+            if results[document["uuid"]] is True
+        ]
+        if deleted:
+            await self.repository.delete_images(deleted)
+        if blob_documents:
+            results |= await self._delete_blob_images(blob_documents, semaphore)
+        return results
+
+
+class ImageExportUseCase(ImageUseCase):
+    projection = {
+        "_id": 0,
+        "uuid": 1,
+        "file_name": 1,
+        "file_path": 1,
+        "renditions": 1,
+        "stored_file_name": 1,
+        "status": 1,
+    }
+
+    def __init__(
+        self,
+        repository: AsyncImageRepository,
+        file_system: FileSystem,
+        concurrency: int = 8,
+    ):
+        super().__init__(repository, file_system)
+        self.concurrency = concurrency
+
+    def _fetch(self, file_name: str, file_path: str) -> Callable[[], bytes]:
+        return lambda: self.file_system.download_file(file_name, file_path)[0]
+
+    async def execute(
+        self, uuids: list[UUID] | None = None, client_id: str | None = None
+    ) -> Iterator[bytes] | None:
+        """Returns a streamed ZIP archive of the stored files of the selected
+        images, one directory per uuid, or None when no image matches."""
+        if uuids is not None:
+            documents = await self.repository.query_images(
+                "uuid", [str(uuid) for uuid in uuids], ImageExportUseCase.projection
+            )
+        else:
+            documents = await self.repository.query_images(
+                "client_id", client_id, ImageExportUseCase.projection
+            )
+        documents = [document for document in documents if is_ready(document)]
+        if not documents:
+            return None
+        entries = [
+            (
+                f"{document['uuid']}/{file_name}",
+                self._fetch(stored_file_name, document["file_path"]),
+            )
+            for document in documents
+            for file_name, stored_file_name in [
+                (document["file_name"], main_file_name(document)),
+                *(
+                    (rendition_file_name(document["file_name"], rendition), name)
+                    for rendition, name in (document.get("renditions") or {}).items()
+                ),
+            ]
+        ]
+        return iter_zip(entries, self.concurrency)
 
 
 class ImageMetadataUseCase(ImageUseCase):
-    def execute(self, client_id: str) -> list[dict]:
-        return self.repository.query_images("client_id", client_id)
+    projection = {field: 1 for field in ImageDocument.__fields__}
+
+    async def execute(
+        self,
+        client_id: str,
+        limit: int | None = None,
+        after: tuple[str, ObjectId] | None = None,
+    ) -> Iterable[dict]:
+        return await self.repository.find_images(
+            "client_id", client_id, ImageMetadataUseCase.projection, after, limit or 0
+        )
 
 
 class ImageDownloadUseCase(ImageUseCase):
-    def execute(self, uuid: UUID) -> tuple[bytes, str] | tuple[None, None]:
-        document = self.repository.query_image(field_key="uuid", field_value=str(uuid))
-        if not document:
-            return None, None
-        return self.file_system.download_file(
-            file_name=document["file_name"], file_path=document["file_path"]
+    projection = {
+        "_id": 0,
+        "uuid": 1,
+        "client_id": 1,
+        "file_name": 1,
+        "file_path": 1,
+        "renditions": 1,
+        "variants": 1,
+        "content_hash": 1,
+        "stored_file_name": 1,
+        "status": 1,
+    }
+
+    def __init__(
+        self,
+        repository: AsyncImageRepository,
+        file_system: FileSystem,
+        transformer: ImageTransformer | None = None,
+        variant_formats: Sequence[str] = (),
+        variant_quality: int = 80,
+    ):
+        super().__init__(repository, file_system)
+        self.transformer = transformer
+        self.variant_formats = variant_formats
+        self.variant_quality = variant_quality
+
+    def _variant_format(
+        self, file_name: str, accepted_formats: Sequence[str]
+    ) -> str | None:
+        if self.transformer is None:
+            return None
+        extension = os.path.splitext(file_name)[1].lower().lstrip(".")
+        for image_format in accepted_formats:
+            if image_format == extension or (
+                image_format == "jpeg" and extension == "jpg"
+            ):
+                return None
+            if image_format in self.variant_formats:
+                return image_format
+        return None
+
+    async def _has_variant(self, document: dict, variant_name: str) -> bool:
+        if variant_name in (document.get("variants") or []):
+            return True
+        if not document.get("stored_file_name"):
+            return False
+        # Another image with the same content may have created the variant
+        # of the shared blob since this one was uploaded.
+        blob = await self.repository.query_blob(document["content_hash"])
+        if blob is None or variant_name not in (blob.get("variants") or []):
+            return False
+        await self.repository.add_variant(document["uuid"], variant_name)
+        return True
+
+    async def _variant(self, document: dict, file_name: str, image_format: str) -> str:
+        variant_name = variant_file_name(file_name, image_format)
+        if await self._has_variant(document, variant_name):
+            return variant_name
+        content, _ = await run_in_threadpool(
+            self.file_system.download_file, file_name, document["file_path"]
+        )
+        encoded = await self.transformer.encode(
+            content, image_format, self.variant_quality
+        )
+        directory, name = document["file_path"].rsplit("/", 1)
+        await run_in_threadpool(
+            self.file_system.upload_files,
+            files={variant_name: encoded},
+            client_id=directory,
+            uuid=name,
+        )
+        await self.repository.add_variant(document["uuid"], variant_name)
+        if document.get("stored_file_name"):
+            await self.repository.add_blob_variant(
+                document["content_hash"], variant_name
+            )
+        return variant_name
+
+    async def execute(
+        self,
+        uuid: UUID,
+        size: str | None = None,
+        accepted_formats: Sequence[str] = (),
+        if_none_match: str | None = None,
+    ) -> StoredFile | NotModified | None:
+        """Opens the requested file of an image.
+
+        Images with a content hash are answered with NotModified when
+        ``if_none_match`` holds the ETag of the file that would be served,
+        without touching the file system.
+        """
+        document = await self.repository.query_image(
+            field_key="uuid",
+            field_value=str(uuid),
+            projection=ImageDownloadUseCase.projection,
         )
+        if not document or not is_ready(document):
+            return None
+        # Images uploaded before a rendition was configured only have the
+        # main file, which is served instead.
+        renditions = document.get("renditions") or {}
+        file_name = renditions.get(size, main_file_name(document))
+        image_format = self._variant_format(file_name, accepted_formats)
+        content_hash = document.get("content_hash")
+        if content_hash is not None:
+            etag = file_etag(
+                content_hash,
+                variant_file_name(file_name, image_format)
+                if image_format
+                else file_name,
+            )
+            if if_none_match_matches(if_none_match, etag):
+                return NotModified(etag)
+        if image_format is not None:
+            try:
+                file_name = await self._variant(document, file_name, image_format)
+            except TransformQueueFullError:
+                pass
+        stored_file = await run_in_threadpool(
+            self.file_system.open_file,
+            file_name=file_name,
+            file_path=document["file_path"],
+        )
+        if content_hash is None:
+            return stored_file
+        return replace(
+            stored_file, etag=file_etag(content_hash, file_name), immutable=True
+        )
+
+
+class ImageStatusUseCase(ImageUseCase):
+    projection = {"_id": 0, "status": 1}
+
+    async def execute(self, uuid: UUID) -> str | None:
+        document = await self.repository.query_image(
+            field_key="uuid",
+            field_value=str(uuid),
+            projection=ImageStatusUseCase.projection,
+        )
+        if not document:
+            return None
+        return document.get("status") or "ready"
@@ -0,0 +1,24 @@
+import statistics
+import time
+from typing import Callable
+
+
+def measure(func: Callable[[], object], iterations: int) -> list[float]:
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(latencies: list[float]) -> dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1], 3),
+        "p99_ms": round(ordered[int(len(ordered) * 0.99) - 1], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
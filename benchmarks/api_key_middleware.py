@@ -0,0 +1,146 @@
+"""Per-request overhead of the API key check, as a BaseHTTPMiddleware as it
+was before and as the pure ASGI ApiKeyMiddleware.
+
+Both applications have the service's middleware order and answer the health
+route and a download streamed in chunks of the Azure download chunk size, so
+the difference is the cost of the middleware alone:
+
+    python -m benchmarks.api_key_middleware --iterations 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Callable
+
+from fastapi import FastAPI, Request
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+
+from app.middleware import ApiKeyMiddleware
+from benchmarks import summarize
+
+API_KEY = "benchmark-key"
+CHUNK_SIZE = 1024 * 1024
+
+
+def create_app(pure_asgi: bool, chunks: int) -> FastAPI:
+    app = FastAPI()
+    if pure_asgi:
+        app.add_middleware(ApiKeyMiddleware, api_key=API_KEY)
+    else:
+
+        @app.middleware("http")
+        async def check_api_key(request: Request, call_next: Callable) -> Response:
+            if "/health" in request.url.path or "/metrics" in request.url.path:
+                return await call_next(request)
+            if (
+                request.headers.get("Authorization") != API_KEY
+                and request.method != "OPTIONS"
+                and request.method != "POST"
+            ):
+                return JSONResponse(
+                    status_code=401, content={"message": "Unauthorized"}
+                )
+            return await call_next(request)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    chunk = b"\0" * CHUNK_SIZE
+
+    @app.get("/api/images/health")
+    async def health() -> Response:
+        return JSONResponse(content={"status": "ok"})
+
+    @app.get("/api/images/download/{uuid}")
+    async def download_image(uuid: str) -> Response:
+        return StreamingResponse(
+            (chunk for _ in range(chunks)), media_type="image/jpeg"
+        )
+
+    return app
+
+
+async def request(app: FastAPI, path: str) -> int:
+    """Sends a GET request; returns the number of body bytes received."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"authorization", API_KEY.encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("benchmark", 80),
+    }
+    complete = asyncio.Event()
+    received = False
+    size = 0
+
+    async def receive() -> dict:
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The client stays connected until the whole response has arrived.
+        await complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                complete.set()
+
+    await app(scope, receive, send)
+    complete.set()
+    return size
+
+
+async def measure(app: FastAPI, path: str, iterations: int) -> list[float]:
+    for _ in range(min(iterations, 100)):
+        await request(app, path)
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await request(app, path)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def run(iterations: int, chunks: int) -> dict:
+    results = {}
+    for name, path in [
+        ("health", "/api/images/health"),
+        ("download", "/api/images/download/uuid"),
+    ]:
+        path_results = {}
+        for pure_asgi in [False, True]:
+            app = create_app(pure_asgi, chunks)
+            middleware = "asgi" if pure_asgi else "base_http"
+            path_results[middleware] = summarize(await measure(app, path, iterations))
+        path_results["saved_mean_ms"] = round(
+            path_results["base_http"]["mean_ms"] - path_results["asgi"]["mean_ms"], 3
+        )
+        results[name] = path_results
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--chunks", type=int, default=4)
+    arguments = parser.parse_args()
+    print(
+        json.dumps(asyncio.run(run(arguments.iterations, arguments.chunks)), indent=2)
+    )
@@ -0,0 +1,111 @@
+"""Album upload time, one request per photo against one batch request.
+
+Authentication, MongoDB and Azure calls are replaced by fakes that sleep for
+a fixed round trip, while the images are really transformed:
+
+    python -m benchmarks.batch_upload --photos 30
+"""
+import argparse
+import asyncio
+import io
+import json
+import time
+from unittest.mock import Mock
+
+from PIL import Image
+from starlette.datastructures import UploadFile
+
+from app.handlers import BatchUploadHandler, UploadHandler
+from app.transforms import ImageTransformer
+from app.usecases import ImageBatchUploadUseCase, ImageUploadUseCase
+
+
+class FakeHttpClient:
+    def __init__(self, round_trip: float):
+        self.round_trip = round_trip
+
+    async def get(self, token: str) -> Mock:
+        await asyncio.sleep(self.round_trip)
+        response = Mock(status_code=200)
+        response.json.return_value = {"client_id": "client"}
+        return response
+
+
+class FakeRepository:
+    def __init__(self, round_trip: float):
+        self.round_trip = round_trip
+
+    async def put_image(self, image: dict) -> None:
+        await asyncio.sleep(self.round_trip)
+
+    async def put_images(self, images: list[dict]) -> None:
+        await asyncio.sleep(self.round_trip)
+
+
+class FakeFileSystem:
+    def __init__(self, round_trip: float):
+        self.round_trip = round_trip
+
+    def upload_files(self, files: dict, uuid: object, client_id: str) -> None:
+        # One round trip for the directory and one per file.
+        time.sleep(self.round_trip * (1 + len(files)))
+
+
+def create_photo() -> bytes:
+    bytes_io = io.BytesIO()
+    Image.effect_noise((2000, 1500), 64).convert("RGB").save(bytes_io, "JPEG")
+    return bytes_io.getvalue()
+
+
+def album(photo: bytes, photos: int) -> list[UploadFile]:
+    return [
+        UploadFile(f"photo_{index}.jpeg", io.BytesIO(photo), "image/jpeg")
+        for index in range(photos)
+    ]
+
+
+async def run(photos: int, round_trip_ms: float) -> dict:
+    round_trip = round_trip_ms / 1000
+    photo = create_photo()
+    transformer = ImageTransformer("thread", queue_size=photos)
+    dependencies = (
+        FakeRepository(round_trip),
+        FakeFileSystem(round_trip),
+        transformer,
+        [128, 384],
+        True,
+    )
+    http_client = FakeHttpClient(round_trip)
+    upload_handler = UploadHandler(ImageUploadUseCase(*dependencies), http_client)
+    batch_handler = BatchUploadHandler(
+        ImageBatchUploadUseCase(*dependencies), http_client, photos
+    )
+
+    start = time.perf_counter()
+    for file in album(photo, photos):
+        await upload_handler.handle(file, "token", False, None)
+    sequential_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    await batch_handler.handle(album(photo, photos), "token", False, None)
+    batch_ms = (time.perf_counter() - start) * 1000
+
+    transformer.shutdown()
+    return {
+        "photos": photos,
+        "sequential_ms": round(sequential_ms, 1),
+        "batch_ms": round(batch_ms, 1),
+        "speedup": round(sequential_ms / batch_ms, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--photos", type=int, default=30)
+    parser.add_argument("--round-trip-ms", type=float, default=20.0)
+    arguments = parser.parse_args()
+    print(
+        json.dumps(
+            asyncio.run(run(arguments.photos, arguments.round_trip_ms)), indent=2
+        )
+    )
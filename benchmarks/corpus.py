@@ -0,0 +1,103 @@
+"""Synthetic, reproducible image corpus for the benchmarks.
+
+Images cycle through photo and screenshot sizes, JPEG and PNG, and the
+EXIF orientations a phone camera writes, so uploads exercise reduced-scale
+decoding, alpha handling and exif_transpose. The same seed always produces
+the same bytes:
+
+    python -m benchmarks.corpus --count 12 --output /tmp/corpus
+"""
+import argparse
+import io
+import json
+import os
+import random
+from dataclasses import dataclass
+
+from PIL import Image
+
+# Size as stored, before EXIF rotation, format and EXIF orientation, where 1
+# is upright, 3 upside down and 6 and 8 turned by 90 degrees. PNGs are kept to
+# screenshot sizes, as photos arrive as JPEGs.
+SPECS = [
+    ((640, 480), "JPEG", 1),
+    ((1600, 1200), "JPEG", 6),
+    ((4032, 3024), "JPEG", 3),
+    ((4000, 3000), "JPEG", 8),
+    ((3024, 4032), "JPEG", 1),
+    ((1280, 720), "PNG", 1),
+    ((800, 600), "PNG", 6),
+    ((1920, 1080), "PNG", 1),
+]
+EXIF_ORIENTATION = 0x0112
+
+
+@dataclass
+class CorpusImage:
+    file_name: str
+    content_type: str
+    content: bytes
+    width: int
+    height: int
+    orientation: int
+
+
+def create_image(
+    rng: random.Random, size: tuple[int, int], image_format: str, orientation: int
+) -> bytes:
+    """Blurred noise, which compresses like a photo rather than a flat fill."""
+    width, height = size
+    tile = (max(width // 8, 1), max(height // 8, 1))
+    noise = Image.frombytes("RGB", tile, rng.randbytes(tile[0] * tile[1] * 3))
+    image = noise.resize(size, Image.Resampling.BILINEAR)
+    if image_format == "PNG":
+        image.putalpha(255)
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = orientation
+    bytes_io = io.BytesIO()
+    options = {"quality": 85} if image_format == "JPEG" else {"compress_level": 1}
+    image.save(bytes_io, image_format, exif=exif, **options)
+    return bytes_io.getvalue()
+
+
+def create_corpus(count: int, seed: int = 0) -> list[CorpusImage]:
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(count):
+        size, image_format, orientation = SPECS[index % len(SPECS)]
+        extension = "jpg" if image_format == "JPEG" else "png"
+        corpus.append(
+            CorpusImage(
+                file_name=f"image_{index}.{extension}",
+                content_type=f"image/{image_format.lower()}",
+                content=create_image(rng, size, image_format, orientation),
+                width=size[0],
+                height=size[1],
+                orientation=orientation,
+            )
+        )
+    return corpus
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True)
+    arguments = parser.parse_args()
+    os.makedirs(arguments.output, exist_ok=True)
+    manifest = []
+    for image in create_corpus(arguments.count, arguments.seed):
+        with open(os.path.join(arguments.output, image.file_name), "wb") as file:
+            file.write(image.content)
+        manifest.append(
+            {
+                "file_name": image.file_name,
+                "content_type": image.content_type,
+                "bytes": len(image.content),
+                "width": image.width,
+                "height": image.height,
+                "orientation": image.orientation,
+            }
+        )
+    print(json.dumps(manifest, indent=2))
@@ -0,0 +1,81 @@
+"""Upload latency against a fake share holding many client directories.
+
+Compares the previous listing-based directory check with the idempotent
+create used by AzureFileSystem:
+
+    python -m benchmarks.create_directories --clients 100000
+"""
+import argparse
+import json
+import time
+from collections import namedtuple
+from uuid import uuid4
+
+from app.file_system import AzureFileSystem
+from benchmarks import measure, summarize
+
+Directory = namedtuple("Directory", ["name"])
+
+
+class FakeFileService:
+    """Share with ``clients`` directories, listed in pages of 5000 like Azure."""
+
+    page_size = 5000
+
+    def __init__(self, clients: int, round_trip_ms: float):
+        self.directories = {f"client_{index}" for index in range(clients)}
+        self.round_trip = round_trip_ms / 1000
+
+    def list_directories_and_files(self, share_name: str):
+        for index, name in enumerate(sorted(self.directories)):
+            if index % self.page_size == 0:
+                time.sleep(self.round_trip)
+            yield Directory(name)
+
+    def create_directory(self, share_name, directory_name, fail_on_exist=False):
+        time.sleep(self.round_trip)
+        created = directory_name not in self.directories
+        self.directories.add(directory_name)
+        return created
+
+    def create_file_from_bytes(self, **kwargs) -> None:
+        time.sleep(self.round_trip)
+
+
+def listing_create_directories(self, client_id: str, uuid: str) -> None:
+    directories = self.file_service.list_directories_and_files(self.share_name)
+    if client_id not in [path.name for path in directories]:
+        self.file_service.create_directory(self.share_name, client_id)
+    self.file_service.create_directory(self.share_name, client_id + "/" + uuid)
+
+
+def upload(file_system: AzureFileSystem) -> None:
+    file_system.upload_file("image.png", b"image", uuid4(), "client_42")
+
+
+def run(clients: int, iterations: int, round_trip_ms: float) -> dict:
+    file_system = AzureFileSystem("account", "YWNjb3VudF9rZXk=", "share")
+    file_system.file_service = FakeFileService(clients, round_trip_ms)
+    results = {"clients": clients}
+    results["idempotent_create"] = summarize(
+        measure(lambda: upload(file_system), iterations)
+    )
+    file_system._create_directories = listing_create_directories.__get__(file_system)
+    results["share_listing"] = summarize(
+        measure(lambda: upload(file_system), iterations)
+    )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=100_000)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--round-trip-ms", type=float, default=2.0)
+    arguments = parser.parse_args()
+    print(
+        json.dumps(
+            run(arguments.clients, arguments.iterations, arguments.round_trip_ms),
+            indent=2,
+        )
+    )
@@ -0,0 +1,123 @@
+"""Per-request dependency resolution overhead of the download route.
+
+Resolves the route's dependencies the way FastAPI does for every request,
+once against the application container and once against a graph that is
+rebuilt per request, as it was before the container existed:
+
+    python -m benchmarks.dependencies --iterations 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+from unittest.mock import patch
+from uuid import uuid4
+
+from fastapi import Depends, FastAPI
+from fastapi.dependencies.utils import solve_dependencies
+from fastapi.routing import APIRoute
+from pymongo import MongoClient
+from starlette.requests import Request
+
+from app.container import Container, create_file_system
+from app.dependencies import get_download_handler
+from app.file_system import AzureFileSystem
+from app.handlers import DownloadHandler
+from app.main import app
+from app.repositories import AsyncImageRepository
+from app.settings import Settings
+from app.usecases import ImageDownloadUseCase
+from benchmarks import summarize
+
+settings = Settings(
+    mongo_uri="mongodb://localhost:27017",
+    mongo_db_name="benchmark",
+    mongo_collection="images",
+    azure_account_name="account",
+    azure_account_key="YWNjb3VudF9rZXk=",
+    azure_share_name="share",
+    authentication_url="http://localhost",
+    image_transform_mode="inline",
+)
+mongo_client = MongoClient(settings.mongo_uri, connect=False)
+
+
+def per_request_file_system() -> AzureFileSystem:
+    return create_file_system(settings)
+
+
+async def per_request_repository() -> AsyncImageRepository:
+    return AsyncImageRepository(
+        mongo_client, settings.mongo_db_name, settings.mongo_collection
+    )
+
+
+async def per_request_use_case(
+    repository: AsyncImageRepository = Depends(per_request_repository),
+    file_system: AzureFileSystem = Depends(per_request_file_system),
+) -> ImageDownloadUseCase:
+    return ImageDownloadUseCase(repository, file_system)
+
+
+async def per_request_handler(
+    use_case: ImageDownloadUseCase = Depends(per_request_use_case),
+) -> DownloadHandler:
+    return DownloadHandler(use_case)
+
+
+def download_route() -> APIRoute:
+    return next(
+        route
+        for route in app.routes
+        if isinstance(route, APIRoute) and route.name == "download_image"
+    )
+
+
+def request_for(fast_app: FastAPI) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": f"/images/download/{uuid4()}",
+            "headers": [],
+            "query_string": b"",
+            "path_params": {"uuid": str(uuid4())},
+            "app": fast_app,
+        }
+    )
+
+
+async def resolve(route: APIRoute, iterations: int) -> list[float]:
+    latencies = []
+    for _ in range(iterations):
+        request = request_for(app)
+        start = time.perf_counter()
+        await solve_dependencies(
+            request=request,
+            dependant=route.dependant,
+            dependency_overrides_provider=app,
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def run(iterations: int) -> dict:
+    route = download_route()
+    with patch("app.container.create_mongo_client", return_value=mongo_client):
+        app.state.container = Container(settings)
+    results = {"container": summarize(asyncio.run(resolve(route, iterations)))}
+    app.dependency_overrides[get_download_handler] = per_request_handler
+    try:
+        results["per_request_graph"] = summarize(
+            asyncio.run(resolve(route, iterations))
+        )
+    finally:
+        app.dependency_overrides.pop(get_download_handler)
+    asyncio.run(app.state.container.close())
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    print(json.dumps(run(parser.parse_args().iterations), indent=2))
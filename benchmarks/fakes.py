@@ -0,0 +1,340 @@
+"""In-process stand-ins for MongoDB, the Azure file share and the
+authentication service.
+
+Each one keeps its data in memory and sleeps for a configurable round trip
+per call, on the calling thread like the real blocking clients, so the
+service's own code runs unchanged on top of them:
+
+- FakeImageRepository replaces the pymongo-backed ImageRepository;
+- FakeFileService replaces the azure-storage FileService inside a real
+  AzureFileSystem, whose chunking, directory cache and metrics still run;
+- FakeAuthenticationHttpClient replaces the HTTP call inside the real
+  CachedAuthenticationHttpClient.
+"""
+import copy
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import BinaryIO, Iterator
+from uuid import UUID
+
+from bson import ObjectId
+from starlette.concurrency import run_in_threadpool
+
+from app.http_client import AUTHENTICATION_SECONDS, AuthenticationHttpClient
+from app.repositories import AsyncImageRepository, ImageRepository
+
+
+def project(document: dict, projection: dict | None) -> dict:
+    """Applies a MongoDB inclusion projection to a top-level document."""
+    if not projection:
+        return copy.deepcopy(document)
+    fields = [field for field, include in projection.items() if include]
+    if projection.get("_id", 1):
+        fields.append("_id")
+    return {
+        field: copy.deepcopy(document[field]) for field in fields if field in document
+    }
+
+
+class FakeImageRepository(ImageRepository):
+    def __init__(self, round_trip_ms: float = 1.0):
+        self.round_trip = round_trip_ms / 1000
+        self.images: dict[str, dict] = {}
+        self.blobs: dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def _round_trip(self) -> None:
+        time.sleep(self.round_trip)
+
+    def ensure_indexes(self) -> list[str]:
+        return []
+
+    def put_image(self, image: dict) -> ObjectId:
+        self._round_trip()
+        image = dict(image, _id=ObjectId())
+        with self.lock:
+            self.images[image["uuid"]] = image
+        return image["_id"]
+
+    def put_images(self, images: list[dict]) -> list[ObjectId]:
+        self._round_trip()
+        with self.lock:
+            for image in images:
+                self.images[image["uuid"]] = dict(image, _id=ObjectId())
+        return [self.images[image["uuid"]]["_id"] for image in images]
+
+    def _update(self, uuid: UUID, fields: dict) -> bool:
+        self._round_trip()
+        with self.lock:
+            image = self.images.get(str(uuid))
+            if image is None:
+                return False
+            image.update(fields)
+            return True
+
+    def add_variant(self, uuid: UUID, file_name: str) -> bool:
+        image = self.images.get(str(uuid)) or {}
+        variants = sorted({*(image.get("variants") or []), file_name})
+        return self._update(uuid, {"variants": variants})
+
+    def update_image(self, uuid: UUID, fields: dict) -> bool:
+        return self._update(uuid, fields)
+
+    def _change_refcount(self, content_hash: str, change: int) -> dict | None:
+        self._round_trip()
+        with self.lock:
+            blob = self.blobs.get(content_hash)
+            if blob is None:
+                return None
+            blob["refcount"] += change
+            return copy.deepcopy(blob)
+
+    def acquire_blob(self, content_hash: str) -> dict | None:
+        return self._change_refcount(content_hash, 1)
+
+    def register_blob(self, content_hash: str, blob: dict) -> dict:
+        self._round_trip()
+        with self.lock:
+            stored = self.blobs.setdefault(
+                content_hash, dict(blob, _id=content_hash, refcount=0)
+            )
+            stored["refcount"] += 1
+            return copy.deepcopy(stored)
+
+    def release_blob(self, content_hash: str) -> dict | None:
+        return self._change_refcount(content_hash, -1)
+
+    def delete_blob(self, content_hash: str) -> bool:
+        self._round_trip()
+        with self.lock:
+            blob = self.blobs.get(content_hash)
+            if blob is None or blob["refcount"] > 0:
+                return False
+            del self.blobs[content_hash]
+            return True
+
+    def query_blob(self, content_hash: str) -> dict | None:
+        self._round_trip()
+        with self.lock:
+            blob = self.blobs.get(content_hash)
+            return copy.deepcopy(blob) if blob is not None else None
+
+    def add_blob_variant(self, content_hash: str, file_name: str) -> bool:
+        self._round_trip()
+        with self.lock:
+            blob = self.blobs.get(content_hash)
+            variants = blob.setdefault("variants", []) if blob else None
+            if blob is None or file_name in variants:
+                return False
+            variants.append(file_name)
+            return True
+
+    def delete_image(self, uuid: UUID) -> bool:
+        self._round_trip()
+        with self.lock:
+            return self.images.pop(str(uuid), None) is not None
+
+    def delete_images(self, uuids: list[str]) -> int:
+        self._round_trip()
+        with self.lock:
+            return sum(self.images.pop(uuid, None) is not None for uuid in uuids)
+
+    def pop_images(self, uuids: list[str], projection: dict) -> list[dict]:
+        self._round_trip()
+        with self.lock:
+            images = [self.images.pop(uuid, None) for uuid in uuids]
+        return [project(image, projection) for image in images if image is not None]
+
+    def query_images(
+        self,
+        field_key: str,
+        field_value: str | list[str],
+        projection: dict | None = None,
+    ) -> list:
+        self._round_trip()
+        values = field_value if isinstance(field_value, list) else [field_value]
+        with self.lock:
+            return [
+                project(image, projection)
+                for image in self.images.values()
+                if image.get(field_key) in values
+            ]
+
+    def query_image(
+        self, field_key: str, field_value: str, projection: dict | None = None
+    ) -> dict | None:
+        self._round_trip()
+        with self.lock:
+            if field_key == "uuid":
+                image = self.images.get(field_value)
+            else:
+                image = next(
+                    (
+                        image
+                        for image in self.images.values()
+                        if image.get(field_key) == field_value
+                    ),
+                    None,
+                )
+            return project(image, projection) if image is not None else None
+
+    def find_images(
+        self,
+        field_key: str,
+        field_value: str,
+        projection: dict | None = None,
+        after: tuple[str, ObjectId] | None = None,
+        limit: int = 0,
+        batch_size: int = 500,
+    ) -> Iterator[dict]:
+        # Like a cursor: nothing happens until it is iterated, then one round
+        # trip per batch.
+        with self.lock:
+            images = sorted(
+                (
+                    image
+                    for image in self.images.values()
+                    if image.get(field_key) == field_value
+                ),
+                key=lambda image: (image["tags"]["timestamp"], image["_id"]),
+            )
+        if after is not None:
+            images = [
+                image
+                for image in images
+                if (image["tags"]["timestamp"], image["_id"]) > after
+            ]
+        if limit:
+            images = images[:limit]
+        for index, image in enumerate(images):
+            if index % batch_size == 0:
+                self._round_trip()
+            yield project(image, projection)
+
+
+def fake_async_repository(repository: FakeImageRepository) -> AsyncImageRepository:
+    async_repository = AsyncImageRepository.__new__(AsyncImageRepository)
+    async_repository.repository = repository
+    return async_repository
+
+
+class FakeFileService:
+    """The subset of azure.storage.file.FileService that AzureFileSystem uses.
+
+    Every call costs ``round_trip_ms``, and file bodies additionally take
+    their size divided by ``bandwidth_mib_s``.
+    """
+
+    def __init__(self, round_trip_ms: float = 5.0, bandwidth_mib_s: float = 100.0):
+        self.round_trip = round_trip_ms / 1000
+        self.bytes_per_second = bandwidth_mib_s * 1024 * 1024
+        self.directories: set[str] = set()
+        self.files: dict[tuple[str, str], tuple[bytes, str, datetime]] = {}
+        self.lock = threading.Lock()
+
+    def _round_trip(self, size: int = 0) -> None:
+        time.sleep(self.round_trip + size / self.bytes_per_second)
+
+    def create_directory(
+        self, share_name: str, directory_name: str, fail_on_exist: bool = False
+    ) -> bool:
+        self._round_trip()
+        with self.lock:
+            created = directory_name not in self.directories
+            self.directories.add(directory_name)
+        return created
+
+    def delete_directory(self, share_name: str, directory_name: str) -> bool:
+        self._round_trip()
+        with self.lock:
+            self.directories.discard(directory_name)
+        return True
+
+    def _put(self, directory_name: str, file_name: str, content: bytes, settings):
+        self._round_trip(len(content))
+        with self.lock:
+            self.files[directory_name, file_name] = (
+                content,
+                settings.content_type,
+                datetime.now(timezone.utc),
+            )
+
+    def create_file_from_bytes(
+        self, share_name: str, directory_name: str, file_name: str, file: bytes, **kw
+    ) -> None:
+        self._put(directory_name, file_name, bytes(file), kw["content_settings"])
+
+    def create_file_from_stream(
+        self,
+        share_name: str,
+        directory_name: str,
+        file_name: str,
+        stream: BinaryIO,
+        count: int,
+        **kw,
+    ) -> None:
+        self._put(directory_name, file_name, stream.read(count), kw["content_settings"])
+
+    def _get(self, directory_name: str, file_name: str) -> tuple:
+        with self.lock:
+            entry = self.files.get((directory_name, file_name))
+        if entry is None:
+            raise FileNotFoundError(f"{directory_name}/{file_name}")
+        return entry
+
+    def get_file_to_bytes(
+        self,
+        share_name: str,
+        directory_name: str,
+        file_name: str,
+        start_range: int | None = None,
+        end_range: int | None = None,
+        **kw,
+    ) -> SimpleNamespace:
+        content = self._get(directory_name, file_name)[0]
+        if start_range is not None:
+            stop = end_range + 1
+            content = content[start_range:stop]
+        self._round_trip(len(content))
+        return SimpleNamespace(content=content)
+
+    def get_file_properties(
+        self, share_name: str, directory_name: str, file_name: str
+    ) -> SimpleNamespace:
+        self._round_trip()
+        content, content_type, last_modified = self._get(directory_name, file_name)
+        return SimpleNamespace(
+            properties=SimpleNamespace(
+                content_settings=SimpleNamespace(content_type=content_type),
+                content_length=len(content),
+                etag=f'"{id(content):x}"',
+                last_modified=last_modified,
+            )
+        )
+
+    def delete_file(self, share_name: str, directory_name: str, file_name: str):
+        self._round_trip()
+        with self.lock:
+            self.files.pop((directory_name, file_name), None)
+
+
+class FakeAuthenticationHttpClient(AuthenticationHttpClient):
+    """Accepts every token as the client ``client_<token>``; timed like the
+    real client's request."""
+
+    def __init__(self, round_trip_ms: float = 20.0):
+        self.round_trip = round_trip_ms / 1000
+
+    def _get(self, auth_token: str) -> SimpleNamespace:
+        time.sleep(self.round_trip)
+        body = {"client_id": f"client_{auth_token}"}
+        return SimpleNamespace(status_code=200, json=lambda: body)
+
+    async def get(self, auth_token: str) -> SimpleNamespace:
+        with AUTHENTICATION_SECONDS.time():
+            return await run_in_threadpool(self._get, auth_token)
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,102 @@
+"""Upload transform memory and latency over a synthetic 12MP-50MP JPEG corpus.
+
+Compares decoding at full resolution, as uploads did before, with the
+reduced-scale decoding used by transform_image:
+
+    python -m benchmarks.image_decode --megapixels 12 24 48 50
+
+Each run executes in a fresh process whose peak RSS is reset right before the
+transform, so it is not shared with the corpus or with the other runs. Resetting
+the peak uses /proc/self/clear_refs and needs Linux.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import re
+import time
+from typing import Sequence
+
+from PIL import Image, ImageOps
+
+from app.transforms import transform_image
+
+SIZES = [(768, 768), (384, 384), (128, 128)]
+
+
+def create_jpeg(megapixels: int) -> bytes:
+    """Noisy 4:3 photo-sized JPEG, so the encoder cannot collapse it."""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = megapixels * 1_000_000 // width
+    noise = Image.effect_noise((width // 8, height // 8), 64).convert("RGB")
+    image = noise.resize((width, height), Image.Resampling.BILINEAR)
+    bytes_io = io.BytesIO()
+    image.save(bytes_io, "JPEG", quality=90)
+    return bytes_io.getvalue()
+
+
+def full_decode_transform(
+    content: bytes, sizes: Sequence[tuple[int, int]]
+) -> list[bytes]:
+    image = Image.open(io.BytesIO(content))
+    image_format = image.format
+    image = ImageOps.exif_transpose(image)
+    thumbnails = []
+    for size in sizes:
+        image = image.copy()
+        image.thumbnail(size, Image.ANTIALIAS)
+        thumbnail_bytes = io.BytesIO()
+        image.save(thumbnail_bytes, format=image_format)
+        thumbnails.append(thumbnail_bytes.getvalue())
+    return thumbnails
+
+
+def memory_kib(field: str) -> int:
+    with open("/proc/self/status") as status:
+        return int(re.search(rf"{field}:\s+(\d+)", status.read()).group(1))
+
+
+def run_once(mode: str, content: bytes, results: multiprocessing.Queue) -> None:
+    transform = transform_image if mode == "reduced_scale" else full_decode_transform
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+    baseline_kib = memory_kib("VmRSS")
+    start = time.perf_counter()
+    transform(content, SIZES)
+    latency_ms = (time.perf_counter() - start) * 1000
+    results.put((latency_ms, (memory_kib("VmHWM") - baseline_kib) / 1024))
+
+
+def measure_in_process(mode: str, content: bytes) -> tuple[float, float]:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=run_once, args=(mode, content, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def run(megapixels: Sequence[int], iterations: int) -> list[dict]:
+    report = []
+    for size in megapixels:
+        content = create_jpeg(size)
+        entry = {"megapixels": size, "jpeg_bytes": len(content)}
+        for mode in ("full_decode", "reduced_scale"):
+            runs = [measure_in_process(mode, content) for _ in range(iterations)]
+            latencies = sorted(latency for latency, _ in runs)
+            entry[mode] = {
+                "p50_ms": round(latencies[len(latencies) // 2], 1),
+                "max_ms": round(latencies[-1], 1),
+                "peak_rss_mib": round(max(rss for _, rss in runs), 1),
+            }
+        report.append(entry)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megapixels", type=int, nargs="+", default=[12, 24, 48, 50])
+    parser.add_argument("--iterations", type=int, default=3)
+    arguments = parser.parse_args()
+    print(json.dumps(run(arguments.megapixels, arguments.iterations), indent=2))
@@ -0,0 +1,271 @@
+"""Throughput, latency and peak memory of the service's main scenarios.
+
+Requests go through the whole ASGI application, middleware included, while
+MongoDB, the Azure file share and the authentication service are replaced
+by the in-memory stand-ins of benchmarks.fakes with the given round trips.
+Images come from the reproducible corpus of benchmarks.corpus, so runs with
+the same arguments can be compared:
+
+    python -m benchmarks.load upload download --requests 200 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import time
+from contextlib import ExitStack
+from itertools import count, cycle
+from unittest.mock import patch
+
+from pymongo import MongoClient
+
+from app.container import Container
+from app.main import app
+from app.settings import Settings, get_settings
+from benchmarks import summarize
+from benchmarks.corpus import CorpusImage, create_corpus
+from benchmarks.fakes import (
+    FakeAuthenticationHttpClient,
+    FakeFileService,
+    FakeImageRepository,
+    fake_async_repository,
+)
+
+SCENARIOS = ["upload", "download", "metadata", "delete"]
+BOUNDARY = "benchmark-boundary"
+USER_TOKEN = "benchmark"
+CLIENT_ID = f"client_{USER_TOKEN}"
+
+settings = Settings(
+    mongo_uri="mongodb://localhost:27017",
+    mongo_db_name="benchmark",
+    mongo_collection="images",
+    azure_account_name="account",
+    azure_account_key="YWNjb3VudF9rZXk=",
+    azure_share_name="share",
+    authentication_url="http://localhost",
+    image_transform_mode="thread",
+)
+
+
+def multipart_body(image: CorpusImage) -> bytes:
+    return b"".join(
+        [
+            f"--{BOUNDARY}\r\n".encode(),
+            f'Content-Disposition: form-data; name="file"; '
+            f'filename="{image.file_name}"\r\n'.encode(),
+            f"Content-Type: {image.content_type}\r\n\r\n".encode(),
+            image.content,
+            f"\r\n--{BOUNDARY}--\r\n".encode(),
+        ]
+    )
+
+
+async def call(
+    method: str, path: str, headers: dict[str, str] | None = None, body: bytes = b""
+) -> tuple[int, bytes]:
+    """Sends one request to the application; returns the status code and the
+    response body."""
+    headers = dict(headers or {}, **{"User-Token": USER_TOKEN})
+    if get_settings().api_key is not None:
+        headers["Authorization"] = get_settings().api_key
+    if body:
+        headers["Content-Length"] = str(len(body))
+    path, _, query_string = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": get_settings().base_url + path,
+        "raw_path": (get_settings().base_url + path).encode(),
+        "query_string": query_string.encode(),
+        "root_path": "",
+        "headers": [
+            (name.lower().encode(), value.encode()) for name, value in headers.items()
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("benchmark", 80),
+        "app": app,
+    }
+    complete = asyncio.Event()
+    received = False
+    status = 0
+    chunks = []
+
+    async def receive() -> dict:
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The client stays connected until the whole response has arrived.
+        await complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                complete.set()
+
+    await app(scope, receive, send)
+    complete.set()
+    return status, b"".join(chunks)
+
+
+async def upload(image: CorpusImage) -> tuple[int, bytes]:
+    return await call(
+        "POST",
+        "/images/upload",
+        {"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"},
+        multipart_body(image),
+    )
+
+
+async def seed(corpus: list[CorpusImage], images: int) -> list[str]:
+    """Uploads ``images`` images, cycling through the corpus; returns their
+    uuids."""
+    uuids = []
+    for image, _ in zip(cycle(corpus), range(images)):
+        status, body = await upload(image)
+        if status != 200:
+            raise RuntimeError(f"Seeding failed with status {status}: {body!r}")
+        uuids.append(json.loads(body)["uuid"])
+    return uuids
+
+
+def reset_peak_rss() -> None:
+    # Writing 5 resets the high-water mark reported as VmHWM (Linux only).
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mib() -> float | None:
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+async def run_scenario(
+    scenario: str, corpus: list[CorpusImage], requests: int, concurrency: int
+) -> dict:
+    if scenario == "upload":
+        images = cycle(corpus)
+
+        def next_request():
+            return upload(next(images))
+
+    elif scenario == "delete":
+        uuids = iter(await seed(corpus, requests))
+
+        def next_request():
+            return call("DELETE", f"/images/delete/{next(uuids)}")
+
+    elif scenario == "download":
+        uuids = cycle(await seed(corpus, len(corpus)))
+        sizes = cycle(["original", *map(str, settings.image_rendition_sizes)])
+
+        def next_request():
+            return call("GET", f"/images/download/{next(uuids)}?size={next(sizes)}")
+
+    else:
+        await seed(corpus, len(corpus))
+
+        def next_request():
+            return call("GET", f"/images/images_metadata/{CLIENT_ID}")
+
+    latencies = []
+    errors = 0
+    sent = count()
+
+    async def worker() -> None:
+        nonlocal errors
+        while next(sent) < requests:
+            start = time.perf_counter()
+            status, _ = await next_request()
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += status >= 400
+
+    reset_peak_rss()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": scenario,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "requests_per_second": round(requests / elapsed, 1),
+        "latency": summarize(latencies),
+        "peak_rss_mib": peak_rss_mib(),
+    }
+
+
+async def run(arguments: argparse.Namespace) -> list[dict]:
+    corpus = create_corpus(arguments.corpus, arguments.seed)
+    results = []
+    for scenario in arguments.scenarios:
+        # A fresh service per scenario, so one scenario's data does not slow
+        # down the next.
+        repository = FakeImageRepository(arguments.mongo_latency_ms)
+        file_service = FakeFileService(arguments.storage_latency_ms)
+        with ExitStack() as stack:
+            stack.enter_context(
+                patch(
+                    "app.container.create_mongo_client",
+                    lambda _: MongoClient(settings.mongo_uri, connect=False),
+                )
+            )
+            stack.enter_context(
+                patch(
+                    "app.container.AsyncImageRepository",
+                    lambda *_: fake_async_repository(repository),
+                )
+            )
+            stack.enter_context(
+                patch("app.file_system.FileService", lambda **_: file_service)
+            )
+            stack.enter_context(
+                patch(
+                    "app.container.AuthenticationHttpClient",
+                    lambda *_: FakeAuthenticationHttpClient(arguments.auth_latency_ms),
+                )
+            )
+            container = Container(settings)
+        app.state.container = container
+        container.start()
+        try:
+            results.append(
+                await run_scenario(
+                    scenario, corpus, arguments.requests, arguments.concurrency
+                )
+            )
+        finally:
+            await container.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scenarios", nargs="*", choices=[[], *SCENARIOS])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--corpus", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mongo-latency-ms", type=float, default=1.0)
+    parser.add_argument("--storage-latency-ms", type=float, default=5.0)
+    parser.add_argument("--auth-latency-ms", type=float, default=20.0)
+    arguments = parser.parse_args()
+    arguments.scenarios = arguments.scenarios or SCENARIOS
+    print(json.dumps(asyncio.run(run(arguments)), indent=2))
@@ -0,0 +1,104 @@
+"""Time and size of a client's metadata response body, by serializer.
+
+Compares building an ImageDocument per stored document and serializing it
+with pydantic, as the metadata handler did before, with mapping the
+documents straight to JSON with orjson and with the standard library
+fallback used when orjson is not installed:
+
+    python -m benchmarks.metadata_serialization --documents 1000 10000 100000
+"""
+import argparse
+import json
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator
+from unittest.mock import patch
+from uuid import uuid4
+
+from bson import ObjectId
+
+from app.handlers import MetadataHandler
+from app.pagination import batched
+from app.schemas import ImageDocument
+from app.serialization import _dumps, orjson
+from benchmarks import measure, summarize
+
+
+def create_documents(count: int) -> list[dict]:
+    start = datetime(2022, 8, 1)
+    documents = []
+    for index in range(count):
+        uuid = str(uuid4())
+        documents.append(
+            {
+                "_id": ObjectId(),
+                "file_path": f"client/{uuid}",
+                "uuid": uuid,
+                "client_id": "client",
+                "file_name": f"image_{index}.jpg",
+                "content_type": "image/jpeg",
+                "tags": {
+                    "origin_uuid": None,
+                    "processed": False,
+                    "timestamp": (start + timedelta(seconds=index)).isoformat(),
+                },
+                "renditions": {
+                    "128": f"image_{index}_128.jpg",
+                    "384": f"image_{index}_384.jpg",
+                    "original": f"image_{index}_original.jpg",
+                },
+                "variants": None,
+                "content_hash": uuid.replace("-", "") * 2,
+                "stored_file_name": None,
+                "status": "ready",
+            }
+        )
+    return documents
+
+
+def pydantic_json_array(images: Iterable[dict]) -> Iterator[bytes]:
+    yield b"["
+    separator = b""
+    for batch in batched(images, MetadataHandler.batch_size):
+        yield separator + b",".join(
+            ImageDocument(**image).json().encode() for image in batch
+        )
+        separator = b","
+    yield b"]"
+
+
+def handler_json_array(images: Iterable[dict]) -> Iterator[bytes]:
+    return MetadataHandler._json_array(images)
+
+
+def standard_library_json_array(images: Iterable[dict]) -> Iterator[bytes]:
+    with patch("app.serialization.dumps", _dumps):
+        yield from MetadataHandler._json_array(images)
+
+
+def run(counts: list[int], iterations: int) -> dict:
+    serializers = {
+        "pydantic": pydantic_json_array,
+        "json": standard_library_json_array,
+    }
+    if orjson is not None:
+        serializers["orjson"] = handler_json_array
+    results = {}
+    for count in counts:
+        documents = create_documents(count)
+        results[str(count)] = {}
+        for name, json_array in serializers.items():
+            latencies = measure(lambda: b"".join(json_array(documents)), iterations)
+            results[str(count)][name] = summarize(latencies) | {
+                "bytes": len(b"".join(json_array(documents)))
+            }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--documents", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--iterations", type=int, default=5)
+    arguments = parser.parse_args()
+    print(json.dumps(run(arguments.documents, arguments.iterations), indent=2))
@@ -0,0 +1,121 @@
+import threading
+import time
+import zipfile
+from io import BytesIO
+from unittest import TestCase
+
+from app.archive import iter_zip
+
+
+class TestIterZip(TestCase):
+    def test_archive_contains_every_entry(self) -> None:
+        # given
+        entries = [
+            (f"uuid/{index}.png", lambda i=index: b"x" * i) for index in range(5)
+        ]
+
+        # when
+        archive = zipfile.ZipFile(BytesIO(b"".join(iter_zip(entries, 2))))
+
+        # then
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(
+            sorted(archive.namelist()), [f"uuid/{index}.png" for index in range(5)]
+        )
+        self.assertEqual(archive.read("uuid/3.png"), b"xxx")
+        self.assertEqual(
+            archive.getinfo("uuid/3.png").compress_type, zipfile.ZIP_STORED
+        )
+
+    def test_empty_archive(self) -> None:
+        archive = zipfile.ZipFile(BytesIO(b"".join(iter_zip([]))))
+
+        self.assertEqual(archive.namelist(), [])
+
+    def test_failed_fetch_is_retried(self) -> None:
+        # given
+        attempts = []
+
+        def fetch() -> bytes:
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ConnectionError("transient")
+            return b"image"
+
+        # when
+        chunks = iter_zip([("uuid/a.png", fetch)], attempts=3, retry_delay=0)
+        archive = zipfile.ZipFile(BytesIO(b"".join(chunks)))
+
+        # then
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(archive.namelist(), ["uuid/a.png"])
+        self.assertEqual(archive.read("uuid/a.png"), b"image")
+
+    def test_file_that_cannot_be_fetched_is_listed_in_errors(self) -> None:
+        # given
+        def missing() -> bytes:
+            raise FileNotFoundError("uuid/b_128.png")
+
+        entries = [
+            ("uuid/a.png", lambda: b"image"),
+            ("uuid/b_128.png", missing),
+            ("uuid/c.png", lambda: b"other"),
+        ]
+
+        # when
+        chunks = iter_zip(entries, 2, attempts=2, retry_delay=0)
+        archive = zipfile.ZipFile(BytesIO(b"".join(chunks)))
+
+        # then
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(
+            sorted(archive.namelist()), ["errors.txt", "uuid/a.png", "uuid/c.png"]
+        )
+        self.assertEqual(archive.namelist()[-1], "errors.txt")
+        self.assertEqual(
+            archive.read("errors.txt").decode(),
+            "uuid/b_128.png: FileNotFoundError('uuid/b_128.png')\n",
+        )
+
+    def test_prefetch_is_bounded(self) -> None:
+        # given
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def fetch() -> bytes:
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.01)
+            with lock:
+                running -= 1
+            return b"image"
+
+        # when
+        chunks = list(iter_zip([(f"{index}.png", fetch) for index in range(10)], 3))
+
+        # then
+        self.assertLessEqual(peak, 3)
+        self.assertEqual(len(zipfile.ZipFile(BytesIO(b"".join(chunks))).namelist()), 10)
+
+    def test_entries_are_streamed_as_they_arrive(self) -> None:
+        # given
+        fetched = []
+
+        def fetch(index: int) -> bytes:
+            fetched.append(index)
+            return b"image"
+
+        archive = iter_zip(
+            ((f"{index}.png", lambda i=index: fetch(i)) for index in range(100)), 1
+        )
+
+        # when
+        first_chunk = next(archive)
+        archive.close()
+
+        # then
+        self.assertTrue(first_chunk.startswith(b"PK\x03\x04"))
+        self.assertLess(len(fetched), 100)
@@ -0,0 +1,108 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock
+
+from app.background import BackgroundQueue, BackgroundQueueFullError
+
+
+class TestBackgroundQueue(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.queue = BackgroundQueue(
+            workers=2, queue_size=2, max_attempts=3, retry_delay=0
+        )
+        self.queue.start()
+
+    async def asyncTearDown(self) -> None:
+        await self.queue.stop()
+
+    async def test_job_is_run(self) -> None:
+        # given
+        job = AsyncMock()
+        on_failure = AsyncMock()
+
+        # when
+        self.queue.reserve()
+        self.queue.submit(job, on_failure)
+        await self.queue.queue.join()
+
+        # then
+        job.assert_awaited_once_with()
+        on_failure.assert_not_awaited()
+        self.assertEqual(self.queue.pending, 0)
+
+    async def test_failed_job_is_retried(self) -> None:
+        # given
+        job = AsyncMock(side_effect=[OSError("share unavailable"), None])
+        on_failure = AsyncMock()
+
+        # when
+        self.queue.reserve()
+        self.queue.submit(job, on_failure)
+        await self.queue.queue.join()
+
+        # then
+        self.assertEqual(job.await_count, 2)
+        on_failure.assert_not_awaited()
+
+    async def test_failure_callback_after_last_attempt(self) -> None:
+        # given
+        error = OSError("share unavailable")
+        job = AsyncMock(side_effect=error)
+        on_failure = AsyncMock()
+
+        # when
+        self.queue.reserve()
+        self.queue.submit(job, on_failure)
+        await self.queue.queue.join()
+
+        # then
+        self.assertEqual(job.await_count, 3)
+        on_failure.assert_awaited_once_with(error)
+        self.assertEqual(self.queue.pending, 0)
+
+    async def test_reserve_when_full(self) -> None:
+        # given
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def job() -> None:
+            started.set()
+            await release.wait()
+
+        self.queue.reserve()
+        self.queue.submit(job, AsyncMock())
+        self.queue.reserve()
+        await started.wait()
+
+        # when
+        with self.assertRaises(BackgroundQueueFullError):
+            self.queue.reserve()
+
+        # then
+        self.queue.release()
+        release.set()
+        await self.queue.queue.join()
+        self.queue.reserve()
+
+    async def test_stop_waits_for_cancelled_workers(self) -> None:
+        # given
+        cancelled = asyncio.Event()
+
+        async def job() -> None:
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        self.queue.reserve()
+        self.queue.submit(job, AsyncMock())
+        await asyncio.sleep(0)
+        tasks = self.queue.tasks
+
+        # when
+        await self.queue.stop()
+
+        # then
+        self.assertTrue(cancelled.is_set())
+        self.assertTrue(all(task.done() for task in tasks))
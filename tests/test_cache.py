@@ -0,0 +1,85 @@
+import threading
+from unittest import TestCase
+from unittest.mock import patch, sentinel
+
+from app.cache import TTLCache
+
+
+class TestTTLCache(TestCase):
+    def setUp(self) -> None:
+        self.cache = TTLCache(max_size=2, ttl=10)
+
+    def test_get_counts_hits_and_misses(self) -> None:
+        self.cache.set("key", sentinel.value)
+
+        self.assertEqual(self.cache.get("key"), sentinel.value)
+        self.assertIsNone(self.cache.get("other"))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    @patch("app.cache.time.monotonic")
+    def test_entries_expire(self, mock_monotonic) -> None:
+        mock_monotonic.return_value = 100
+        self.cache.set("key", sentinel.value)
+        self.cache.set("short", sentinel.value, ttl=1)
+
+        mock_monotonic.return_value = 105
+
+        self.assertEqual(self.cache.get("key"), sentinel.value)
+        self.assertIsNone(self.cache.get("short"))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_least_recently_used_entry_is_evicted(self) -> None:
+        self.cache.set("first", sentinel.first)
+        self.cache.set("second", sentinel.second)
+        self.cache.get("first")
+
+        self.cache.set("third", sentinel.third)
+
+        self.assertEqual(self.cache.get("first"), sentinel.first)
+        self.assertIsNone(self.cache.get("second"))
+        self.assertEqual(self.cache.get("third"), sentinel.third)
+
+    def test_pop(self) -> None:
+        self.cache.set("key", sentinel.value)
+
+        self.assertEqual(self.cache.pop("key"), sentinel.value)
+        self.assertIsNone(self.cache.pop("key"))
+
+    @patch("app.cache.time.monotonic")
+    def test_concurrent_gets_of_expired_entry(self, mock_monotonic) -> None:
+        # given
+        mock_monotonic.return_value = 0
+        self.cache.set("key", sentinel.value, ttl=-1)
+        other_started = threading.Event()
+        other_done = threading.Event()
+        errors = []
+
+        def get() -> None:
+            try:
+                self.cache.get("key")
+            except Exception as error:
+                errors.append(error)
+
+        def other_get() -> None:
+            other_started.set()
+            get()
+            other_done.set()
+
+        def monotonic() -> float:
+            # The first get lets a second one run between its expiry check and
+            # its removal of the entry.
+            if threading.current_thread() is threading.main_thread():
+                threading.Thread(target=other_get).start()
+                other_started.wait()
+                other_done.wait(0.2)
+            return 0
+
+        mock_monotonic.side_effect = monotonic
+
+        # when
+        get()
+        other_done.wait()
+
+        # then
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.cache), 0)
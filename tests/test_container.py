@@ -0,0 +1,160 @@
+import asyncio
+import shutil
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import Mock, patch, sentinel
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+from app.container import Container, create_mongo_client
+from app.dependencies import get_container, get_download_handler, get_upload_handler
+from app.file_system import LocalFileSystem
+from app.settings import Settings
+
+
+class TestMongoClient(TestCase):
+    def setUp(self) -> None:
+        self.settings = Settings(mongo_uri="mongodb://localhost:27017")
+
+    @patch("app.container.MongoClient")
+    def test_create_mongo_client_uses_pool_settings(self, mock_client) -> None:
+        # when
+        result = create_mongo_client(self.settings)
+
+        # then
+        mock_client.assert_called_once_with(
+            "mongodb://localhost:27017",
+            maxPoolSize=self.settings.mongo_max_pool_size,
+            minPoolSize=self.settings.mongo_min_pool_size,
+            maxIdleTimeMS=self.settings.mongo_max_idle_time_ms,
+            connectTimeoutMS=self.settings.mongo_connect_timeout_ms,
+            serverSelectionTimeoutMS=self.settings.mongo_server_selection_timeout_ms,
+            socketTimeoutMS=self.settings.mongo_socket_timeout_ms,
+            waitQueueTimeoutMS=self.settings.mongo_wait_queue_timeout_ms,
+        )
+        mock_client.return_value.admin.command.assert_called_once_with("ping")
+        self.assertEqual(result, mock_client.return_value)
+
+    @patch("app.container.MongoClient")
+    def test_create_mongo_client_survives_failed_warm_up(self, mock_client) -> None:
+        # given
+        mock_client.return_value.admin.command.side_effect = (
+            ServerSelectionTimeoutError("no servers")
+        )
+
+        # when
+        result = create_mongo_client(self.settings)
+
+        # then
+        self.assertEqual(result, mock_client.return_value)
+
+
+@patch("app.container.create_mongo_client")
+class TestContainer(TestCase):
+    def setUp(self) -> None:
+        self.settings = Settings(
+            mongo_db_name="database",
+            mongo_collection="images",
+            azure_account_name="account_name",
+            azure_account_key="YWNjb3VudF9rZXk=",
+            azure_share_name="share",
+            authentication_url="https://example.com",
+            image_transform_mode="inline",
+        )
+
+    def test_handlers_share_clients(self, mock_create_mongo_client) -> None:
+        # when
+        container = Container(self.settings)
+
+        # then
+        mock_create_mongo_client.assert_called_once_with(self.settings)
+        self.assertIs(container.upload_handler.http_client, container.http_client)
+        self.assertIs(
+            container.upload_handler.use_case.repository,
+            container.download_handler.use_case.repository,
+        )
+        self.assertIs(
+            container.delete_handler.use_case.file_system,
+            container.metadata_handler.use_case.file_system,
+        )
+
+    def test_local_storage_backend(self, mock_create_mongo_client) -> None:
+        # given
+        local_storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, local_storage_dir)
+        settings = self.settings.copy(
+            update={"storage_backend": "local", "local_storage_dir": local_storage_dir}
+        )
+
+        # when
+        container = Container(settings)
+
+        # then
+        self.assertIsInstance(container.file_system, LocalFileSystem)
+        self.assertIs(container.download_use_case.file_system, container.file_system)
+
+    def test_unknown_storage_backend(self, mock_create_mongo_client) -> None:
+        with self.assertRaises(ValueError):
+            Container(self.settings.copy(update={"storage_backend": "ftp"}))
+
+    def test_close(self, mock_create_mongo_client) -> None:
+        # given
+        container = Container(self.settings)
+        container.http_client = Mock()
+
+        # when
+        asyncio.run(container.close())
+
+        # then
+        container.http_client.close.assert_called_once_with()
+        mock_create_mongo_client.return_value.close.assert_called_once_with()
+
+    def test_start_recovers_pending_uploads_until_closed(
+        self, mock_create_mongo_client
+    ) -> None:
+        # given
+        container = Container(self.settings)
+        container.http_client = Mock()
+
+        async def start_and_close() -> None:
+            container.start()
+            await asyncio.sleep(0)
+            await container.close()
+
+        # when
+        with patch.object(
+            container.background_upload_use_case, "requeue"
+        ) as mock_requeue:
+            asyncio.run(start_and_close())
+
+        # then
+        mock_requeue.assert_awaited_once_with(
+            self.settings.background_upload_recover_after
+        )
+        self.assertTrue(container.recovery_task.cancelled())
+        self.assertEqual(container.upload_queue.tasks, [])
+
+
+class TestDependencies(IsolatedAsyncioTestCase):
+    async def test_handlers_come_from_the_container(self) -> None:
+        # given
+        request = Mock()
+        request.app.state.container.download_handler = sentinel.download_handler
+
+        # when
+        result = await get_download_handler(await get_container(request))
+
+        # then
+        self.assertEqual(result, sentinel.download_handler)
+
+    async def test_async_uploads_use_the_background_handler(self) -> None:
+        # given
+        container = Mock()
+
+        # when
+        synchronous = await get_upload_handler(container, False)
+        asynchronous = await get_upload_handler(container, True)
+
+        # then
+        self.assertEqual(synchronous, container.upload_handler)
+        self.assertEqual(asynchronous, container.background_upload_handler)
@@ -1,11 +1,295 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from io import BytesIO
 from unittest import TestCase
-from unittest.mock import sentinel
+from unittest.mock import ANY, Mock, call, sentinel
 
-from app.file_system import AzureFileSystem
+from app.file_system import (
+    AzureFileSystem,
+    DiskCachedFileSystem,
+    LocalFileSystem,
+    StoredFile,
+)
 
 
 class TestFileSystem(TestCase):
     def setUp(self) -> None:
         self.file_system = AzureFileSystem(
-            sentinel.account_name, sentinel.account_key, sentinel.share_name
+            "account_name", "YWNjb3VudF9rZXk=", sentinel.share_name
         )
+        self.file_system.file_service = Mock()
+
+    def test_create_directories_creates_client_directory_once(self) -> None:
+        # when
+        self.file_system._create_directories("client_id", "first")
+        self.file_system._create_directories("client_id", "second")
+
+        # then
+        self.file_system.file_service.list_directories_and_files.assert_not_called()
+        self.file_system.file_service.create_directory.assert_has_calls(
+            [
+                call(sentinel.share_name, "client_id", fail_on_exist=False),
+                call(sentinel.share_name, "client_id/first"),
+                call(sentinel.share_name, "client_id/second"),
+            ]
+        )
+        self.assertEqual(self.file_system.file_service.create_directory.call_count, 3)
+
+    def test_upload_files_creates_directories_once(self) -> None:
+        # when
+        self.file_system.upload_files(
+            {"test.png": b"main", "test_128.png": b"small"}, "uuid", "client_id"
+        )
+
+        # then
+        self.assertEqual(self.file_system.file_service.create_directory.call_count, 2)
+        self.assertEqual(
+            [
+                upload.kwargs["file_name"]
+                for upload in self.file_system.file_service.create_file_from_bytes.mock_calls
+            ],
+            ["test.png", "test_128.png"],
+        )
+
+    def test_upload_stream(self) -> None:
+        # given
+        stream = BytesIO(b"original")
+
+        # when
+        self.file_system.upload_file("test.png", stream, "uuid", "client_id")
+
+        # then
+        self.file_system.file_service.create_file_from_bytes.assert_not_called()
+        self.file_system.file_service.create_file_from_stream.assert_called_once_with(
+            share_name=sentinel.share_name,
+            directory_name="client_id/uuid",
+            file_name="test.png",
+            stream=stream,
+            count=8,
+            content_settings=ANY,
+        )
+        self.assertEqual(stream.tell(), 0)
+
+    def test_delete_files(self) -> None:
+        # when
+        self.file_system.delete_files(["test.png", "test_128.png"], "client_id/uuid")
+
+        # then
+        self.file_system.file_service.delete_file.assert_has_calls(
+            [
+                call(sentinel.share_name, "client_id/uuid", "test.png"),
+                call(sentinel.share_name, "client_id/uuid", "test_128.png"),
+            ]
+        )
+        self.file_system.file_service.delete_directory.assert_called_once_with(
+            sentinel.share_name, "client_id/uuid"
+        )
+
+    def test_open_file(self) -> None:
+        # given
+        properties = self.file_system.file_service.get_file_properties.return_value
+        properties.properties.content_length = 10
+        properties.properties.etag = '"etag"'
+        properties.properties.content_settings.content_type = "image/png"
+
+        # when
+        result = self.file_system.open_file("test.png", "client_id/uuid")
+
+        # then
+        self.file_system.file_service.get_file_properties.assert_called_once_with(
+            sentinel.share_name, "client_id/uuid", "test.png"
+        )
+        self.assertEqual(result.content_length, 10)
+        self.assertEqual(result.etag, '"etag"')
+        self.assertEqual(result.content_type, "image/png")
+
+    def test_iter_file_fetches_chunks(self) -> None:
+        # given
+        self.file_system.chunk_size = 4
+        self.file_system.file_service.get_file_to_bytes.return_value.content = b"x"
+
+        # when
+        result = list(self.file_system.iter_file("test.png", "client_id/uuid", 2, 11))
+
+        # then
+        self.assertEqual(result, [b"x", b"x", b"x"])
+        self.file_system.file_service.get_file_to_bytes.assert_has_calls(
+            [
+                call(
+                    sentinel.share_name,
+                    "client_id/uuid",
+                    "test.png",
+                    start_range=start,
+                    end_range=end,
+                    max_connections=1,
+                )
+                for start, end in [(2, 5), (6, 9), (10, 11)]
+            ]
+        )
+
+
+class TestDiskCachedFileSystem(TestCase):
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.remote = Mock(AzureFileSystem)
+        self.remote.open_file.side_effect = self.remote_file
+        self.file_system = DiskCachedFileSystem(self.remote, self.cache_dir, 25)
+
+    @staticmethod
+    def remote_file(file_name: str, file_path: str) -> StoredFile:
+        content = file_name.encode() * 2
+        return StoredFile(
+            file_name=file_name,
+            content_type="image/png",
+            content_length=len(content),
+            etag='"etag"',
+            last_modified=datetime(2022, 8, 1, tzinfo=timezone.utc),
+            iter_range=lambda start, end: iter([content[start : end + 1]]),
+        )
+
+    def read(self, stored_file: StoredFile) -> bytes:
+        return b"".join(stored_file.iter_range(0, stored_file.content_length - 1))
+
+    def test_open_file_reads_through(self) -> None:
+        # when
+        first = self.file_system.open_file("a.png", "client/uuid")
+        second = self.file_system.open_file("a.png", "client/uuid")
+
+        # then
+        self.remote.open_file.assert_called_once_with("a.png", "client/uuid")
+        self.assertEqual(self.read(second), b"a.pnga.png")
+        self.assertEqual(second.etag, '"etag"')
+        self.assertEqual(first.path, second.path)
+        self.assertTrue(os.path.exists(second.path))
+        self.assertEqual((self.file_system.hits, self.file_system.misses), (1, 1))
+
+    def test_open_file_refetches_removed_file(self) -> None:
+        # given
+        first = self.file_system.open_file("a.png", "client/uuid")
+        os.remove(first.path)
+
+        # when
+        second = self.file_system.open_file("a.png", "client/uuid")
+
+        # then
+        self.assertEqual(self.remote.open_file.call_count, 2)
+        self.assertEqual(self.read(second), b"a.pnga.png")
+        self.assertTrue(os.path.exists(second.path))
+        self.assertEqual(self.file_system.size, 10)
+        self.assertEqual((self.file_system.hits, self.file_system.misses), (0, 2))
+
+    def test_least_recently_used_file_is_evicted(self) -> None:
+        # given
+        first = self.file_system.open_file("a.png", "client/uuid")
+        self.file_system.open_file("b.png", "client/uuid")
+
+        # when
+        self.file_system.open_file("c.png", "client/uuid")
+
+        # then
+        self.assertFalse(os.path.exists(first.path))
+        self.assertEqual(self.file_system.size, 20)
+
+    def test_delete_file_invalidates(self) -> None:
+        # given
+        stored_file = self.file_system.open_file("a.png", "client/uuid")
+
+        # when
+        self.file_system.delete_file("a.png", "client/uuid")
+
+        # then
+        self.remote.delete_file.assert_called_once_with("a.png", "client/uuid")
+        self.assertFalse(os.path.exists(stored_file.path))
+        self.file_system.open_file("a.png", "client/uuid")
+        self.assertEqual(self.remote.open_file.call_count, 2)
+
+    def test_index_is_rebuilt_from_disk(self) -> None:
+        # given
+        self.file_system.open_file("a.png", "client/uuid")
+
+        # when
+        file_system = DiskCachedFileSystem(self.remote, self.cache_dir, 25)
+        stored_file = file_system.open_file("a.png", "client/uuid")
+
+        # then
+        self.remote.open_file.assert_called_once()
+        self.assertEqual(self.read(stored_file), b"a.pnga.png")
+        self.assertEqual(
+            stored_file.last_modified, datetime(2022, 8, 1, tzinfo=timezone.utc)
+        )
+
+    def test_file_larger_than_cache_is_not_stored(self) -> None:
+        # when
+        stored_file = self.file_system.open_file("large_image.png", "client/uuid")
+
+        # then
+        self.assertIsNone(stored_file.path)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+class TestLocalFileSystem(TestCase):
+    def setUp(self) -> None:
+        self.root_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root_dir)
+        self.file_system = LocalFileSystem(self.root_dir)
+
+    def test_upload_and_download(self) -> None:
+        # when
+        self.file_system.upload_files(
+            {"test.png": b"main", "test_original.png": BytesIO(b"original")},
+            "uuid",
+            "client_id",
+        )
+
+        # then
+        self.assertEqual(
+            self.file_system.download_file("test.png", "client_id/uuid"),
+            (b"main", "png"),
+        )
+        self.assertEqual(
+            self.file_system.download_file("test_original.png", "client_id/uuid")[0],
+            b"original",
+        )
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.root_dir, "client_id", "uuid"))),
+            ["test.png", "test_original.png"],
+        )
+
+    def test_open_file(self) -> None:
+        # given
+        self.file_system.upload_file("test.png", b"0123456789", "uuid", "client_id")
+
+        # when
+        stored_file = self.file_system.open_file("test.png", "client_id/uuid")
+
+        # then
+        self.assertEqual(
+            stored_file.path, os.path.join(self.root_dir, "client_id/uuid/test.png")
+        )
+        self.assertEqual(stored_file.content_type, "image/png")
+        self.assertEqual(stored_file.content_length, 10)
+        self.assertIsNotNone(stored_file.etag)
+        self.assertEqual(b"".join(stored_file.iter_range(2, 4)), b"234")
+
+    def test_delete_files(self) -> None:
+        # given
+        self.file_system.upload_files(
+            {"test.png": b"main", "test_128.png": b"small"}, "uuid", "client_id"
+        )
+
+        # when
+        self.file_system.delete_files(
+            ["test.png", "test_128.png", "missing.webp"], "client_id/uuid"
+        )
+
+        # then
+        self.assertEqual(os.listdir(os.path.join(self.root_dir, "client_id")), [])
+
+    def test_file_names_cannot_leave_the_image_directory(self) -> None:
+        with self.assertRaises(ValueError):
+            self.file_system.upload_file("../other.png", b"x", "uuid", "client_id")
+        with self.assertRaises(ValueError):
+            self.file_system.download_file("../../../etc/passwd", "client_id/uuid")
@@ -1,24 +1,45 @@
-from unittest import TestCase
+import json
+from datetime import datetime, timezone
+from unittest import IsolatedAsyncioTestCase
 from unittest.mock import Mock
+from uuid import UUID
 
-from starlette.responses import JSONResponse
+from PIL import UnidentifiedImageError
 
-from app.handlers import UploadHandler, DeleteHandler, MetadataHandler, DownloadHandler
+from bson import ObjectId
+from starlette.responses import FileResponse, StreamingResponse
+
+from app.background import BackgroundQueueFullError
+from app.file_system import StoredFile
+from app.handlers import (
+    BackgroundUploadHandler,
+    BatchUploadHandler,
+    BulkDeleteHandler,
+    ExportHandler,
+    UploadHandler,
+    DeleteHandler,
+    MetadataHandler,
+    DownloadHandler,
+    StatusHandler,
+)
 from app.http_client import HttpClient
-from app.usecases import ImageUseCase
+from app.pagination import decode_cursor, encode_cursor
+from app.schemas import ImageDocument
+from app.transforms import ImageTooLargeError, TransformQueueFullError
+from app.usecases import ImageUseCase, NotModified
 
 
-class TestUploadHandler(TestCase):
+class TestUploadHandler(IsolatedAsyncioTestCase):
     def setUp(self) -> None:
         self.use_case = Mock(ImageUseCase)
         self.http_client = Mock(HttpClient)
         self.handler = UploadHandler(self.use_case, self.http_client)
 
-    def test_handle_image_with_correct_file_type(self) -> None:
+    async def test_handle_image_with_correct_file_type(self) -> None:
         # given
         file = Mock()
         file.content_type = "image/jpeg"
-        self.http_client.get.return_value.status_code = 200
+        self.http_client.get.return_value = Mock(status_code=200)
         self.http_client.get.return_value.json.return_value = {"client_id": "client_id"}
         user_token = "user_token"
         processed = True
@@ -26,16 +47,46 @@ class TestUploadHandler(TestCase):
         self.use_case.execute.return_value = {"message": "success"}
 
         # when
-        result = self.handler.handle(file, user_token, processed, origin_uuid)
+        result = await self.handler.handle(file, user_token, processed, origin_uuid)
 
         # then
         self.use_case.execute.assert_called_with(
-            file, self.http_client.get(user_token).json(), processed, origin_uuid
+            file, self.http_client.get.return_value.json(), processed, origin_uuid
         )
-        self.http_client.get.assert_called_with(user_token)
+        self.http_client.get.assert_awaited_with(user_token)
         self.assertEqual(result.body, b'{"message":"success"}')
 
-    def test_handle_image_with_incorrect_file_type(self) -> None:
+    async def test_handle_image_when_transform_queue_is_full(self) -> None:
+        # given
+        file = Mock()
+        file.content_type = "image/png"
+        self.http_client.get.return_value = Mock(status_code=200)
+        self.http_client.get.return_value.json.return_value = {"client_id": "client_id"}
+        self.use_case.execute.side_effect = TransformQueueFullError()
+
+        # when
+        result = await self.handler.handle(file, "user_token", False, None)
+
+        # then
+        self.assertEqual(result.status_code, 503)
+        self.assertEqual(result.headers["Retry-After"], "1")
+
+    async def test_handle_image_with_too_many_pixels(self) -> None:
+        # given
+        file = Mock()
+        file.content_type = "image/jpeg"
+        self.http_client.get.return_value = Mock(status_code=200)
+        self.http_client.get.return_value.json.return_value = {"client_id": "client_id"}
+        self.use_case.execute.side_effect = ImageTooLargeError("too large")
+
+        # when
+        result = await self.handler.handle(file, "user_token", False, None)
+
+        # then
+        self.assertEqual(result.status_code, 413)
+        self.assertEqual(result.body, b'{"error":"too large"}')
+
+    async def test_handle_image_with_incorrect_file_type(self) -> None:
         # given
         file = Mock()
         file.content_type = "text/plain"
@@ -44,7 +95,7 @@ class TestUploadHandler(TestCase):
         origin_uuid = "origin_uuid"
 
         # when
-        result = self.handler.handle(file, user_token, processed, origin_uuid)
+        result = await self.handler.handle(file, user_token, processed, origin_uuid)
 
         # then
         self.use_case.execute.assert_not_called()
@@ -54,50 +105,500 @@ class TestUploadHandler(TestCase):
         )
 
 
-class TestDeleteHandler(TestCase):
+class TestBackgroundUploadHandler(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.use_case = Mock(ImageUseCase)
+        self.http_client = Mock(HttpClient)
+        self.handler = BackgroundUploadHandler(self.use_case, self.http_client)
+        self.file = Mock()
+        self.file.content_type = "image/jpeg"
+        self.http_client.get.return_value = Mock(status_code=200)
+        self.http_client.get.return_value.json.return_value = {"client_id": "client_id"}
+
+    async def test_handle_accepts_image(self) -> None:
+        # given
+        self.use_case.execute.return_value = {"uuid": "uuid", "status": "pending"}
+
+        # when
+        result = await self.handler.handle(self.file, "user_token", False, None)
+
+        # then
+        self.assertEqual(result.status_code, 202)
+        self.assertEqual(json.loads(result.body), {"uuid": "uuid", "status": "pending"})
+
+    async def test_handle_when_queue_is_full(self) -> None:
+        # given
+        self.use_case.execute.side_effect = BackgroundQueueFullError()
+
+        # when
+        result = await self.handler.handle(self.file, "user_token", False, None)
+
+        # then
+        self.assertEqual(result.status_code, 503)
+        self.assertEqual(result.headers["Retry-After"], "1")
+
+
+class TestStatusHandler(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.use_case = Mock(ImageUseCase)
+        self.handler = StatusHandler(self.use_case)
+
+    async def test_handle_status(self) -> None:
+        self.use_case.execute.return_value = "pending"
+        uuid = UUID("0b6b9b63-9d37-4bc8-a5d6-7a1b6f4cc2a1")
+
+        result = await self.handler.handle(uuid)
+
+        self.use_case.execute.assert_called_once_with(uuid)
+        self.assertEqual(
+            json.loads(result.body), {"uuid": str(uuid), "status": "pending"}
+        )
+
+    async def test_handle_unknown_image(self) -> None:
+        self.use_case.execute.return_value = None
+
+        result = await self.handler.handle(UUID(int=0))
+
+        self.assertEqual(result.status_code, 404)
+
+
+class TestBatchUploadHandler(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.use_case = Mock(ImageUseCase)
+        self.http_client = Mock(HttpClient)
+        self.http_client.get.return_value = Mock(status_code=200)
+        self.http_client.get.return_value.json.return_value = {"client_id": "client_id"}
+        self.handler = BatchUploadHandler(self.use_case, self.http_client, max_files=3)
+
+    @staticmethod
+    def _file(file_name: str, content_type: str = "image/png") -> Mock:
+        file = Mock()
+        file.filename = file_name
+        file.content_type = content_type
+        return file
+
+    async def test_handle_reports_each_file(self) -> None:
+        # given
+        uuid = UUID("12345678123456781234567812345678")
+        files = [
+            self._file("first.png"),
+            self._file("second.gif", "image/gif"),
+            self._file("third.png"),
+        ]
+        self.use_case.execute.return_value = [uuid, UnidentifiedImageError()]
+
+        # when
+        result = await self.handler.handle(files, "user_token", True, None)
+
+        # then
+        self.http_client.get.assert_awaited_once_with("user_token")
+        self.use_case.execute.assert_called_once_with(
+            [files[0], files[2]], {"client_id": "client_id"}, True, None
+        )
+        self.assertEqual(
+            json.loads(result.body),
+            [
+                {"file_name": "first.png", "uuid": str(uuid)},
+                {
+                    "file_name": "second.gif",
+                    "error": "Only jpeg and png images are allowed",
+                },
+                {"file_name": "third.png", "error": "Not a valid image"},
+            ],
+        )
+
+    async def test_handle_too_many_files(self) -> None:
+        # when
+        result = await self.handler.handle(
+            [self._file(f"{index}.png") for index in range(4)], "token", False, None
+        )
+
+        # then
+        self.assertEqual(result.status_code, 400)
+        self.http_client.get.assert_not_called()
+        self.use_case.execute.assert_not_called()
+
+    async def test_handle_invalid_token(self) -> None:
+        # given
+        self.http_client.get.return_value = Mock(status_code=401)
+
+        # when
+        result = await self.handler.handle([self._file("a.png")], "token", False, None)
+
+        # then
+        self.assertEqual(result.status_code, 400)
+        self.use_case.execute.assert_not_called()
+
+
+class TestDeleteHandler(IsolatedAsyncioTestCase):
     def setUp(self) -> None:
         self.use_case = Mock(ImageUseCase)
         self.handler = DeleteHandler(self.use_case)
 
-    def test_handle_image_with_correct_uuid(self) -> None:
+    async def test_handle_image_with_correct_uuid(self) -> None:
         # given
         uuid = "uuid"
         self.use_case.execute.return_value = True
 
         # when
-        result = self.handler.handle(uuid)
+        result = await self.handler.handle(uuid)
 
         # then
         self.use_case.execute.assert_called_with(uuid)
         self.assertEqual(result.body, b'{"message":"uuid was deleted"}')
 
-    def test_handle_image_with_incorrect_uuid(self) -> None:
+    async def test_handle_image_with_incorrect_uuid(self) -> None:
         # given
         uuid = "uuid"
         self.use_case.execute.return_value = False
 
         # when
-        result = self.handler.handle(uuid)
+        result = await self.handler.handle(uuid)
 
         # then
         self.use_case.execute.assert_called_with(uuid)
         self.assertEqual(result.body, b'{"error":"Image not found"}')
 
 
-class TestDownloadHandler(TestCase):
+class TestBulkDeleteHandler(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.use_case = Mock(ImageUseCase)
+        self.handler = BulkDeleteHandler(self.use_case)
+
+    async def test_handle_reports_each_uuid(self) -> None:
+        # given
+        self.use_case.execute.return_value = {
+            "first": True,
+            "second": False,
+            "third": OSError(),
+        }
+
+        # when
+        result = await self.handler.handle(["first", "second", "third"], None)
+
+        # then
+        self.use_case.execute.assert_called_once_with(
+            ["first", "second", "third"], None
+        )
+        self.assertEqual(
+            json.loads(result.body),
+            [
+                {"uuid": "first", "message": "first was deleted"},
+                {"uuid": "second", "error": "Image not found"},
+                {"uuid": "third", "error": "Delete failed"},
+            ],
+        )
+
+
+class TestExportHandler(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.use_case = Mock(ImageUseCase)
+        self.handler = ExportHandler(self.use_case)
+
+    async def test_handle_streams_archive(self) -> None:
+        # given
+        self.use_case.execute.return_value = iter([b"PK"])
+
+        # when
+        result = await self.handler.handle(None, "client_id")
+
+        # then
+        self.use_case.execute.assert_called_once_with(None, "client_id")
+        self.assertIsInstance(result, StreamingResponse)
+        self.assertEqual(result.media_type, "application/zip")
+        self.assertEqual(
+            result.headers["Content-Disposition"],
+            'attachment; filename="client_id.zip"',
+        )
+
+    async def test_handle_no_images(self) -> None:
+        # given
+        self.use_case.execute.return_value = None
+
+        # when
+        result = await self.handler.handle(["uuid"], None)
+
+        # then
+        self.assertEqual(result.status_code, 404)
+
+    async def test_handle_requires_one_selector(self) -> None:
+        # when
+        result = await self.handler.handle(["uuid"], "client_id")
+
+        # then
+        self.assertEqual(result.status_code, 400)
+        self.use_case.execute.assert_not_called()
+
+
+class TestMetadataHandler(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.use_case = Mock(ImageUseCase)
+        self.handler = MetadataHandler(self.use_case)
+        self.images = [
+            {
+                "_id": ObjectId(),
+                "file_path": f"client_id/uuid_{index}",
+                "uuid": f"uuid_{index}",
+                "client_id": "client_id",
+                "file_name": "test.png",
+                "content_type": "image/png",
+                "tags": {"timestamp": f"2022-08-01T00:00:0{index}"},
+            }
+            for index in range(3)
+        ]
+
+    @staticmethod
+    async def read_body(response: StreamingResponse) -> bytes:
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    def expected(self, images: list[dict]) -> list[dict]:
+        return [ImageDocument(**image).dict() for image in images]
+
+    async def test_handle_streams_all_images(self) -> None:
+        # given
+        self.use_case.execute.return_value = iter(self.images)
+
+        # when
+        result = await self.handler.handle("client_id")
+
+        # then
+        self.use_case.execute.assert_called_with("client_id", None, None)
+        self.assertEqual(
+            json.loads(await self.read_body(result)), self.expected(self.images)
+        )
+
+    async def test_handle_streams_no_images(self) -> None:
+        # given
+        self.use_case.execute.return_value = iter([])
+
+        # when
+        result = await self.handler.handle("client_id")
+
+        # then
+        self.assertEqual(json.loads(await self.read_body(result)), [])
+
+    async def test_handle_ndjson(self) -> None:
+        # given
+        self.use_case.execute.return_value = iter(self.images)
+
+        # when
+        result = await self.handler.handle("client_id", response_format="ndjson")
 
+        # then
+        lines = (await self.read_body(result)).splitlines()
+        self.assertEqual(result.media_type, "application/x-ndjson")
+        self.assertEqual(
+            [json.loads(line) for line in lines], self.expected(self.images)
+        )
+
+    async def test_handle_page_with_next_cursor(self) -> None:
+        # given
+        self.use_case.execute.return_value = iter(self.images)
+
+        # when
+        result = await self.handler.handle("client_id", limit=2)
+
+        # then
+        self.use_case.execute.assert_called_with("client_id", 3, None)
+        self.assertEqual(json.loads(result.body), self.expected(self.images[:2]))
+        self.assertEqual(
+            decode_cursor(result.headers["X-Next-Cursor"]),
+            ("2022-08-01T00:00:01", self.images[1]["_id"]),
+        )
+
+    async def test_handle_ndjson_page_with_next_cursor(self) -> None:
+        # given
+        self.use_case.execute.return_value = iter(self.images)
+
+        # when
+        result = await self.handler.handle(
+            "client_id", limit=2, response_format="ndjson"
+        )
+
+        # then
+        self.use_case.execute.assert_called_with("client_id", 3, None)
+        self.assertEqual(result.media_type, "application/x-ndjson")
+        self.assertEqual(
+            [json.loads(line) for line in result.body.splitlines()],
+            self.expected(self.images[:2]),
+        )
+        self.assertEqual(
+            decode_cursor(result.headers["X-Next-Cursor"]),
+            ("2022-08-01T00:00:01", self.images[1]["_id"]),
+        )
+
+    async def test_handle_last_page(self) -> None:
+        # given
+        self.use_case.execute.return_value = iter(self.images)
+        cursor = encode_cursor(self.images[0])
+
+        # when
+        result = await self.handler.handle("client_id", limit=5, cursor=cursor)
+
+        # then
+        self.use_case.execute.assert_called_with(
+            "client_id", 6, ("2022-08-01T00:00:00", self.images[0]["_id"])
+        )
+        self.assertNotIn("X-Next-Cursor", result.headers)
+
+    async def test_handle_invalid_cursor(self) -> None:
+        # when
+        result = await self.handler.handle("client_id", limit=5, cursor="invalid")
+
+        # then
+        self.assertEqual(result.status_code, 400)
+        self.use_case.execute.assert_not_called()
+
+
+class TestDownloadHandlerCaching(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.use_case = Mock(ImageUseCase)
+        self.handler = DownloadHandler(self.use_case, "public, max-age=60")
+
+    async def test_handle_not_modified(self) -> None:
+        # given
+        self.use_case.execute.return_value = NotModified('"hash"')
+
+        # when
+        result = await self.handler.handle("uuid", if_none_match='"hash"')
+
+        # then
+        self.use_case.execute.assert_called_with("uuid", None, [], '"hash"')
+        self.assertEqual(result.status_code, 304)
+        self.assertEqual(result.headers["ETag"], '"hash"')
+        self.assertEqual(result.headers["Cache-Control"], "public, max-age=60")
+        self.assertEqual(result.body, b"")
+
+    async def test_handle_immutable_file(self) -> None:
+        # given
+        self.use_case.execute.return_value = StoredFile(
+            file_name="test.jpeg",
+            content_type="image/jpeg",
+            content_length=1,
+            etag='"hash"',
+            last_modified=None,
+            iter_range=lambda start, end: iter([b"x"]),
+            immutable=True,
+        )
+
+        # when
+        result = await self.handler.handle("uuid")
+
+        # then
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.headers["ETag"], '"hash"')
+        self.assertEqual(result.headers["Cache-Control"], "public, max-age=60")
+
+    async def test_handle_not_modified_by_file_etag(self) -> None:
+        # given
+        self.use_case.execute.return_value = StoredFile(
+            file_name="test.jpeg",
+            content_type="image/jpeg",
+            content_length=1,
+            etag='"azure"',
+            last_modified=None,
+            iter_range=lambda start, end: iter([b"x"]),
+        )
+
+        # when
+        result = await self.handler.handle("uuid", if_none_match='W/"azure"')
+
+        # then
+        self.assertEqual(result.status_code, 304)
+        self.assertNotIn("Cache-Control", result.headers)
+
+
+class TestDownloadHandler(IsolatedAsyncioTestCase):
     def setUp(self) -> None:
         self.use_case = Mock(ImageUseCase)
         self.handler = DownloadHandler(self.use_case)
+        self.content = b"0123456789"
+        self.use_case.execute.return_value = StoredFile(
+            file_name="test.jpeg",
+            content_type="image/jpeg",
+            content_length=len(self.content),
+            etag='"etag"',
+            last_modified=datetime(2022, 8, 1, tzinfo=timezone.utc),
+            iter_range=lambda start, end: iter([self.content[start : end + 1]]),
+        )
+
+    @staticmethod
+    async def read_body(response: StreamingResponse) -> bytes:
+        return b"".join([chunk async for chunk in response.body_iterator])
 
-    def test_handle_image_with_correct_uuid(self) -> None:
+    async def test_handle_image_with_correct_uuid(self) -> None:
         # given
         uuid = "uuid"
-        self.use_case.execute.return_value = "image", "image/jpeg"
 
         # when
-        result = self.handler.handle(uuid)
+        result = await self.handler.handle(uuid)
 
         # then
-        self.use_case.execute.assert_called_with(uuid)
-        self.assertEqual(result.body, b'image')
+        self.use_case.execute.assert_called_with(uuid, None, [], None)
+        self.assertEqual(result.headers["Vary"], "Accept")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.headers["Content-Length"], "10")
+        self.assertEqual(result.headers["ETag"], '"etag"')
+        self.assertEqual(await self.read_body(result), self.content)
+
+    async def test_handle_rendition(self) -> None:
+        # when
+        await self.handler.handle("uuid", size="128")
+
+        # then
+        self.use_case.execute.assert_called_with("uuid", "128", [], None)
+
+    async def test_handle_accept(self) -> None:
+        # when
+        await self.handler.handle("uuid", accept="image/avif,image/webp,*/*;q=0.8")
+
+        # then
+        self.use_case.execute.assert_called_with("uuid", None, ["avif", "webp"], None)
+
+    async def test_handle_image_with_incorrect_uuid(self) -> None:
+        # given
+        self.use_case.execute.return_value = None
+
+        # when
+        result = await self.handler.handle("uuid")
+
+        # then
+        self.assertEqual(result.status_code, 404)
+        self.assertEqual(result.body, b'{"error":"Image not found"}')
+
+    async def test_handle_image_on_local_disk(self) -> None:
+        # given
+        self.use_case.execute.return_value.path = "/data/files/cache/image"
+
+        # when
+        result = await self.handler.handle("uuid")
+
+        # then
+        self.assertIsInstance(result, FileResponse)
+        self.assertEqual(result.headers["ETag"], '"etag"')
+
+    async def test_handle_range(self) -> None:
+        # when
+        result = await self.handler.handle("uuid", "bytes=2-5")
+
+        # then
+        self.assertEqual(result.status_code, 206)
+        self.assertEqual(result.headers["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(result.headers["Content-Length"], "4")
+        self.assertEqual(await self.read_body(result), b"2345")
+
+    async def test_handle_unsatisfiable_range(self) -> None:
+        # when
+        result = await self.handler.handle("uuid", "bytes=20-")
+
+        # then
+        self.assertEqual(result.status_code, 416)
+        self.assertEqual(result.headers["Content-Range"], "bytes */10")
+
+    async def test_handle_range_with_stale_if_range(self) -> None:
+        # when
+        result = await self.handler.handle("uuid", "bytes=2-5", '"stale"')
+
+        # then
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(await self.read_body(result), self.content)
@@ -1,21 +1,102 @@
-from unittest import TestCase
-from unittest.mock import patch
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, Mock
 
-from app.http_client import AuthenticationHttpClient
+from app.cache import TTLCache
+from app.http_client import AuthenticationHttpClient, CachedAuthenticationHttpClient
 
 
-class TestHttpClient(TestCase):
+class TestHttpClient(IsolatedAsyncioTestCase):
     def setUp(self) -> None:
-        self.http_client = AuthenticationHttpClient("https://example.com")
+        self.http_client = AuthenticationHttpClient("https://example.com", timeout=2)
+        self.http_client.session = Mock()
 
-    @patch("app.http_client.requests.get")
-    def test_get(self, mock_get):
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.text = "token"
-        response = self.http_client.get("token")
+    async def test_get(self):
+        self.http_client.session.get.return_value.status_code = 200
+        self.http_client.session.get.return_value.text = "token"
+        response = await self.http_client.get("token")
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.text, "token")
-        mock_get.assert_called_once_with(
-            "https://example.com", headers={"Authorization": "token"}
+        self.http_client.session.get.assert_called_once_with(
+            "https://example.com", headers={"Authorization": "token"}, timeout=2
         )
+
+
+class TestCachedHttpClient(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.inner_client = Mock()
+        self.inner_client.get = AsyncMock()
+        self.cache = TTLCache(max_size=10, ttl=60)
+        self.http_client = CachedAuthenticationHttpClient(
+            self.inner_client, self.cache, negative_ttl=5
+        )
+
+    async def test_successful_lookup_is_cached(self) -> None:
+        self.inner_client.get.return_value.status_code = 200
+
+        first = await self.http_client.get("token")
+        second = await self.http_client.get("token")
+
+        self.inner_client.get.assert_awaited_once_with("token")
+        self.assertIs(first, second)
+        self.assertEqual(self.cache.hits, 1)
+
+    async def test_rejected_token_is_cached(self) -> None:
+        self.inner_client.get.return_value.status_code = 401
+
+        await self.http_client.get("token")
+        response = await self.http_client.get("token")
+
+        self.inner_client.get.assert_awaited_once_with("token")
+        self.assertEqual(response.status_code, 401)
+
+    async def test_server_error_is_not_cached(self) -> None:
+        self.inner_client.get.return_value.status_code = 503
+
+        await self.http_client.get("token")
+        await self.http_client.get("token")
+
+        self.assertEqual(self.inner_client.get.await_count, 2)
+
+    async def test_concurrent_lookups_share_one_request(self) -> None:
+        async def slow_get(auth_token: str) -> Mock:
+            await asyncio.sleep(0.01)
+            return Mock(status_code=200)
+
+        self.inner_client.get.side_effect = slow_get
+
+        responses = await asyncio.gather(
+            *(self.http_client.get("token") for _ in range(5))
+        )
+
+        self.assertEqual(self.inner_client.get.await_count, 1)
+        self.assertEqual(len({id(response) for response in responses}), 1)
+
+    async def test_cancelled_lookup_does_not_strand_waiters(self) -> None:
+        started = asyncio.Event()
+
+        async def slow_get(auth_token: str) -> Mock:
+            started.set()
+            await asyncio.sleep(0.01)
+            return Mock(status_code=200)
+
+        self.inner_client.get.side_effect = slow_get
+        first = asyncio.create_task(self.http_client.get("token"))
+        await started.wait()
+        second = asyncio.create_task(self.http_client.get("token"))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        response = await asyncio.wait_for(second, timeout=1)
+
+        self.assertTrue(first.cancelled())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.inner_client.get.await_count, 2)
+
+    async def test_tokens_are_not_kept_in_plain_text(self) -> None:
+        self.inner_client.get.return_value.status_code = 200
+
+        await self.http_client.get("secret-token")
+
+        self.assertNotIn("secret-token", self.cache.entries)
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+from unittest import TestCase
+
+from app.metrics import (
+    CACHE_HIT_RATIO,
+    CACHE_LOOKUPS,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    track_cache,
+)
+
+
+class TestMetrics(TestCase):
+    def setUp(self) -> None:
+        self.registry = MetricsRegistry()
+
+    def test_counter(self) -> None:
+        counter = Counter("requests_total", "Requests.", ["route"], self.registry)
+
+        counter.labels("upload").inc()
+        counter.labels("upload").inc(2)
+        counter.labels('say "hi"').inc()
+
+        self.assertEqual(
+            self.registry.render(),
+            "# HELP requests_total Requests.\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{route="upload"} 3.0\n'
+            'requests_total{route="say \\"hi\\""} 1.0\n',
+        )
+
+    def test_gauge_reads_function(self) -> None:
+        gauge = Gauge("queued", "Queued jobs.", registry=self.registry)
+        queue = []
+        gauge.labels().set_function(lambda: len(queue))
+
+        queue.append("job")
+
+        self.assertIn("queued 1.0\n", self.registry.render())
+
+    def test_histogram(self) -> None:
+        histogram = Histogram(
+            "duration_seconds", "Duration.", ["stage"], [0.1, 1], self.registry
+        )
+
+        with histogram.labels("decode").time():
+            pass
+        histogram.labels("decode").observe(0.5)
+        histogram.labels("decode").observe(5)
+
+        self.assertEqual(
+            self.registry.render().splitlines()[2:],
+            [
+                'duration_seconds_bucket{stage="decode",le="0.1"} 1.0',
+                'duration_seconds_bucket{stage="decode",le="1.0"} 2.0',
+                'duration_seconds_bucket{stage="decode",le="+Inf"} 3.0',
+                f'duration_seconds_sum{{stage="decode"}} '
+                f"{histogram.labels('decode').sum!r}",
+                'duration_seconds_count{stage="decode"} 3.0',
+            ],
+        )
+
+    def test_labels_must_match(self) -> None:
+        counter = Counter("requests_total", "Requests.", ["route"], self.registry)
+
+        with self.assertRaises(ValueError):
+            counter.labels("upload", "extra")
+
+    def test_track_cache(self) -> None:
+        cache = SimpleNamespace(hits=0, misses=0)
+        track_cache("test", cache)
+
+        self.assertEqual(CACHE_HIT_RATIO.labels("test").get(), 0.0)
+
+        cache.hits, cache.misses = 3, 1
+
+        self.assertEqual(CACHE_LOOKUPS.labels("test", "hit").get(), 3)
+        self.assertEqual(CACHE_LOOKUPS.labels("test", "miss").get(), 1)
+        self.assertEqual(CACHE_HIT_RATIO.labels("test").get(), 0.75)
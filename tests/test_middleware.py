@@ -0,0 +1,158 @@
+from unittest import TestCase
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from starlette.responses import Response, StreamingResponse
+
+from app.metrics import HTTP_BYTES, REQUEST_SECONDS, REQUESTS_IN_FLIGHT
+from app.middleware import (
+    ApiKeyMiddleware,
+    MetricsMiddleware,
+    UploadSizeLimitMiddleware,
+)
+
+
+class TestApiKeyMiddleware(TestCase):
+    def setUp(self) -> None:
+        self.client = TestClient(self._app("key"))
+
+    @staticmethod
+    def _app(api_key: str | None) -> FastAPI:
+        app = FastAPI()
+        app.add_middleware(ApiKeyMiddleware, api_key=api_key)
+
+        @app.get("/api/images/health")
+        @app.get("/metrics")
+        async def health() -> dict:
+            return {"status": "ok"}
+
+        @app.api_route("/api/images/stream", methods=["GET", "POST", "OPTIONS"])
+        @app.get("/api/images/stream/{name}")
+        async def stream() -> StreamingResponse:
+            return StreamingResponse(chunk for chunk in [b"first", b"second"])
+
+        return app
+
+    def test_valid_key(self) -> None:
+        response = self.client.get(
+            "/api/images/stream", headers={"Authorization": "key"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"firstsecond")
+
+    def test_invalid_key(self) -> None:
+        response = self.client.get(
+            "/api/images/stream", headers={"Authorization": "other"}
+        )
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {"message": "Unauthorized"})
+
+    def test_missing_key(self) -> None:
+        response = self.client.get("/api/images/stream")
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_exempt_paths(self) -> None:
+        for path in ["/api/images/health", "/metrics"]:
+            self.assertEqual(self.client.get(path).status_code, 200)
+
+    def test_paths_ending_like_exempt_paths_need_key(self) -> None:
+        for path in ["/api/images/stream/metrics", "/api/images/stream/health"]:
+            self.assertEqual(self.client.get(path).status_code, 401)
+
+    def test_exempt_methods(self) -> None:
+        for method in ["POST", "OPTIONS"]:
+            response = self.client.request(method, "/api/images/stream")
+
+            self.assertEqual(response.status_code, 200)
+
+    def test_unset_key_admits_requests_without_header(self) -> None:
+        client = TestClient(self._app(None))
+
+        self.assertEqual(client.get("/api/images/stream").status_code, 200)
+        response = client.get("/api/images/stream", headers={"Authorization": "key"})
+        self.assertEqual(response.status_code, 401)
+
+
+class TestUploadSizeLimitMiddleware(TestCase):
+    def setUp(self) -> None:
+        app = FastAPI()
+        app.add_middleware(
+            UploadSizeLimitMiddleware, max_bytes=10, path_max_bytes={"/batch": 20}
+        )
+        self.read = []
+
+        @app.post("/upload")
+        @app.post("/batch")
+        async def upload(request: Request) -> dict:
+            async for chunk in request.stream():
+                self.read.append(chunk)
+            return {"size": len(b"".join(self.read))}
+
+        self.client = TestClient(app)
+
+    def test_body_within_limit(self) -> None:
+        response = self.client.post("/upload", data=b"0123456789")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"size": 10})
+
+    def test_declared_length_over_limit(self) -> None:
+        response = self.client.post("/upload", data=b"0123456789a")
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json(), {"error": "Request body exceeds 10 bytes"})
+        self.assertEqual(self.read, [])
+
+    def test_streamed_body_over_limit(self) -> None:
+        response = self.client.post(
+            "/upload", data=(chunk for chunk in [b"012345", b"6789ab", b"cdef"])
+        )
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.read, [b"012345"])
+
+    def test_path_limit(self) -> None:
+        response = self.client.post("/batch", data=b"0123456789abcdef")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"size": 16})
+
+
+class TestMetricsMiddleware(TestCase):
+    def setUp(self) -> None:
+        app = FastAPI()
+        app.add_middleware(UploadSizeLimitMiddleware, max_bytes=10)
+        app.add_middleware(MetricsMiddleware)
+
+        @app.post("/images/{uuid}")
+        async def echo_image(request: Request) -> Response:
+            return Response(content=await request.body())
+
+        self.client = TestClient(app)
+
+    @staticmethod
+    def _count(*labels: str) -> int:
+        child = REQUEST_SECONDS.children.get(labels)
+        return sum(child.counts) if child else 0
+
+    def test_requests_are_labelled_by_endpoint(self) -> None:
+        count = self._count("POST", "echo_image", "200")
+        sent = HTTP_BYTES.labels("echo_image", "sent").get()
+
+        response = self.client.post("/images/first", data=b"01234")
+        self.client.post("/images/second", data=b"56789")
+
+        self.assertEqual(response.content, b"01234")
+        self.assertEqual(self._count("POST", "echo_image", "200"), count + 2)
+        self.assertEqual(HTTP_BYTES.labels("echo_image", "sent").get(), sent + 10)
+        self.assertEqual(REQUESTS_IN_FLIGHT.labels("POST").get(), 0)
+
+    def test_requests_rejected_before_routing(self) -> None:
+        count = self._count("POST", "unmatched", "413")
+
+        self.client.post("/images/first", data=b"0123456789a")
+
+        self.assertEqual(self._count("POST", "unmatched", "413"), count + 1)
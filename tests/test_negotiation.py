@@ -0,0 +1,25 @@
+from unittest import TestCase
+
+from app.negotiation import accepted_image_formats
+
+
+class TestAcceptedImageFormats(TestCase):
+    def test_no_header(self) -> None:
+        self.assertEqual(accepted_image_formats(None), [])
+
+    def test_browser_header(self) -> None:
+        self.assertEqual(
+            accepted_image_formats(
+                "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8"
+            ),
+            ["avif", "webp", "apng", "svg+xml"],
+        )
+
+    def test_quality_order(self) -> None:
+        self.assertEqual(
+            accepted_image_formats("image/webp;q=0.5, image/jpeg, image/avif;q=0"),
+            ["jpeg", "webp"],
+        )
+
+    def test_invalid_quality_is_ignored(self) -> None:
+        self.assertEqual(accepted_image_formats("image/webp;q=high"), [])
@@ -0,0 +1,34 @@
+import base64
+import json
+from unittest import TestCase
+
+from bson import ObjectId
+
+from app.pagination import InvalidCursorError, batched, decode_cursor, encode_cursor
+
+
+class TestCursor(TestCase):
+    @staticmethod
+    def operator_cursor() -> str:
+        position = [{"$ne": None}, str(ObjectId())]
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def test_round_trip(self) -> None:
+        object_id = ObjectId()
+        document = {"_id": object_id, "tags": {"timestamp": "2022-08-01T00:00:00"}}
+
+        self.assertEqual(
+            decode_cursor(encode_cursor(document)),
+            ("2022-08-01T00:00:00", object_id),
+        )
+
+    def test_invalid_cursor(self) -> None:
+        for cursor in ["invalid", "W10=", "WyJhIiwgImIiXQ==", self.operator_cursor()]:
+            with self.assertRaises(InvalidCursorError):
+                decode_cursor(cursor)
+
+
+class TestBatched(TestCase):
+    def test_batched(self) -> None:
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(batched([], 2)), [])
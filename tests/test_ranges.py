@@ -0,0 +1,87 @@
+from datetime import datetime, timezone
+from unittest import TestCase
+
+from app.ranges import (
+    RangeNotSatisfiableError,
+    http_date,
+    if_none_match_matches,
+    if_range_matches,
+    parse_range,
+)
+
+
+class TestParseRange(TestCase):
+    def test_no_header(self) -> None:
+        self.assertIsNone(parse_range(None, 100))
+
+    def test_closed_range(self) -> None:
+        self.assertEqual(parse_range("bytes=10-19", 100), (10, 19))
+
+    def test_open_range(self) -> None:
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 99))
+
+    def test_suffix_range(self) -> None:
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=-500", 100), (0, 99))
+
+    def test_end_is_clamped_to_file(self) -> None:
+        self.assertEqual(parse_range("bytes=50-500", 100), (50, 99))
+
+    def test_ignored_ranges(self) -> None:
+        self.assertIsNone(parse_range("items=0-10", 100))
+        self.assertIsNone(parse_range("bytes=0-10,20-30", 100))
+        self.assertIsNone(parse_range("bytes=abc-", 100))
+        self.assertIsNone(parse_range("bytes=20-10", 100))
+
+    def test_unsatisfiable_ranges(self) -> None:
+        with self.assertRaises(RangeNotSatisfiableError):
+            parse_range("bytes=100-", 100)
+        with self.assertRaises(RangeNotSatisfiableError):
+            parse_range("bytes=-0", 100)
+
+
+class TestIfRange(TestCase):
+    def setUp(self) -> None:
+        self.last_modified = datetime(2022, 8, 1, 12, 0, tzinfo=timezone.utc)
+
+    def test_missing_if_range_matches(self) -> None:
+        self.assertTrue(if_range_matches(None, '"etag"', self.last_modified))
+
+    def test_etag(self) -> None:
+        self.assertTrue(if_range_matches('"etag"', '"etag"', self.last_modified))
+        self.assertFalse(if_range_matches('"other"', '"etag"', self.last_modified))
+
+    def test_last_modified(self) -> None:
+        self.assertTrue(
+            if_range_matches(
+                "Mon, 01 Aug 2022 12:00:00 GMT", '"etag"', self.last_modified
+            )
+        )
+        self.assertFalse(
+            if_range_matches(
+                "Tue, 02 Aug 2022 12:00:00 GMT", '"etag"', self.last_modified
+            )
+        )
+
+    def test_http_date(self) -> None:
+        self.assertEqual(http_date(self.last_modified), "Mon, 01 Aug 2022 12:00:00 GMT")
+
+
+class TestIfNoneMatchMatches(TestCase):
+    def test_no_header(self) -> None:
+        self.assertFalse(if_none_match_matches(None, '"etag"'))
+
+    def test_no_etag(self) -> None:
+        self.assertFalse(if_none_match_matches('"etag"', None))
+
+    def test_any_of_several_tags(self) -> None:
+        self.assertTrue(if_none_match_matches('"other", "etag"', '"etag"'))
+
+    def test_weak_comparison(self) -> None:
+        self.assertTrue(if_none_match_matches('W/"etag"', '"etag"'))
+
+    def test_wildcard(self) -> None:
+        self.assertTrue(if_none_match_matches("*", '"etag"'))
+
+    def test_different_tag(self) -> None:
+        self.assertFalse(if_none_match_matches('"other"', '"etag"'))
@@ -1,11 +1,11 @@
 from collections import namedtuple
-from unittest import TestCase
+from unittest import IsolatedAsyncioTestCase, TestCase
 from unittest.mock import Mock, sentinel
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from pymongo.collection import Collection
 
-from app.repositories import ImageRepository
+from app.repositories import AsyncImageRepository, ImageRepository
 
 
 class TestImageRepository(TestCase):
@@ -19,6 +19,117 @@ class TestImageRepository(TestCase):
         self.collection = Mock(Collection)
         self.repository.collection = self.collection
 
+    def test_ensure_indexes(self) -> None:
+        self.repository.ensure_indexes()
+
+        indexes = self.collection.create_indexes.call_args.args[0]
+        self.assertEqual(
+            [index.document["key"] for index in indexes],
+            [
+                {"uuid": 1},
+                {"client_id": 1, "tags.timestamp": 1, "_id": 1},
+                {"status": 1},
+            ],
+        )
+        self.assertTrue(indexes[0].document["unique"])
+
+    def test_delete_images(self) -> None:
+        database_result = namedtuple("obj", ["deleted_count"])(2)
+        self.collection.delete_many.return_value = database_result
+
+        result = self.repository.delete_images(["first", "second"])
+
+        self.collection.delete_many.assert_called_once_with(
+            {"uuid": {"$in": ["first", "second"]}}
+        )
+        self.assertEqual(result, 2)
+
+    def test_pop_images(self) -> None:
+        database_result = namedtuple("obj", ["deleted_count"])(1)
+        self.collection.find.return_value = [sentinel.document]
+        self.collection.delete_many.return_value = database_result
+
+        result = self.repository.pop_images(["first", "second"], sentinel.projection)
+
+        query, update = self.collection.update_many.call_args.args
+        self.assertEqual(query["uuid"], {"$in": ["first", "second"]})
+        claim = update["$set"]["deleted_by"]
+        self.collection.find.assert_called_once_with(
+            {"deleted_by": claim}, sentinel.projection
+        )
+        self.collection.delete_many.assert_called_once_with({"deleted_by": claim})
+        self.assertEqual(result, [sentinel.document])
+
+    def test_query_images_matching_any_value(self) -> None:
+        self.collection.find.return_value = [sentinel.document]
+
+        result = self.repository.query_images("uuid", ["first", "second"])
+
+        self.collection.find.assert_called_once_with(
+            {"uuid": {"$in": ["first", "second"]}}, None
+        )
+        self.assertEqual(result, [sentinel.document])
+
+    def test_query_image_with_projection(self) -> None:
+        self.repository.query_image(sentinel.key, sentinel.value, {"file_name": 1})
+
+        self.collection.find_one.assert_called_once_with(
+            {sentinel.key: sentinel.value}, {"file_name": 1}
+        )
+
+    def test_update_image(self) -> None:
+        database_result = namedtuple("obj", ["modified_count"])(1)
+        self.collection.update_one.return_value = database_result
+
+        result = self.repository.update_image(sentinel.uuid, {"status": "ready"})
+
+        self.collection.update_one.assert_called_once_with(
+            {"uuid": "sentinel.uuid"}, {"$set": {"status": "ready"}}
+        )
+        self.assertTrue(result)
+
+    def test_acquire_blob(self) -> None:
+        blobs = Mock(Collection)
+        self.repository.blobs = blobs
+        blobs.find_one_and_update.return_value = sentinel.blob
+
+        result = self.repository.acquire_blob("hash")
+
+        blobs.find_one_and_update.assert_called_once_with(
+            {"_id": "hash"},
+            {"$inc": {"refcount": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        self.assertEqual(result, sentinel.blob)
+
+    def test_register_blob(self) -> None:
+        blobs = Mock(Collection)
+        self.repository.blobs = blobs
+
+        self.repository.register_blob("hash", {"file_path": "_blobs/hash.uuid"})
+
+        blobs.find_one_and_update.assert_called_once_with(
+            {"_id": "hash"},
+            {
+                "$inc": {"refcount": 1},
+                "$setOnInsert": {"file_path": "_blobs/hash.uuid"},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def test_delete_blob_only_without_references(self) -> None:
+        blobs = Mock(Collection)
+        self.repository.blobs = blobs
+        blobs.delete_one.return_value = namedtuple("obj", ["deleted_count"])(0)
+
+        result = self.repository.delete_blob("hash")
+
+        blobs.delete_one.assert_called_once_with(
+            {"_id": "hash", "refcount": {"$lte": 0}}
+        )
+        self.assertFalse(result)
+
     def test_put_image(self) -> None:
         database_result = namedtuple("obj", ["inserted_id"])(sentinel.id)
 
@@ -31,6 +142,28 @@ class TestImageRepository(TestCase):
         )
         self.assertEqual(result, sentinel.id)
 
+    def test_put_images(self) -> None:
+        database_result = namedtuple("obj", ["inserted_ids"])([sentinel.id])
+        self.collection.insert_many.return_value = database_result
+
+        result = self.repository.put_images([{sentinel.key: sentinel.value}])
+
+        self.collection.insert_many.assert_called_once_with(
+            [{sentinel.key: sentinel.value}], ordered=False
+        )
+        self.assertEqual(result, [sentinel.id])
+
+    def test_add_variant(self) -> None:
+        database_result = namedtuple("obj", ["modified_count"])(1)
+        self.collection.update_one.return_value = database_result
+
+        result = self.repository.add_variant("uuid", "test.webp")
+
+        self.collection.update_one.assert_called_once_with(
+            {"uuid": "uuid"}, {"$addToSet": {"variants": "test.webp"}}
+        )
+        self.assertTrue(result)
+
     def test_delete_image(self) -> None:
         database_result = namedtuple("obj", ["deleted_count"])(1)
         self.collection.delete_one.return_value = database_result
@@ -46,14 +179,114 @@ class TestImageRepository(TestCase):
 
         result = self.repository.query_images(sentinel.key, sentinel.value)
 
-        self.collection.find.assert_called_once_with({sentinel.key: sentinel.value})
+        self.collection.find.assert_called_once_with(
+            {sentinel.key: sentinel.value}, None
+        )
         self.assertEqual(result, database_result)
 
+    def test_find_images(self) -> None:
+        cursor = self.collection.find.return_value
+        cursor.sort.return_value.limit.return_value.batch_size.return_value = cursor
+
+        result = self.repository.find_images(
+            "client_id", sentinel.client_id, sentinel.projection, None, 10
+        )
+
+        self.collection.find.assert_called_once_with(
+            {"client_id": sentinel.client_id}, sentinel.projection
+        )
+        cursor.sort.assert_called_once_with([("tags.timestamp", 1), ("_id", 1)])
+        cursor.sort.return_value.limit.assert_called_once_with(10)
+        self.assertEqual(result, cursor)
+
+    def test_find_images_after_position(self) -> None:
+        self.repository.find_images(
+            "client_id", sentinel.client_id, None, ("2022-08-01", sentinel.id)
+        )
+
+        self.collection.find.assert_called_once_with(
+            {
+                "client_id": sentinel.client_id,
+                "$or": [
+                    {"tags.timestamp": {"$gt": "2022-08-01"}},
+                    {"tags.timestamp": "2022-08-01", "_id": {"$gt": sentinel.id}},
+                ],
+            },
+            None,
+        )
+
     def test_query_image(self) -> None:
         database_result = {"_id": sentinel.id, "uuid": sentinel.uuid}
         self.collection.find_one.return_value = database_result
 
         result = self.repository.query_image(sentinel.key, sentinel.value)
 
-        self.collection.find_one.assert_called_once_with({sentinel.key: sentinel.value})
+        self.collection.find_one.assert_called_once_with(
+            {sentinel.key: sentinel.value}, None
+        )
         self.assertEqual(result, database_result)
+
+
+class TestAsyncImageRepository(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.repository = AsyncImageRepository(
+            mongo_client=Mock(MongoClient),
+            database_name=sentinel.database_name,
+            collection_name=sentinel.collection_name,
+        )
+        self.sync_repository = Mock(ImageRepository)
+        self.repository.repository = self.sync_repository
+
+    async def test_put_image(self) -> None:
+        self.sync_repository.put_image.return_value = sentinel.id
+
+        result = await self.repository.put_image({sentinel.key: sentinel.value})
+
+        self.sync_repository.put_image.assert_called_once_with(
+            {sentinel.key: sentinel.value}
+        )
+        self.assertEqual(result, sentinel.id)
+
+    async def test_put_images(self) -> None:
+        self.sync_repository.put_images.return_value = [sentinel.id]
+
+        result = await self.repository.put_images([sentinel.document])
+
+        self.sync_repository.put_images.assert_called_once_with([sentinel.document])
+        self.assertEqual(result, [sentinel.id])
+
+    async def test_delete_image(self) -> None:
+        self.sync_repository.delete_image.return_value = True
+
+        result = await self.repository.delete_image(sentinel.uuid)
+
+        self.sync_repository.delete_image.assert_called_once_with(sentinel.uuid)
+        self.assertTrue(result)
+
+    async def test_delete_images(self) -> None:
+        self.sync_repository.delete_images.return_value = 1
+
+        result = await self.repository.delete_images(["uuid"])
+
+        self.sync_repository.delete_images.assert_called_once_with(["uuid"])
+        self.assertEqual(result, 1)
+
+    async def test_query_images(self) -> None:
+        self.sync_repository.query_images.return_value = [sentinel.document]
+
+        result = await self.repository.query_images(sentinel.key, sentinel.value)
+
+        self.sync_repository.query_images.assert_called_once_with(
+            sentinel.key, sentinel.value, None
+        )
+        self.assertEqual(result, [sentinel.document])
+
+    async def test_query_image(self) -> None:
+        self.sync_repository.query_image.return_value = sentinel.document
+
+        result = await self.repository.query_image(sentinel.key, sentinel.value)
+
+        self.sync_repository.query_image.assert_called_once_with(
+            sentinel.key, sentinel.value, None
+        )
+        self.assertEqual(result, sentinel.document)
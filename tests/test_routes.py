@@ -1,6 +1,6 @@
 import json
 from unittest import TestCase
-from unittest.mock import patch, mock_open, sentinel, ANY, Mock
+from unittest.mock import patch, mock_open, sentinel, ANY, AsyncMock
 from uuid import uuid4
 
 import fastapi.responses
@@ -9,19 +9,24 @@ from requests import Response
 from starlette.responses import JSONResponse
 
 from app.dependencies import (
+    get_batch_upload_handler,
+    get_bulk_delete_handler,
+    get_export_handler,
     get_upload_handler,
     get_delete_handler,
     get_metadata_handler,
     get_download_handler,
+    get_status_handler,
 )
 from app.main import app
 from app.schemas import ImageDocument
+from app.settings import get_settings
 
 
 class TestHandler(TestCase):
     def setUp(self):
         self.client = TestClient(app)
-        self.handler = Mock()
+        self.handler = AsyncMock()
 
     def _check_successful_response(
         self, response: Response, expected_response_json: dict | ImageDocument | list
@@ -66,6 +71,88 @@ class TestHandler(TestCase):
 
             self._check_successful_response(response, expected)
 
+    def test_upload_images(self) -> None:
+        expected = [{"file_name": "first", "uuid": "test_uuid"}]
+        self.handler.handle.return_value = expected
+        app.dependency_overrides[get_batch_upload_handler] = lambda: self.handler
+
+        response = self.client.post(
+            "api/images/upload_batch",
+            files=[
+                ("files", ("first", b"first", "image/jpeg")),
+                ("files", ("second", b"second", "image/png")),
+            ],
+            headers={"User-Token": "test_user_token"},
+        )
+
+        files = self.handler.handle.call_args.args[0]
+        self.assertEqual([file.filename for file in files], ["first", "second"])
+        self.handler.handle.assert_called_once_with(ANY, "test_user_token", False, None)
+        self._check_successful_response(response, expected)
+
+    def test_metrics(self) -> None:
+        response = self.client.get("metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn(
+            "# TYPE image_service_stage_duration_seconds histogram", response.text
+        )
+
+    def test_unauthorized_response_has_cors_headers(self) -> None:
+        response = self.client.get(
+            f"api/images/status/{uuid4()}",
+            headers={"Authorization": "wrong_key", "Origin": "https://example.com"},
+        )
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.headers["access-control-allow-origin"], "*")
+
+    def test_routes_ending_like_exempt_paths_need_key(self) -> None:
+        app.dependency_overrides[get_metadata_handler] = lambda: self.handler
+
+        for client_id in ["metrics", "health"]:
+            response = self.client.get(
+                f"api/images/images_metadata/{client_id}",
+                headers={"Authorization": "wrong_key"},
+            )
+
+            self.assertEqual(response.status_code, 401)
+        self.handler.handle.assert_not_called()
+
+    def test_oversize_upload_response_has_cors_headers(self) -> None:
+        app.dependency_overrides[get_upload_handler] = lambda: self.handler
+        header = (
+            b"--boundary\r\nContent-Disposition: form-data; name=file; "
+            b'filename="image.jpg"\r\nContent-Type: image/jpeg\r\n\r\n'
+        )
+        chunk = b"0" * 1024 * 1024
+        chunks = get_settings().max_upload_bytes // len(chunk) + 1
+
+        response = self.client.post(
+            "api/images/upload",
+            data=(part for part in [header, *[chunk] * chunks]),
+            headers={
+                "Content-Type": "multipart/form-data; boundary=boundary",
+                "Origin": "https://example.com",
+            },
+        )
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.headers["access-control-allow-origin"], "*")
+        self.handler.handle.assert_not_called()
+
+    def test_get_image_status(self) -> None:
+        uuid = uuid4()
+        expected = {"uuid": str(uuid), "status": "pending"}
+        self.handler.handle.return_value = expected
+        app.dependency_overrides[get_status_handler] = lambda: self.handler
+
+        response = self.client.get(f"api/images/status/{uuid}")
+
+        self.handler.handle.assert_called_once_with(uuid)
+        self._check_successful_response(response, expected)
+
     def test_delete_image(self) -> None:
         uuid = uuid4()
         expected = {"Result": "OK"}
@@ -77,6 +164,27 @@ class TestHandler(TestCase):
         self.handler.handle.assert_called_once_with(uuid)
         self._check_successful_response(response, expected)
 
+    def test_delete_images(self) -> None:
+        uuid = uuid4()
+        expected = [{"uuid": str(uuid), "message": f"{uuid} was deleted"}]
+        self.handler.handle.return_value = expected
+        app.dependency_overrides[get_bulk_delete_handler] = lambda: self.handler
+
+        response = self.client.delete(
+            "api/images/delete_batch", json={"uuids": [str(uuid)]}
+        )
+
+        self.handler.handle.assert_called_once_with([uuid], None)
+        self._check_successful_response(response, expected)
+
+    def test_delete_images_requires_one_selector(self) -> None:
+        app.dependency_overrides[get_bulk_delete_handler] = lambda: self.handler
+
+        response = self.client.delete("api/images/delete_batch", json={})
+
+        self.assertEqual(response.status_code, 422)
+        self.handler.handle.assert_not_called()
+
     def test_get_images_for_client_id(self) -> None:
         expected = [
             ImageDocument(
@@ -92,9 +200,49 @@ class TestHandler(TestCase):
 
         response = self.client.get("api/images/images_metadata/test_client_id")
 
-        self.handler.handle.assert_called_once_with("test_client_id")
+        self.handler.handle.assert_called_once_with(
+            "test_client_id", None, None, "json"
+        )
         self._check_successful_response(response, expected)
 
+    def test_get_images_for_client_id_paginated(self) -> None:
+        self.handler.handle.return_value = []
+        app.dependency_overrides[get_metadata_handler] = lambda: self.handler
+
+        response = self.client.get(
+            "api/images/images_metadata/test_client_id",
+            params={"limit": 10, "cursor": "cursor", "format": "ndjson"},
+        )
+
+        self.handler.handle.assert_called_once_with(
+            "test_client_id", 10, "cursor", "ndjson"
+        )
+        self._check_successful_response(response, [])
+
+    def test_get_images_for_client_id_rejects_large_limit(self) -> None:
+        app.dependency_overrides[get_metadata_handler] = lambda: self.handler
+
+        response = self.client.get(
+            "api/images/images_metadata/test_client_id", params={"limit": 5000}
+        )
+
+        self.assertEqual(response.status_code, 422)
+        self.handler.handle.assert_not_called()
+
+    def test_export_images(self) -> None:
+        uuids = [uuid4(), uuid4()]
+        self.handler.handle.return_value = fastapi.responses.Response(
+            content=b"PK", media_type="application/zip"
+        )
+        app.dependency_overrides[get_export_handler] = lambda: self.handler
+
+        response = self.client.get(
+            "api/images/export", params={"uuid": [str(uuid) for uuid in uuids]}
+        )
+
+        self.handler.handle.assert_called_once_with(uuids, None)
+        self.assertEqual(response.content, b"PK")
+
     def test_download_image_uuid(self) -> None:
         uuid = uuid4()
         self.handler.handle.return_value = fastapi.responses.Response(
@@ -104,5 +252,28 @@ class TestHandler(TestCase):
 
         response = self.client.get(f"api/images/download/{uuid}")
 
-        self.handler.handle.assert_called_once_with(uuid)
+        self.handler.handle.assert_called_once_with(uuid, None, None, None, "*/*", None)
         self.assertEqual(response.json(), {"Result": "IMAGE"})
+
+    def test_download_image_range(self) -> None:
+        uuid = uuid4()
+        self.handler.handle.return_value = fastapi.responses.Response(
+            content=b"image", status_code=206
+        )
+        app.dependency_overrides[get_download_handler] = lambda: self.handler
+
+        response = self.client.get(
+            f"api/images/download/{uuid}",
+            params={"size": "128"},
+            headers={
+                "Range": "bytes=0-4",
+                "If-Range": '"etag"',
+                "Accept": "image/webp",
+                "If-None-Match": '"other"',
+            },
+        )
+
+        self.handler.handle.assert_called_once_with(
+            uuid, "bytes=0-4", '"etag"', "128", "image/webp", '"other"'
+        )
+        self.assertEqual(response.status_code, 206)
@@ -1,6 +1,9 @@
 from unittest import TestCase
+from uuid import UUID
 
-from app.schemas import ImageDocument
+from pydantic import ValidationError
+
+from app.schemas import BulkDeleteRequest, ImageDocument
 
 
 class TestModels(TestCase):
@@ -32,3 +35,22 @@ class TestModels(TestCase):
         )
 
         self.assertEqual(image.dict()["tags"], None)
+
+
+class TestBulkDeleteRequest(TestCase):
+    def test_uuids(self) -> None:
+        uuid = "12345678-1234-5678-1234-567812345678"
+
+        request = BulkDeleteRequest(uuids=[uuid])
+
+        self.assertEqual(request.uuids, [UUID(uuid)])
+        self.assertIsNone(request.client_id)
+
+    def test_client_id(self) -> None:
+        self.assertEqual(BulkDeleteRequest(client_id="client").client_id, "client")
+
+    def test_exactly_one_selector(self) -> None:
+        with self.assertRaises(ValidationError):
+            BulkDeleteRequest()
+        with self.assertRaises(ValidationError):
+            BulkDeleteRequest(uuids=[], client_id="client")
@@ -0,0 +1,59 @@
+import json
+from unittest import TestCase
+from unittest.mock import patch
+
+from bson import ObjectId
+
+from app.schemas import ImageDocument
+from app.serialization import _dumps, json_lines, json_objects
+
+
+class TestSerialization(TestCase):
+    def setUp(self) -> None:
+        self.documents = [
+            {
+                "_id": ObjectId(),
+                "file_path": "client_id/uuid",
+                "uuid": "uuid",
+                "client_id": "client_id",
+                "file_name": "straße.jpg",
+                "content_type": "image/jpeg",
+                "tags": {"processed": False, "timestamp": "2022-08-01T00:00:00"},
+                "renditions": {"128": "straße_128.jpg"},
+                "content_hash": "hash",
+                "status": "ready",
+            },
+            {
+                "_id": ObjectId(),
+                "file_path": "client_id/other",
+                "uuid": "other",
+                "client_id": "client_id",
+                "file_name": "other.png",
+                "content_type": "image/png",
+            },
+        ]
+        self.expected = [
+            ImageDocument(**document).dict() for document in self.documents
+        ]
+
+    def test_json_objects(self) -> None:
+        content = b"[" + json_objects(self.documents) + b"]"
+
+        self.assertEqual(json.loads(content), self.expected)
+
+    def test_json_lines(self) -> None:
+        lines = json_lines(self.documents).splitlines()
+
+        self.assertEqual([json.loads(line) for line in lines], self.expected)
+
+    def test_standard_library_fallback(self) -> None:
+        with patch("app.serialization.dumps", _dumps):
+            content = b"[" + json_objects(self.documents) + b"]"
+            lines = json_lines(self.documents).splitlines()
+
+        self.assertEqual(json.loads(content), self.expected)
+        self.assertEqual([json.loads(line) for line in lines], self.expected)
+
+    def test_no_documents(self) -> None:
+        self.assertEqual(json_objects([]), b"")
+        self.assertEqual(json_lines([]), b"")
@@ -0,0 +1,166 @@
+import asyncio
+import struct
+import zlib
+from io import BytesIO
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+
+from PIL import Image
+
+from app.transforms import (
+    ImageTooLargeError,
+    ImageTransformer,
+    TransformQueueFullError,
+    encode_image,
+    supported_formats,
+    transform_image,
+)
+
+
+def create_image(size: tuple[int, int], image_format: str = "PNG") -> bytes:
+    bytes_io = BytesIO()
+    Image.new("RGB", size=size, color=(255, 0, 0)).save(bytes_io, image_format)
+    return bytes_io.getvalue()
+
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + chunk_type
+        + data
+        + struct.pack(">I", zlib.crc32(chunk_type + data))
+    )
+
+
+def create_png_header(size: tuple[int, int]) -> bytes:
+    """A PNG that declares ``size`` but has no pixel data."""
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + png_chunk(b"IHDR", struct.pack(">IIBBBBB", *size, 8, 2, 0, 0, 0))
+        + png_chunk(b"IDAT", b"")
+    )
+
+
+class TestTransformImage(TestCase):
+    def test_transform_image_shrinks_to_size_and_keeps_format(self) -> None:
+        # when
+        (result,) = transform_image(create_image((200, 100), "JPEG"), [(50, 50)])
+
+        # then
+        image = Image.open(BytesIO(result))
+        self.assertEqual(image.size, (50, 25))
+        self.assertEqual(image.format, "JPEG")
+
+    def test_transform_image_to_several_sizes(self) -> None:
+        # when
+        result = transform_image(create_image((400, 200)), [(100, 100), (300, 300)])
+
+        # then
+        self.assertEqual(
+            [Image.open(BytesIO(image)).size for image in result],
+            [(100, 50), (300, 150)],
+        )
+
+    def test_transform_image_decodes_jpeg_at_reduced_scale(self) -> None:
+        # given
+        content = create_image((4000, 3000), "JPEG")
+
+        # when
+        with patch("app.transforms.ImageOps.exif_transpose", wraps=lambda i: i) as spy:
+            (result,) = transform_image(content, [(100, 100)])
+
+        # then
+        self.assertEqual(spy.call_args.args[0].size, (500, 375))
+        self.assertEqual(Image.open(BytesIO(result)).size, (100, 75))
+
+    def test_transform_image_rejects_too_many_pixels(self) -> None:
+        with self.assertRaises(ImageTooLargeError):
+            transform_image(create_image((200, 100)), [(50, 50)], max_pixels=19_999)
+
+    def test_transform_image_rejects_decompression_bomb(self) -> None:
+        content = create_png_header((20_000, 10_000))
+
+        for max_pixels in [64_000_000, None]:
+            with self.assertRaises(ImageTooLargeError):
+                transform_image(content, [(50, 50)], max_pixels=max_pixels)
+
+    def test_transform_image_accepts_max_pixels(self) -> None:
+        # when
+        (result,) = transform_image(
+            create_image((200, 100)), [(50, 50)], max_pixels=20_000
+        )
+
+        # then
+        self.assertEqual(Image.open(BytesIO(result)).size, (50, 25))
+
+
+class TestEncodeImage(TestCase):
+    def test_encode_image_as_webp(self) -> None:
+        # when
+        result = encode_image(create_image((60, 40)), "webp")
+
+        # then
+        image = Image.open(BytesIO(result))
+        self.assertEqual(image.format, "WEBP")
+        self.assertEqual(image.size, (60, 40))
+
+    def test_encode_image_applies_exif_orientation(self) -> None:
+        # given
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotated 90 degrees clockwise
+        bytes_io = BytesIO()
+        Image.new("RGB", (200, 100)).save(bytes_io, "JPEG", exif=exif)
+
+        # when
+        result = encode_image(bytes_io.getvalue(), "webp")
+
+        # then
+        self.assertEqual(Image.open(BytesIO(result)).size, (100, 200))
+
+    def test_encode_palette_image(self) -> None:
+        # given
+        bytes_io = BytesIO()
+        Image.new("P", size=(10, 10)).save(bytes_io, "PNG", transparency=0)
+
+        # when
+        result = encode_image(bytes_io.getvalue(), "webp")
+
+        # then
+        self.assertEqual(Image.open(BytesIO(result)).mode, "RGBA")
+
+    def test_supported_formats(self) -> None:
+        self.assertEqual(supported_formats(["webp", "unknown"]), ["webp"])
+
+
+class TestImageTransformer(IsolatedAsyncioTestCase):
+    async def test_transform_in_each_mode(self) -> None:
+        for mode in ImageTransformer.modes:
+            transformer = ImageTransformer(mode, max_workers=1)
+            try:
+                (result,) = await transformer.transform(
+                    create_image((80, 80)), [(40, 40)]
+                )
+            finally:
+                transformer.shutdown()
+
+            self.assertEqual(Image.open(BytesIO(result)).size, (40, 40))
+
+    async def test_transform_rejects_when_queue_is_full(self) -> None:
+        # given
+        transformer = ImageTransformer("thread", max_workers=1, queue_size=1)
+        content = create_image((2000, 2000))
+
+        # when
+        running = asyncio.ensure_future(transformer.transform(content, [(10, 10)]))
+        await asyncio.sleep(0)
+
+        # then
+        with self.assertRaises(TransformQueueFullError):
+            await transformer.transform(content, [(10, 10)])
+        await running
+        transformer.shutdown()
+        self.assertEqual(transformer.pending, 0)
+
+    def test_unknown_mode(self) -> None:
+        with self.assertRaises(ValueError):
+            ImageTransformer("gpu")
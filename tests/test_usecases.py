@@ -1,27 +1,50 @@
+import asyncio
+import hashlib
+import threading
+import time
+import zipfile
 from io import BytesIO
-from unittest import TestCase
-from unittest.mock import Mock, patch, sentinel, ANY
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import Mock, call, patch, sentinel, ANY
+from uuid import UUID, uuid4
 
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
+from pymongo.errors import BulkWriteError, PyMongoError, WriteError
 
-from app.file_system import AzureFileSystem
-from app.repositories import ImageRepository
+from app.background import BackgroundQueue, BackgroundQueueFullError
+from app.file_system import AzureFileSystem, StoredFile
+from app.repositories import AsyncImageRepository
+from app.transforms import (
+    ImageTooLargeError,
+    ImageTransformer,
+    TransformQueueFullError,
+)
 from app.usecases import (
+    ImageBackgroundUploadUseCase,
+    ImageBatchUploadUseCase,
+    ImageBulkDeleteUseCase,
+    ImageExportUseCase,
     ImageUploadUseCase,
     ImageDeleteUseCase,
     ImageDownloadUseCase,
     ImageMetadataUseCase,
+    ImageStatusUseCase,
+    NotModified,
+    file_etag,
+    hash_file,
 )
 
 
-class TestImageUploadUseCase(TestCase):
+class TestImageUploadUseCase(IsolatedAsyncioTestCase):
     def setUp(self) -> None:
-        self.repository = Mock(ImageRepository)
+        self.repository = Mock(AsyncImageRepository)
         self.file_system = Mock(AzureFileSystem)
-        self.use_case = ImageUploadUseCase(self.repository, self.file_system)
+        self.use_case = ImageUploadUseCase(
+            self.repository, self.file_system, ImageTransformer("inline")
+        )
 
     @patch("app.usecases.uuid4")
-    def test_upload(self, mock_uuid4) -> None:
+    async def test_upload(self, mock_uuid4) -> None:
         # when
         bytes_io = BytesIO()
         image = Image.new("RGBA", size=(50, 50), color=(256, 0, 0))
@@ -30,12 +53,12 @@ class TestImageUploadUseCase(TestCase):
         mock_uuid4.return_value = sentinel.uuid
         file = Mock()
         file_content = bytes_io.read()
-        file.file.read.return_value = file_content
+        file.file = bytes_io
         file.filename = "test.png"
         file.content_type = "image/png"
 
         # when
-        self.use_case.execute(
+        await self.use_case.execute(
             file,
             {"client_id": "test_client_id"},
             sentinel.processed,
@@ -51,98 +74,1355 @@ class TestImageUploadUseCase(TestCase):
                 "file_name": "test.png",
                 "content_type": "image/png",
                 "tags": ANY,
+                "renditions": None,
+                "variants": None,
+                "content_hash": hashlib.sha256(file_content).hexdigest(),
+                "stored_file_name": None,
+                "status": "ready",
             }
         )
 
-        self.file_system.upload_file.assert_called_with(
-            file_name="test.png",
-            file_content=file_content,
+        self.file_system.upload_files.assert_called_with(
+            files={"test.png": file_content},
             client_id="test_client_id",
             uuid=sentinel.uuid,
         )
 
+    @patch("app.usecases.uuid4")
+    async def test_upload_with_renditions(self, mock_uuid4) -> None:
+        # given
+        bytes_io = BytesIO()
+        Image.new("RGB", size=(1000, 500), color=(255, 0, 0)).save(bytes_io, "JPEG")
+        mock_uuid4.return_value = sentinel.uuid
+        file = Mock()
+        file.file = bytes_io
+        file.filename = "test.jpeg"
+        file.content_type = "image/jpeg"
+        use_case = ImageUploadUseCase(
+            self.repository,
+            self.file_system,
+            ImageTransformer("inline"),
+            rendition_sizes=[128, 384],
+            keep_original=True,
+        )
+
+        # when
+        await use_case.execute(file, {"client_id": "test_client_id"}, False, None)
+
+        # then
+        renditions = {
+            "128": "test_128.jpeg",
+            "384": "test_384.jpeg",
+            "original": "test_original.jpeg",
+        }
+        self.assertEqual(
+            self.repository.put_image.call_args.args[0]["renditions"], renditions
+        )
+        files = self.file_system.upload_files.call_args.kwargs["files"]
+        original = files.pop("test_original.jpeg")
+        self.assertEqual(
+            {
+                file_name: Image.open(BytesIO(content)).size
+                for file_name, content in files.items()
+            },
+            {
+                "test.jpeg": (768, 384),
+                "test_128.jpeg": (128, 64),
+                "test_384.jpeg": (384, 192),
+            },
+        )
+        self.assertIs(original, bytes_io)
+        self.assertEqual(bytes_io.tell(), 0)
+
+    @patch("app.usecases.uuid4")
+    async def test_failed_document_write_deletes_files(self, mock_uuid4) -> None:
+        # given
+        bytes_io = BytesIO()
+        Image.new("RGB", size=(50, 50)).save(bytes_io, "PNG")
+        mock_uuid4.return_value = sentinel.uuid
+        file = Mock()
+        file.file = bytes_io
+        file.filename = "test.png"
+        file.content_type = "image/png"
+        self.repository.put_image.side_effect = PyMongoError("write failed")
+
+        # when
+        with self.assertRaises(PyMongoError):
+            await self.use_case.execute(
+                file, {"client_id": "test_client_id"}, False, None
+            )
+
+        # then
+        self.file_system.delete_files.assert_called_once_with(
+            file_names=["test.png"], file_path="test_client_id/sentinel.uuid"
+        )
+
+    async def test_upload_rejects_too_many_pixels(self) -> None:
+        # given
+        bytes_io = BytesIO()
+        Image.new("RGB", size=(1000, 500)).save(bytes_io, "JPEG")
+        file = Mock()
+        file.file = bytes_io
+        use_case = ImageUploadUseCase(
+            self.repository,
+            self.file_system,
+            ImageTransformer("inline"),
+            max_pixels=100_000,
+        )
+
+        # when
+        with self.assertRaises(ImageTooLargeError):
+            await use_case.execute(file, {"client_id": "test_client_id"}, False, None)
+
+        # then
+        self.repository.put_image.assert_not_called()
+        self.file_system.upload_files.assert_not_called()
+
+
+class TestImageBatchUploadUseCase(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.repository = Mock(AsyncImageRepository)
+        self.file_system = Mock(AzureFileSystem)
+        self.use_case = ImageBatchUploadUseCase(
+            self.repository, self.file_system, ImageTransformer("inline")
+        )
+
+    @staticmethod
+    def _file(file_name: str, content: bytes | None = None) -> Mock:
+        if content is None:
+            bytes_io = BytesIO()
+            Image.new("RGB", size=(50, 50)).save(bytes_io, "PNG")
+            content = bytes_io.getvalue()
+        file = Mock()
+        file.file = BytesIO(content)
+        file.filename = file_name
+        file.content_type = "image/png"
+        return file
+
+    async def test_upload_batch(self) -> None:
+        # when
+        result = await self.use_case.execute(
+            [self._file("first.png"), self._file("second.png")],
+            {"client_id": "test_client_id"},
+            False,
+            None,
+        )
+
+        # then
+        self.assertEqual(len(result), 2)
+        self.assertEqual(self.file_system.upload_files.call_count, 2)
+        documents = self.repository.put_images.call_args.args[0]
+        self.assertEqual(
+            [document["uuid"] for document in documents],
+            [str(uuid) for uuid in result],
+        )
+        self.assertEqual(
+            [document["file_name"] for document in documents],
+            ["first.png", "second.png"],
+        )
+
+    async def test_upload_batch_with_partial_failures(self) -> None:
+        # given
+        def upload_files(files: dict, client_id: str, uuid: UUID) -> None:
+            if "third.png" in files:
+                raise OSError("share unavailable")
+
+        self.file_system.upload_files.side_effect = upload_files
+
+        # when
+        result = await self.use_case.execute(
+            [
+                self._file("first.png"),
+                self._file("second.png", b"not an image"),
+                self._file("third.png"),
+            ],
+            {"client_id": "test_client_id"},
+            False,
+            None,
+        )
+
+        # then
+        self.assertIsInstance(result[0], UUID)
+        self.assertIsInstance(result[1], UnidentifiedImageError)
+        self.assertIsInstance(result[2], OSError)
+        documents = self.repository.put_images.call_args.args[0]
+        self.assertEqual([document["uuid"] for document in documents], [str(result[0])])
+
+    async def test_upload_batch_with_failed_document_write(self) -> None:
+        # given
+        self.repository.put_images.side_effect = BulkWriteError(
+            {
+                "writeErrors": [
+                    {"index": 1, "code": 11000, "errmsg": "duplicate key error"}
+                ]
+            }
+        )
+
+        # when
+        result = await self.use_case.execute(
+            [self._file("first.png"), self._file("second.png")],
+            {"client_id": "test_client_id"},
+            False,
+            None,
+        )
+
+        # then
+        self.assertIsInstance(result[0], UUID)
+        self.assertIsInstance(result[1], WriteError)
+        self.assertEqual(result[1].code, 11000)
+        self.file_system.delete_files.assert_called_once_with(
+            file_names=["second.png"],
+            file_path=self.repository.put_images.call_args.args[0][1]["file_path"],
+        )
+
+    async def test_upload_batch_without_valid_images(self) -> None:
+        # when
+        result = await self.use_case.execute(
+            [self._file("first.png", b"not an image")],
+            {"client_id": "test_client_id"},
+            False,
+            None,
+        )
+
+        # then
+        self.assertIsInstance(result[0], UnidentifiedImageError)
+        self.repository.put_images.assert_not_called()
+
+
+class TestImageBackgroundUploadUseCase(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.repository = Mock(AsyncImageRepository)
+        self.file_system = Mock(AzureFileSystem)
+        self.queue = Mock(BackgroundQueue)
+        self.use_case = ImageBackgroundUploadUseCase(
+            self.repository,
+            self.file_system,
+            ImageTransformer("inline"),
+            self.queue,
+            rendition_sizes=[128],
+        )
+        bytes_io = BytesIO()
+        Image.new("RGB", size=(50, 50)).save(bytes_io, "PNG")
+        self.content = bytes_io.getvalue()
+        self.pending = {
+            "client_id": "client_id",
+            "file_name": "test.png",
+            "file_path": "_pending/uuid",
+            "content_type": "image/png",
+            "tags": {"origin_uuid": None, "processed": False, "timestamp": "now"},
+            "status": "pending",
+        }
+
+    @patch("app.usecases.uuid4")
+    async def test_upload_is_accepted(self, mock_uuid4) -> None:
+        # given
+        mock_uuid4.return_value = "uuid"
+        file = Mock()
+        file.file = BytesIO(self.content)
+        file.filename = "test.png"
+        file.content_type = "image/png"
+
+        # when
+        result = await self.use_case.execute(
+            file, {"client_id": "client_id"}, False, None
+        )
+
+        # then
+        self.assertEqual(result, {"uuid": "uuid", "status": "pending"})
+        self.queue.reserve.assert_called_once_with()
+        self.file_system.upload_files.assert_called_once_with(
+            files={"test.png": file.file}, client_id="_pending", uuid="uuid"
+        )
+        document = self.repository.put_image.call_args.args[0]
+        self.assertEqual(document["status"], "pending")
+        self.assertEqual(document["file_path"], "_pending/uuid")
+        self.queue.submit.assert_called_once()
+        self.queue.release.assert_not_called()
+
+    async def test_upload_when_queue_is_full(self) -> None:
+        # given
+        self.queue.reserve.side_effect = BackgroundQueueFullError()
+
+        # when
+        with self.assertRaises(BackgroundQueueFullError):
+            await self.use_case.execute(Mock(), {"client_id": "client_id"}, False, None)
+
+        # then
+        self.file_system.upload_files.assert_not_called()
+        self.repository.put_image.assert_not_called()
+
+    async def test_failed_accept_releases_slot(self) -> None:
+        # given
+        self.repository.put_image.side_effect = OSError("mongo unavailable")
+        file = Mock()
+        file.file = BytesIO(self.content)
+        file.filename = "test.png"
+        file.content_type = "image/png"
+
+        # when
+        with self.assertRaises(OSError):
+            await self.use_case.execute(file, {"client_id": "client_id"}, False, None)
+
+        # then
+        self.queue.release.assert_called_once_with()
+        self.queue.submit.assert_not_called()
+
+    async def test_stale_pending_uploads_are_requeued(self) -> None:
+        # given
+        queued = UUID("00000000-0000-0000-0000-000000000001")
+        stale = UUID("00000000-0000-0000-0000-000000000002")
+        recent = UUID("00000000-0000-0000-0000-000000000003")
+        self.use_case.queued.add(queued)
+        self.repository.query_images.return_value = [
+            {"uuid": str(queued), "tags": {"timestamp": "2022-08-01T00:00:00"}},
+            {"uuid": str(stale), "tags": {"timestamp": "2022-08-01T00:00:00"}},
+            {"uuid": str(recent), "tags": {"timestamp": "9999-01-01T00:00:00"}},
+        ]
+
+        # when
+        result = await self.use_case.requeue(600)
+
+        # then
+        self.repository.query_images.assert_called_once_with(
+            "status", "pending", {"_id": 0, "uuid": 1, "tags": 1}
+        )
+        self.assertEqual(result, 1)
+        self.queue.reserve.assert_called_once_with()
+        self.queue.submit.assert_called_once()
+        self.assertEqual(self.use_case.queued, {queued, stale})
+
+    async def test_requeue_stops_when_queue_is_full(self) -> None:
+        # given
+        self.queue.reserve.side_effect = BackgroundQueueFullError()
+        self.repository.query_images.return_value = [
+            {"uuid": str(uuid4()), "tags": {"timestamp": "2022-08-01T00:00:00"}}
+            for _ in range(2)
+        ]
+
+        # when
+        result = await self.use_case.requeue(600)
+
+        # then
+        self.assertEqual(result, 0)
+        self.queue.reserve.assert_called_once_with()
+        self.queue.submit.assert_not_called()
+
+    async def test_requeued_upload_leaves_queued_when_done(self) -> None:
+        # given
+        uuid = UUID("00000000-0000-0000-0000-000000000001")
+        self.repository.query_images.return_value = [
+            {"uuid": str(uuid), "tags": {"timestamp": "2022-08-01T00:00:00"}}
+        ]
+        self.repository.query_image.return_value = None
+        await self.use_case.requeue(600)
+        process, _ = self.queue.submit.call_args.args
+
+        # when
+        await process()
+
+        # then
+        self.repository.query_image.assert_called_once()
+        self.assertEqual(self.use_case.queued, set())
+
+    async def test_pending_upload_is_processed(self) -> None:
+        # given
+        self.repository.query_image.return_value = self.pending
+        self.file_system.download_file.return_value = self.content, "png"
+
+        # when
+        await self.use_case._process("uuid")
+
+        # then
+        self.file_system.download_file.assert_called_once_with(
+            "test.png", "_pending/uuid"
+        )
+        self.file_system.upload_files.assert_called_once_with(
+            files={"test.png": ANY, "test_128.png": ANY},
+            client_id="client_id",
+            uuid="uuid",
+        )
+        (uuid, document), (_, ready) = [
+            call.args for call in self.repository.update_image.call_args_list
+        ]
+        self.assertEqual(uuid, "uuid")
+        self.assertEqual(document["status"], "pending")
+        self.assertEqual(ready, {"status": "ready"})
+        self.assertEqual(document["file_path"], "client_id/uuid")
+        self.assertEqual(document["renditions"], {"128": "test_128.png"})
+        self.assertEqual(document["tags"], self.pending["tags"])
+        self.assertEqual(
+            document["content_hash"], hashlib.sha256(self.content).hexdigest()
+        )
+        self.file_system.delete_files.assert_called_once_with(
+            file_names=["test.png"], file_path="_pending/uuid"
+        )
+
+    async def test_retry_of_stored_upload_only_finishes_it(self) -> None:
+        # given
+        self.repository.query_image.return_value = self.pending | {
+            "file_path": "_blobs/hash.uuid",
+            "content_hash": "hash",
+        }
+
+        # when
+        await self.use_case._process("uuid")
+
+        # then
+        self.file_system.download_file.assert_not_called()
+        self.file_system.upload_files.assert_not_called()
+        self.repository.acquire_blob.assert_not_called()
+        self.repository.update_image.assert_called_once_with(
+            "uuid", {"status": "ready"}
+        )
+        self.file_system.delete_files.assert_called_once_with(
+            file_names=["test.png"], file_path="_pending/uuid"
+        )
+
+    async def test_upload_deleted_while_processed_releases_blob(self) -> None:
+        # given
+        self.use_case.deduplicate = True
+        content_hash = hashlib.sha256(self.content).hexdigest()
+        self.repository.query_image.return_value = self.pending
+        self.file_system.download_file.return_value = self.content, "png"
+        self.repository.acquire_blob.return_value = {
+            "file_path": f"_blobs/{content_hash}.first",
+            "stored_file_name": "image.png",
+            "renditions": {"128": "image_128.png"},
+        }
+        self.repository.update_image.return_value = False
+        self.repository.release_blob.return_value = {"refcount": 1}
+
+        # when
+        await self.use_case._process("uuid")
+
+        # then
+        self.repository.acquire_blob.assert_called_once_with(content_hash)
+        self.repository.release_blob.assert_called_once_with(content_hash)
+        self.repository.update_image.assert_called_once()
+
+    async def test_upload_deleted_while_processed_deletes_its_files(self) -> None:
+        # given
+        self.repository.query_image.return_value = self.pending
+        self.file_system.download_file.return_value = self.content, "png"
+        self.repository.update_image.return_value = False
+
+        # when
+        await self.use_case._process("uuid")
+
+        # then
+        self.file_system.delete_files.assert_called_once_with(
+            file_names=["test.png", "test_128.png"], file_path="client_id/uuid"
+        )
+        self.repository.update_image.assert_called_once()
+
+    async def test_failed_cleanup_does_not_fail_processed_upload(self) -> None:
+        # given
+        self.repository.query_image.return_value = self.pending
+        self.file_system.download_file.return_value = self.content, "png"
+        self.file_system.delete_files.side_effect = OSError("share unavailable")
+
+        # when
+        await self.use_case._process("uuid")
+
+        # then
+        self.repository.update_image.assert_called_with("uuid", {"status": "ready"})
+
+    async def test_invalid_upload_fails_without_retry(self) -> None:
+        # given
+        self.repository.query_image.return_value = self.pending
+        self.file_system.download_file.return_value = b"not an image", "png"
+
+        # when
+        await self.use_case._process("uuid")
+
+        # then
+        self.repository.update_image.assert_called_once_with(
+            "uuid", {"status": "failed"}
+        )
+        self.file_system.upload_files.assert_not_called()
+        self.file_system.delete_files.assert_not_called()
+
+    async def test_deleted_upload_is_skipped(self) -> None:
+        # given
+        self.repository.query_image.return_value = None
 
-class TestImageDeleteUseCase(TestCase):
+        # when
+        await self.use_case._process("uuid")
+
+        # then
+        self.file_system.download_file.assert_not_called()
+        self.repository.update_image.assert_not_called()
+
+
+class TestImageStatusUseCase(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.repository = Mock(AsyncImageRepository)
+        self.use_case = ImageStatusUseCase(self.repository, Mock(AzureFileSystem))
+
+    async def test_status(self) -> None:
+        self.repository.query_image.return_value = {"status": "pending"}
+
+        result = await self.use_case.execute(sentinel.uuid)
+
+        self.repository.query_image.assert_called_once_with(
+            field_key="uuid",
+            field_value="sentinel.uuid",
+            projection=ImageStatusUseCase.projection,
+        )
+        self.assertEqual(result, "pending")
+
+    async def test_images_without_status_are_ready(self) -> None:
+        self.repository.query_image.return_value = {}
+
+        self.assertIsNone(await self.use_case.execute(sentinel.uuid))
+
+        self.repository.query_image.return_value = {"file_name": "test.png"}
+
+        self.assertEqual(await self.use_case.execute(sentinel.uuid), "ready")
+
+
+class TestImageDeduplication(IsolatedAsyncioTestCase):
     def setUp(self) -> None:
-        self.repository = Mock(ImageRepository)
+        self.repository = Mock(AsyncImageRepository)
+        self.file_system = Mock(AzureFileSystem)
+        self.use_case = ImageUploadUseCase(
+            self.repository,
+            self.file_system,
+            ImageTransformer("inline"),
+            rendition_sizes=[128],
+            deduplicate=True,
+        )
+        bytes_io = BytesIO()
+        Image.new("RGB", size=(50, 50)).save(bytes_io, "PNG")
+        self.content = bytes_io.getvalue()
+        self.content_hash = hashlib.sha256(self.content).hexdigest()
+        self.blob = {
+            "_id": self.content_hash,
+            "file_path": f"_blobs/{self.content_hash}.first",
+            "stored_file_name": "image.png",
+            "renditions": {"128": "image_128.png"},
+            "variants": ["image.webp"],
+            "refcount": 2,
+        }
+        self.repository.delete_image.return_value = True
+
+    def _file(self) -> Mock:
+        file = Mock()
+        file.file = BytesIO(self.content)
+        file.filename = "Holiday.PNG"
+        file.content_type = "image/png"
+        return file
+
+    @patch("app.usecases.uuid4")
+    async def test_new_content_is_stored_as_blob(self, mock_uuid4) -> None:
+        # given
+        mock_uuid4.return_value = "second"
+        self.repository.acquire_blob.return_value = None
+        self.repository.register_blob.side_effect = lambda content_hash, blob: blob
+
+        # when
+        await self.use_case.execute(
+            self._file(), {"client_id": "client_id"}, False, None
+        )
+
+        # then
+        file_path = f"_blobs/{self.content_hash}.second"
+        self.file_system.upload_files.assert_called_once_with(
+            files={"image.png": ANY, "image_128.png": ANY},
+            client_id="_blobs",
+            uuid=f"{self.content_hash}.second",
+        )
+        self.repository.register_blob.assert_called_once_with(
+            self.content_hash,
+            {
+                "file_path": file_path,
+                "stored_file_name": "image.png",
+                "renditions": {"128": "image_128.png"},
+                "variants": [],
+            },
+        )
+        document = self.repository.put_image.call_args.args[0]
+        self.assertEqual(document["uuid"], "second")
+        self.assertEqual(document["file_name"], "Holiday.PNG")
+        self.assertEqual(document["file_path"], file_path)
+        self.assertEqual(document["stored_file_name"], "image.png")
+
+    async def test_stored_content_is_referenced(self) -> None:
+        # given
+        self.repository.acquire_blob.return_value = self.blob
+        transformer = Mock(ImageTransformer)
+        self.use_case.transformer = transformer
+
+        # when
+        result = await self.use_case.execute(
+            self._file(), {"client_id": "client_id"}, False, None
+        )
+
+        # then
+        transformer.transform.assert_not_called()
+        self.file_system.upload_files.assert_not_called()
+        self.repository.register_blob.assert_not_called()
+        document = self.repository.put_image.call_args.args[0]
+        self.assertEqual(document["uuid"], result["uuid"])
+        self.assertEqual(document["client_id"], "client_id")
+        self.assertEqual(document["file_path"], self.blob["file_path"])
+        self.assertEqual(document["renditions"], {"128": "image_128.png"})
+        self.assertEqual(document["variants"], ["image.webp"])
+
+    async def test_concurrent_upload_of_same_content_keeps_one_blob(self) -> None:
+        # given
+        self.repository.acquire_blob.return_value = None
+        self.repository.register_blob.return_value = self.blob
+
+        # when
+        await self.use_case.execute(
+            self._file(), {"client_id": "client_id"}, False, None
+        )
+
+        # then
+        uploaded_to = self.file_system.upload_files.call_args.kwargs["uuid"]
+        self.file_system.delete_files.assert_called_once_with(
+            file_names=["image.png", "image_128.png"],
+            file_path=f"_blobs/{uploaded_to}",
+        )
+        document = self.repository.put_image.call_args.args[0]
+        self.assertEqual(document["file_path"], self.blob["file_path"])
+
+    async def test_failed_document_write_releases_blob(self) -> None:
+        # given
+        self.repository.acquire_blob.return_value = self.blob
+        self.repository.release_blob.return_value = self.blob | {"refcount": 1}
+        self.repository.put_image.side_effect = PyMongoError("write failed")
+
+        # when
+        with self.assertRaises(PyMongoError):
+            await self.use_case.execute(
+                self._file(), {"client_id": "client_id"}, False, None
+            )
+
+        # then
+        self.repository.release_blob.assert_called_once_with(self.content_hash)
+        self.file_system.delete_files.assert_not_called()
+
+    async def test_delete_keeps_referenced_blob(self) -> None:
+        # given
+        use_case = ImageDeleteUseCase(self.repository, self.file_system)
+        self.repository.query_image.return_value = {
+            "file_name": "Holiday.PNG",
+            "file_path": self.blob["file_path"],
+            "stored_file_name": "image.png",
+            "content_hash": self.content_hash,
+        }
+        self.repository.release_blob.return_value = self.blob | {"refcount": 1}
+
+        # when
+        result = await use_case.execute(sentinel.uuid)
+
+        # then
+        self.assertTrue(result)
+        self.repository.delete_image.assert_called_once_with(sentinel.uuid)
+        self.repository.release_blob.assert_called_once_with(self.content_hash)
+        self.repository.delete_blob.assert_not_called()
+        self.file_system.delete_files.assert_not_called()
+
+    async def test_delete_of_last_reference_deletes_blob(self) -> None:
+        # given
+        use_case = ImageDeleteUseCase(self.repository, self.file_system)
+        self.repository.query_image.return_value = {
+            "file_name": "Holiday.PNG",
+            "file_path": self.blob["file_path"],
+            "stored_file_name": "image.png",
+            "content_hash": self.content_hash,
+        }
+        self.repository.release_blob.return_value = self.blob | {"refcount": 0}
+        self.repository.delete_blob.return_value = True
+
+        # when
+        await use_case.execute(sentinel.uuid)
+
+        # then
+        self.repository.delete_blob.assert_called_once_with(self.content_hash)
+        self.file_system.delete_files.assert_called_once_with(
+            file_names=["image.png", "image_128.png", "image.webp"],
+            file_path=self.blob["file_path"],
+        )
+
+    async def test_reacquired_blob_is_not_deleted(self) -> None:
+        # given
+        use_case = ImageDeleteUseCase(self.repository, self.file_system)
+        self.repository.query_image.return_value = {
+            "file_name": "Holiday.PNG",
+            "file_path": self.blob["file_path"],
+            "stored_file_name": "image.png",
+            "content_hash": self.content_hash,
+        }
+        self.repository.release_blob.return_value = self.blob | {"refcount": 0}
+        self.repository.delete_blob.return_value = False
+
+        # when
+        await use_case.execute(sentinel.uuid)
+
+        # then
+        self.file_system.delete_files.assert_not_called()
+
+    async def test_bulk_delete_releases_blobs(self) -> None:
+        # given
+        use_case = ImageBulkDeleteUseCase(self.repository, self.file_system)
+        self.repository.query_images.return_value = [
+            {
+                "uuid": "first",
+                "file_name": "first.png",
+                "file_path": "client_id/first",
+            },
+            {
+                "uuid": "second",
+                "file_name": "Holiday.PNG",
+                "file_path": self.blob["file_path"],
+                "stored_file_name": "image.png",
+                "content_hash": self.content_hash,
+            },
+        ]
+        self.repository.pop_images.return_value = [
+            {"uuid": "second", "content_hash": self.content_hash}
+        ]
+        self.repository.release_blob.return_value = self.blob | {"refcount": 1}
+
+        # when
+        result = await use_case.execute(client_id="client_id")
+
+        # then
+        self.file_system.delete_files.assert_called_once_with(
+            file_names=["first.png"], file_path="client_id/first"
+        )
+        self.repository.delete_images.assert_called_once_with(["first"])
+        self.repository.pop_images.assert_called_once_with(
+            ["second"], {"_id": 0, "uuid": 1, "content_hash": 1}
+        )
+        self.repository.delete_image.assert_not_called()
+        self.repository.release_blob.assert_called_once_with(self.content_hash)
+        self.assertEqual(result, {"first": True, "second": True})
+
+    async def test_concurrent_delete_releases_blob_once(self) -> None:
+        # given
+        use_case = ImageDeleteUseCase(self.repository, self.file_system)
+        self.repository.query_image.return_value = {
+            "file_name": "Holiday.PNG",
+            "file_path": self.blob["file_path"],
+            "stored_file_name": "image.png",
+            "content_hash": self.content_hash,
+        }
+        self.repository.delete_image.return_value = False
+
+        # when
+        result = await use_case.execute(sentinel.uuid)
+
+        # then
+        self.assertFalse(result)
+        self.repository.release_blob.assert_not_called()
+
+    async def test_bulk_delete_skips_blob_of_already_deleted_image(self) -> None:
+        # given
+        use_case = ImageBulkDeleteUseCase(self.repository, self.file_system)
+        self.repository.query_images.return_value = [
+            {
+                "uuid": "second",
+                "file_name": "Holiday.PNG",
+                "file_path": self.blob["file_path"],
+                "stored_file_name": "image.png",
+                "content_hash": self.content_hash,
+            },
+        ]
+        self.repository.pop_images.return_value = []
+
+        # when
+        result = await use_case.execute(uuids=["second"])
+
+        # then
+        self.repository.delete_images.assert_not_called()
+        self.repository.release_blob.assert_not_called()
+        self.assertEqual(result, {"second": False})
+
+    async def test_export_uses_uploaded_names(self) -> None:
+        # given
+        use_case = ImageExportUseCase(self.repository, self.file_system)
+        self.repository.query_images.return_value = [
+            {
+                "uuid": "uuid",
+                "file_name": "Holiday.PNG",
+                "file_path": self.blob["file_path"],
+                "stored_file_name": "image.png",
+                "renditions": {"128": "image_128.png"},
+            }
+        ]
+        self.file_system.download_file.side_effect = lambda name, path: (
+            name.encode(),
+            "png",
+        )
+
+        # when
+        archive = await use_case.execute(client_id="client_id")
+
+        # then
+        files = zipfile.ZipFile(BytesIO(b"".join(archive)))
+        self.assertEqual(files.read("uuid/Holiday.PNG"), b"image.png")
+        self.assertEqual(files.read("uuid/Holiday_128.PNG"), b"image_128.png")
+
+    async def test_download_variant_is_added_to_blob(self) -> None:
+        # given
+        transformer = Mock(ImageTransformer)
+        transformer.encode.return_value = sentinel.encoded
+        use_case = ImageDownloadUseCase(
+            self.repository, self.file_system, transformer, ["webp"]
+        )
+        self.repository.query_image.return_value = {
+            "uuid": "uuid",
+            "client_id": "client_id",
+            "file_name": "Holiday.PNG",
+            "file_path": self.blob["file_path"],
+            "stored_file_name": "image.png",
+            "renditions": {"128": "image_128.png"},
+            "content_hash": self.content_hash,
+        }
+        self.repository.query_blob.return_value = self.blob | {"variants": []}
+        self.file_system.download_file.return_value = sentinel.content, "png"
+        self.file_system.open_file.return_value = StoredFile(
+            "image.webp", "image/webp", 1, '"etag"', None, Mock()
+        )
+
+        # when
+        await use_case.execute("uuid", None, ["webp"])
+
+        # then
+        self.file_system.download_file.assert_called_once_with(
+            "image.png", self.blob["file_path"]
+        )
+        self.file_system.upload_files.assert_called_once_with(
+            files={"image.webp": sentinel.encoded},
+            client_id="_blobs",
+            uuid=f"{self.content_hash}.first",
+        )
+        self.repository.add_blob_variant.assert_called_once_with(
+            self.content_hash, "image.webp"
+        )
+        self.file_system.open_file.assert_called_once_with(
+            file_name="image.webp", file_path=self.blob["file_path"]
+        )
+
+    async def test_download_variant_of_blob_is_reused(self) -> None:
+        # given
+        transformer = Mock(ImageTransformer)
+        use_case = ImageDownloadUseCase(
+            self.repository, self.file_system, transformer, ["webp"]
+        )
+        self.repository.query_image.return_value = {
+            "uuid": "uuid",
+            "client_id": "client_id",
+            "file_name": "Holiday.PNG",
+            "file_path": self.blob["file_path"],
+            "stored_file_name": "image.png",
+            "renditions": {"128": "image_128.png"},
+            "content_hash": self.content_hash,
+        }
+        self.repository.query_blob.return_value = self.blob
+        self.file_system.open_file.return_value = StoredFile(
+            "image.webp", "image/webp", 1, '"etag"', None, Mock()
+        )
+
+        # when
+        await use_case.execute("uuid", None, ["webp"])
+
+        # then
+        self.repository.query_blob.assert_called_once_with(self.content_hash)
+        transformer.encode.assert_not_called()
+        self.file_system.upload_files.assert_not_called()
+        self.repository.add_variant.assert_called_once_with("uuid", "image.webp")
+        self.file_system.open_file.assert_called_once_with(
+            file_name="image.webp", file_path=self.blob["file_path"]
+        )
+
+
+class TestImageDeleteUseCase(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.repository = Mock(AsyncImageRepository)
         self.file_system = Mock(AzureFileSystem)
         self.use_case = ImageDeleteUseCase(self.repository, self.file_system)
 
-    def test_delete_image_uuid_success(self) -> None:
+    async def test_delete_image_uuid_success(self) -> None:
         self.repository.query_image.return_value = {
             "file_path": "test_client_id/sentinel.uuid",
             "file_name": "test.png",
+            "renditions": {"128": "test_128.png"},
+            "variants": ["test.webp"],
         }
+        self.repository.delete_image.return_value = True
 
-        result = self.use_case.execute(sentinel.uuid)
+        result = await self.use_case.execute(sentinel.uuid)
 
         self.repository.query_image.assert_called_with(
-            field_key="uuid", field_value="sentinel.uuid"
+            field_key="uuid",
+            field_value="sentinel.uuid",
+            projection=ImageDeleteUseCase.projection,
         )
-        self.file_system.delete_file.assert_called_with(
-            file_name="test.png", file_path="test_client_id/sentinel.uuid"
+        self.file_system.delete_files.assert_called_with(
+            file_names=["test.png", "test_128.png", "test.webp"],
+            file_path="test_client_id/sentinel.uuid",
         )
         self.repository.delete_image.assert_called_with(sentinel.uuid)
         self.assertEqual(True, result)
 
-    def test_delete_image_uuid_no_success(self) -> None:
+    async def test_delete_image_uuid_no_success(self) -> None:
         self.repository.query_image.return_value = False
 
-        result = self.use_case.execute(sentinel.uuid)
+        result = await self.use_case.execute(sentinel.uuid)
 
         self.repository.query_image.assert_called_with(
-            field_key="uuid", field_value="sentinel.uuid"
+            field_key="uuid",
+            field_value="sentinel.uuid",
+            projection=ImageDeleteUseCase.projection,
         )
-        self.file_system.delete_file.assert_not_called()
+        self.file_system.delete_files.assert_not_called()
         self.repository.delete_image.assert_not_called()
         self.assertEqual(False, result)
 
 
-class ImageMetaDataUseCase(TestCase):
+class TestImageBulkDeleteUseCase(IsolatedAsyncioTestCase):
     def setUp(self) -> None:
-        self.repository = Mock(ImageRepository)
+        self.repository = Mock(AsyncImageRepository)
+        self.file_system = Mock(AzureFileSystem)
+        self.use_case = ImageBulkDeleteUseCase(
+            self.repository, self.file_system, max_concurrency=2
+        )
+        self.repository.query_images.return_value = [
+            {
+                "uuid": "first",
+                "file_path": "client_id/first",
+                "file_name": "first.png",
+                "renditions": {"128": "first_128.png"},
+            },
+            {
+                "uuid": "second",
+                "file_path": "client_id/second",
+                "file_name": "second.png",
+                "variants": ["second.webp"],
+            },
+        ]
+
+    async def test_delete_by_uuids(self) -> None:
+        # when
+        result = await self.use_case.execute(uuids=["first", "second", "missing"])
+
+        # then
+        self.repository.query_images.assert_called_once_with(
+            "uuid", ["first", "second", "missing"], ImageBulkDeleteUseCase.projection
+        )
+        self.file_system.delete_files.assert_has_calls(
+            [
+                call(
+                    file_names=["first.png", "first_128.png"],
+                    file_path="client_id/first",
+                ),
+                call(
+                    file_names=["second.png", "second.webp"],
+                    file_path="client_id/second",
+                ),
+            ],
+            any_order=True,
+        )
+        self.repository.delete_images.assert_called_once_with(["first", "second"])
+        self.assertEqual(result, {"first": True, "second": True, "missing": False})
+
+    async def test_delete_by_client_id(self) -> None:
+        # when
+        result = await self.use_case.execute(client_id="client_id")
+
+        # then
+        self.repository.query_images.assert_called_once_with(
+            "client_id", "client_id", ImageBulkDeleteUseCase.projection
+        )
+        self.assertEqual(result, {"first": True, "second": True})
+
+    async def test_failed_file_delete_keeps_document(self) -> None:
+        # given
+        error = OSError("share unavailable")
+
+        def delete_files(file_names: list[str], file_path: str) -> None:
+            if file_path == "client_id/second":
+                raise error
+
+        self.file_system.delete_files.side_effect = delete_files
+
+        # when
+        result = await self.use_case.execute(uuids=["first", "second"])
+
+        # then
+        self.repository.delete_images.assert_called_once_with(["first"])
+        self.assertEqual(result, {"first": True, "second": error})
+
+    async def test_concurrency_is_bounded(self) -> None:
+        # given
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def delete_files(file_names: list[str], file_path: str) -> None:
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.01)
+            with lock:
+                running -= 1
+
+        self.file_system.delete_files.side_effect = delete_files
+        self.repository.query_images.return_value = [
+            {"uuid": str(index), "file_path": f"c/{index}", "file_name": "a.png"}
+            for index in range(8)
+        ]
+
+        # when
+        await self.use_case.execute(client_id="c")
+
+        # then
+        self.assertEqual(self.file_system.delete_files.call_count, 8)
+        self.assertLessEqual(peak, 2)
+
+    async def test_blob_release_concurrency_is_bounded(self) -> None:
+        # given
+        running = 0
+        peak = 0
+
+        async def release_blob(content_hash: str) -> dict:
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return {"refcount": 1}
+
+        self.repository.release_blob.side_effect = release_blob
+        documents = [
+            {
+                "uuid": str(index),
+                "file_path": f"_blobs/{index}",
+                "file_name": "a.png",
+                "stored_file_name": "image.png",
+                "content_hash": str(index),
+            }
+            for index in range(8)
+        ]
+        self.repository.query_images.return_value = documents
+        self.repository.pop_images.return_value = documents
+
+        # when
+        result = await self.use_case.execute(client_id="c")
+
+        # then
+        self.repository.pop_images.assert_called_once()
+        self.assertEqual(self.repository.release_blob.call_count, 8)
+        self.assertLessEqual(peak, 2)
+        self.assertEqual(result, {str(index): True for index in range(8)})
+
+
+class TestImageExportUseCase(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.repository = Mock(AsyncImageRepository)
+        self.file_system = Mock(AzureFileSystem)
+        self.use_case = ImageExportUseCase(self.repository, self.file_system)
+
+    async def test_export_client(self) -> None:
+        # given
+        self.repository.query_images.return_value = [
+            {
+                "uuid": "uuid",
+                "file_name": "test.png",
+                "file_path": "client_id/uuid",
+                "renditions": {"128": "test_128.png"},
+            }
+        ]
+        self.file_system.download_file.side_effect = lambda name, path: (
+            f"{path}/{name}".encode(),
+            "png",
+        )
+
+        # when
+        archive = await self.use_case.execute(client_id="client_id")
+
+        # then
+        self.repository.query_images.assert_called_once_with(
+            "client_id", "client_id", ImageExportUseCase.projection
+        )
+        files = zipfile.ZipFile(BytesIO(b"".join(archive)))
+        self.assertEqual(files.read("uuid/test.png"), b"client_id/uuid/test.png")
+        self.assertEqual(
+            files.read("uuid/test_128.png"), b"client_id/uuid/test_128.png"
+        )
+
+    async def test_export_uuids(self) -> None:
+        # given
+        self.repository.query_images.return_value = []
+
+        # when
+        archive = await self.use_case.execute(uuids=[sentinel.uuid])
+
+        # then
+        self.repository.query_images.assert_called_once_with(
+            "uuid", ["sentinel.uuid"], ImageExportUseCase.projection
+        )
+        self.assertIsNone(archive)
+
+
+class ImageMetaDataUseCase(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.repository = Mock(AsyncImageRepository)
         self.file_system = Mock(AzureFileSystem)
         self.use_case = ImageMetadataUseCase(self.repository, self.file_system)
 
-    def test_get_images_for_client_id(self) -> None:
-        self.repository.query_images.return_value = sentinel.result
+    async def test_get_images_for_client_id(self) -> None:
+        self.repository.find_images.return_value = sentinel.result
 
-        result = self.use_case.execute(sentinel.client_id)
+        result = await self.use_case.execute(sentinel.client_id, 10, sentinel.after)
 
-        self.repository.query_images.assert_called_with("client_id", sentinel.client_id)
+        self.repository.find_images.assert_called_with(
+            "client_id",
+            sentinel.client_id,
+            {
+                "file_path": 1,
+                "uuid": 1,
+                "client_id": 1,
+                "file_name": 1,
+                "content_type": 1,
+                "tags": 1,
+                "renditions": 1,
+                "variants": 1,
+                "content_hash": 1,
+                "stored_file_name": 1,
+                "status": 1,
+            },
+            sentinel.after,
+            10,
+        )
         self.assertEqual(sentinel.result, result)
 
 
-class TestImageDownloadUseCase(TestCase):
+class TestImageDownloadUseCase(IsolatedAsyncioTestCase):
     def setUp(self) -> None:
-        self.repository = Mock(ImageRepository)
+        self.repository = Mock(AsyncImageRepository)
         self.file_system = Mock(AzureFileSystem)
         self.use_case = ImageDownloadUseCase(self.repository, self.file_system)
 
-    def test_download_image(self) -> None:
+    async def test_download_image(self) -> None:
         self.repository.query_image.return_value = {
             "file_path": "test_client_id/sentinel.uuid",
             "file_name": "test.png",
         }
-        self.file_system.download_file.return_value = sentinel.file_content
+        self.file_system.open_file.return_value = sentinel.stored_file
 
-        result = self.use_case.execute(sentinel.uuid)
+        result = await self.use_case.execute(sentinel.uuid)
 
         self.repository.query_image.assert_called_with(
-            field_key="uuid", field_value="sentinel.uuid"
+            field_key="uuid",
+            field_value="sentinel.uuid",
+            projection=ImageDownloadUseCase.projection,
         )
-        self.file_system.download_file.assert_called_with(
+        self.file_system.open_file.assert_called_with(
             file_name="test.png", file_path="test_client_id/sentinel.uuid"
         )
-        self.assertEqual(sentinel.file_content, result)
+        self.assertEqual(sentinel.stored_file, result)
+
+    async def test_download_rendition(self) -> None:
+        self.repository.query_image.return_value = {
+            "file_path": "test_client_id/sentinel.uuid",
+            "file_name": "test.png",
+            "renditions": {"128": "test_128.png"},
+        }
+
+        await self.use_case.execute(sentinel.uuid, "128")
+        await self.use_case.execute(sentinel.uuid, "384")
+
+        self.assertEqual(
+            [
+                call.kwargs["file_name"]
+                for call in self.file_system.open_file.mock_calls
+            ],
+            ["test_128.png", "test.png"],
+        )
+
+    async def test_download_pending_image(self) -> None:
+        self.repository.query_image.return_value = {
+            "file_path": "_pending/sentinel.uuid",
+            "file_name": "test.png",
+            "status": "pending",
+        }
+
+        result = await self.use_case.execute(sentinel.uuid)
 
-    def test_download_image_with_invalid_uuid(self) -> None:
+        self.file_system.open_file.assert_not_called()
+        self.assertIsNone(result)
+
+    async def test_download_image_with_invalid_uuid(self) -> None:
         self.repository.query_image.return_value = {}
 
-        result = self.use_case.execute(sentinel.uuid)
+        result = await self.use_case.execute(sentinel.uuid)
 
         self.repository.query_image.assert_called_with(
-            field_key="uuid", field_value="sentinel.uuid"
+            field_key="uuid",
+            field_value="sentinel.uuid",
+            projection=ImageDownloadUseCase.projection,
+        )
+        self.file_system.open_file.assert_not_called()
+        self.assertIsNone(result)
+
+
+class TestImageDownloadVariants(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.repository = Mock(AsyncImageRepository)
+        self.file_system = Mock(AzureFileSystem)
+        self.transformer = Mock(ImageTransformer)
+        self.use_case = ImageDownloadUseCase(
+            self.repository, self.file_system, self.transformer, ["avif", "webp"]
+        )
+        self.repository.query_image.return_value = {
+            "uuid": "uuid",
+            "client_id": "client_id",
+            "file_path": "client_id/uuid",
+            "file_name": "test.png",
+            "renditions": {"128": "test_128.png"},
+        }
+
+    async def test_variant_is_created_on_first_request(self) -> None:
+        # given
+        self.file_system.download_file.return_value = sentinel.content, "png"
+        self.transformer.encode.return_value = sentinel.encoded
+
+        # when
+        await self.use_case.execute("uuid", "128", ["webp", "png"])
+
+        # then
+        self.file_system.download_file.assert_called_once_with(
+            "test_128.png", "client_id/uuid"
+        )
+        self.transformer.encode.assert_called_once_with(sentinel.content, "webp", 80)
+        self.file_system.upload_files.assert_called_once_with(
+            files={"test_128.webp": sentinel.encoded},
+            client_id="client_id",
+            uuid="uuid",
+        )
+        self.repository.add_variant.assert_called_once_with("uuid", "test_128.webp")
+        self.file_system.open_file.assert_called_once_with(
+            file_name="test_128.webp", file_path="client_id/uuid"
+        )
+
+    async def test_existing_variant_is_served(self) -> None:
+        # given
+        self.repository.query_image.return_value["variants"] = ["test.webp"]
+
+        # when
+        await self.use_case.execute("uuid", None, ["webp"])
+
+        # then
+        self.transformer.encode.assert_not_called()
+        self.file_system.open_file.assert_called_once_with(
+            file_name="test.webp", file_path="client_id/uuid"
+        )
+
+    async def test_preferred_stored_format_is_served_as_is(self) -> None:
+        # when
+        await self.use_case.execute("uuid", None, ["png", "webp"])
+
+        # then
+        self.transformer.encode.assert_not_called()
+        self.file_system.open_file.assert_called_once_with(
+            file_name="test.png", file_path="client_id/uuid"
+        )
+
+    async def test_busy_transformer_serves_stored_format(self) -> None:
+        # given
+        self.file_system.download_file.return_value = sentinel.content, "png"
+        self.transformer.encode.side_effect = TransformQueueFullError()
+
+        # when
+        await self.use_case.execute("uuid", None, ["webp"])
+
+        # then
+        self.file_system.open_file.assert_called_once_with(
+            file_name="test.png", file_path="client_id/uuid"
+        )
+
+
+class TestImageDownloadConditional(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.repository = Mock(AsyncImageRepository)
+        self.file_system = Mock(AzureFileSystem)
+        self.transformer = Mock(ImageTransformer)
+        self.use_case = ImageDownloadUseCase(
+            self.repository, self.file_system, self.transformer, ["webp"]
+        )
+        self.repository.query_image.return_value = {
+            "uuid": "uuid",
+            "client_id": "client_id",
+            "file_path": "client_id/uuid",
+            "file_name": "test.png",
+            "content_hash": "hash",
+        }
+        self.file_system.open_file.return_value = StoredFile(
+            file_name="test.png",
+            content_type="image/png",
+            content_length=4,
+            etag='"azure"',
+            last_modified=None,
+            iter_range=Mock(),
+        )
+
+    async def test_matching_etag_is_answered_from_metadata(self) -> None:
+        # when
+        result = await self.use_case.execute(
+            "uuid", None, [], file_etag("hash", "test.png")
+        )
+
+        # then
+        self.assertEqual(result, NotModified(file_etag("hash", "test.png")))
+        self.file_system.open_file.assert_not_called()
+
+    async def test_matching_variant_etag_does_not_create_the_variant(self) -> None:
+        # when
+        result = await self.use_case.execute(
+            "uuid", None, ["webp"], file_etag("hash", "test.webp")
+        )
+
+        # then
+        self.assertIsInstance(result, NotModified)
+        self.transformer.encode.assert_not_called()
+
+    async def test_file_gets_content_etag(self) -> None:
+        # when
+        result = await self.use_case.execute("uuid", None, [], '"stale"')
+
+        # then
+        self.assertEqual(result.etag, file_etag("hash", "test.png"))
+        self.assertTrue(result.immutable)
+
+    async def test_image_without_content_hash_keeps_file_etag(self) -> None:
+        # given
+        del self.repository.query_image.return_value["content_hash"]
+
+        # when
+        result = await self.use_case.execute("uuid", None, [], '"azure"')
+
+        # then
+        self.assertEqual(result.etag, '"azure"')
+        self.assertFalse(result.immutable)
+
+
+class TestFileEtag(TestCase):
+    def test_etag_is_quoted_and_depends_on_the_file(self) -> None:
+        etag = file_etag("hash", "test.png")
+
+        self.assertRegex(etag, r'^"[0-9a-f]{64}"$')
+        self.assertNotEqual(etag, file_etag("hash", "test_128.png"))
+        self.assertNotEqual(etag, file_etag("other", "test.png"))
+
+    def test_hash_file(self) -> None:
+        self.assertEqual(
+            hash_file(BytesIO(b"image"), chunk_size=2),
+            hashlib.sha256(b"image").hexdigest(),
         )
-        self.file_system.download_file.assert_not_called()
-        self.assertEqual((None, None), result)